@@ -0,0 +1,162 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from trackyai.agent import Chat, load_system_prompt_template
+from trackyai.agent.completion_services.openai import _prepare_messages, _prepare_tools
+from trackyai.agent.tools import ToolCall, ToolResult, tool_registry
+from trackyai.agent.tools.crud import _load_template, add_expense
+from trackyai.communication import _ChatTurn
+
+ROWS = [10, 1_000, 100_000]
+
+
+def _rounds(rows: int) -> int:
+    return 3 if rows >= 100_000 else 20
+
+
+def _expenses(rows: int) -> list[SimpleNamespace]:
+    category = SimpleNamespace(id=1, name='Groceries')
+    date = datetime.datetime(2025, 5, 30, 16, 54, 43)
+    return [
+        SimpleNamespace(
+            id=i,
+            category_id=category.id,
+            category=category,
+            date=date,
+            currency='EUR',
+            amount=12.5 + i,
+            comment=f'coffee beans #{i}',
+        )
+        for i in range(rows)
+    ]
+
+
+def _long_chat(steps: int) -> Chat:
+    chat = Chat()
+    for i in range(steps):
+        chat.add_user_message(f'show my expenses for day {i}')
+        tool_call = ToolCall(
+            name='find_expenses',
+            id=f'call_{i}',
+            parameters={
+                'category_id': 1,
+                'date_from': datetime.datetime(2025, 5, 1),
+                'date_to': datetime.datetime(2025, 5, 30),
+                'currency': 'EUR',
+                'amount_from': 0.0,
+                'amount_to': 1000.0,
+                'limit': 10,
+            },
+        )
+        chat.add_tool_call(tool_call)
+        chat.add_tool_result(ToolResult(tool_call=tool_call, result='Expenses:\n' + 'id=1 amount=12.5\n' * 10))
+        chat.add_agent_message(f'Here are your expenses for day {i}')
+    return chat
+
+
+@pytest.mark.parametrize('item', ['add_expense', 'missing_tool', 'tool', 'tool_call', 'coroutine'])
+def test_registry_contains(benchmark, item):
+    items = {
+        'add_expense': 'add_expense',
+        'missing_tool': 'missing_tool',
+        'tool': tool_registry['add_expense'],
+        'tool_call': ToolCall(name='add_expense', id='call_1', parameters={}),
+        'coroutine': add_expense,
+    }
+    benchmark(tool_registry.__contains__, items[item])
+
+
+@pytest.mark.parametrize('item', ['add_expense', 'tool_call', 'coroutine'])
+def test_registry_getitem(benchmark, item):
+    items = {
+        'add_expense': 'add_expense',
+        'tool_call': ToolCall(name='add_expense', id='call_1', parameters={}),
+        'coroutine': add_expense,
+    }
+    benchmark(tool_registry.__getitem__, items[item])
+
+
+def test_prepare_tools(benchmark):
+    tools = list(tool_registry.get('main'))
+    benchmark(_prepare_tools, tools)
+
+
+@pytest.mark.parametrize('steps', [10, 100, 1_000])
+def test_prepare_messages(benchmark, steps):
+    chat = _long_chat(steps)
+    system_prompt = 'You are Tracky AI. ' * 500
+    benchmark(_prepare_messages, system_prompt, chat)
+
+
+def _run_session(steps: int, system_prompt: str) -> None:
+    # a tool-heavy session: the messages are prepared before every completion, i.e. after every tool result
+    chat = Chat()
+    chat.add_user_message('show my expenses for every day of the month')
+    _prepare_messages(system_prompt, chat)
+    for i in range(steps):
+        tool_call = ToolCall(
+            name='find_expenses',
+            id=f'call_{i}',
+            parameters={'category_id': 1, 'date_from': datetime.datetime(2025, 5, 1), 'currency': 'EUR', 'limit': 10},
+        )
+        chat.add_tool_call(tool_call)
+        chat.add_tool_result(ToolResult(tool_call=tool_call, result='Expenses:\n' + 'id=1 amount=12.5\n' * 10))
+        if i % 10 == 9:
+            chat.add_user_message(f'and day {i}')
+            chat.add_user_message('please')
+        _prepare_messages(system_prompt, chat)
+
+
+@pytest.mark.parametrize('steps', [10, 100, 1_000])
+def test_session_messages(benchmark, steps):
+    system_prompt = 'You are Tracky AI. ' * 500
+    benchmark.pedantic(_run_session, args=(steps, system_prompt), rounds=3 if steps >= 1_000 else 20, warmup_rounds=1)
+
+
+@pytest.mark.parametrize(
+    ('tool_name', 'arguments'),
+    [
+        ('ask_user', '{"message": "Which category?"}'),
+        ('add_expense', '{"category_id": 1, "currency": "EUR", "amount": 12.5, "comment": "coffee beans"}'),
+        ('send_expenses_list', '{"expense_ids": [1, 2, 3, 4, 5]}'),
+        (
+            'find_expenses',
+            '{"category_id": null, "date_from": "2025-05-01T00:00:00", "date_to": "2025-05-30T16:54:43", '
+            '"currency": "EUR", "amount_from": null, "amount_to": null, "limit": 10}',
+        ),
+    ],
+)
+def test_parse_tool_arguments(benchmark, tool_name, arguments):
+    benchmark(tool_registry[tool_name].parse_arguments, arguments)
+
+
+@pytest.mark.parametrize('rows', ROWS)
+def test_render_main_prompt(benchmark, rows):
+    template = load_system_prompt_template('main')
+    context = dict(
+        ecs=[SimpleNamespace(key='default_currency', value='EUR', description='Default currency')],
+        categories=[SimpleNamespace(id=i, name=f'category {i}', description='description ' * 10) for i in range(20)],
+        latest_expenses=_expenses(rows),
+        latest_dialog=[_ChatTurn(role='user', message='780 coffee beans')] * 6,
+        memory='The user lives in Berlin and pays in EUR.',
+        current_dt_full='Friday, May 30, 2025 16:54',
+    )
+    benchmark.pedantic(template.render, kwargs=context, rounds=_rounds(rows), warmup_rounds=1)
+
+
+@pytest.mark.parametrize('rows', ROWS)
+def test_render_list_expenses(benchmark, rows):
+    template = _load_template('list_expenses')
+    expenses = _expenses(rows)
+    benchmark.pedantic(template.render, kwargs={'expenses': expenses}, rounds=_rounds(rows), warmup_rounds=1)
+
+
+def test_construct_tool_call(benchmark):
+    parameters = {'category_id': 1, 'currency': 'EUR', 'amount': 780.0, 'comment': 'coffee beans'}
+    benchmark(ToolCall, name='add_expense', id='call_1', parameters=parameters)
+
+
+def test_construct_chat_turn(benchmark):
+    benchmark(_ChatTurn, role='user', message='780 coffee beans')
@@ -0,0 +1,29 @@
+import json
+import platform
+from pathlib import Path
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+def _minor(version: str) -> str:
+    return '.'.join(version.split('.')[:2])
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):  # noqa: ARG001
+    # baselines are compared by summary statistics, raw timings would make them megabytes large
+    for benchmark in output_json['benchmarks']:
+        benchmark['stats'].pop('data', None)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):  # noqa: ARG001
+    # timings of different interpreters are not comparable, the baseline is recorded with the one of the Dockerfile
+    if not BASELINE.exists():
+        return
+    recorded = json.loads(BASELINE.read_text())['machine_info']['python_version']
+    if _minor(recorded) != _minor(platform.python_version()):
+        terminalreporter.write_line(
+            f'{BASELINE.name} was recorded with Python {recorded}, this run uses Python {platform.python_version()}: '
+            'do not compare them',
+            yellow=True,
+            bold=True,
+        )
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from typing import Any
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.load_simulator import _seed
+from trackyai.agent.tools.crud import _load_template
+from trackyai.config import get_settings
+from trackyai.db import Category, Expense, get_service_manager
+from trackyai.export import EXPORT_FORMATS, export_expenses
+
+# benchmark expenses are kept in their own year, so that they never mix with the expenses of the load simulator
+_DATE_FROM = datetime.datetime(2000, 1, 1)
+_DATE_TO = datetime.datetime(2000, 12, 31, 23, 59, 59)
+
+
+async def _seed_expenses(rows: int) -> int:
+    await _seed(get_settings().allowed_user_ids)
+    async with get_service_manager().expense.session_maker() as session, session.begin():
+        existing = await session.scalar(
+            select(func.count()).select_from(Expense).where(Expense.date >= _DATE_FROM, Expense.date <= _DATE_TO)
+        )
+        category_ids = list(await session.scalars(select(Category.id)))
+        step = (_DATE_TO - _DATE_FROM) / rows
+        for start in range(existing or 0, rows, 10_000):
+            await session.execute(
+                insert(Expense),
+                [
+                    {
+                        'category_id': category_ids[i % len(category_ids)],
+                        'date': _DATE_FROM + step * i,
+                        'currency': 'EUR',
+                        'amount': round(1 + (i * 7919) % 50_000 / 100, 2),
+                        'comment': f'benchmark expense #{i}',
+                    }
+                    for i in range(start, min(start + 10_000, rows))
+                ],
+            )
+    await get_service_manager().engine.dispose()
+    return max(rows, existing or 0)
+
+
+def _max_rss_kib() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def _export(file_format: str) -> tuple[int, int]:
+    # `text` is the message path: all expenses loaded as objects and rendered at once
+    if file_format == 'text':
+        expenses = await get_service_manager().expense.find(date_from=_DATE_FROM, date_to=_DATE_TO)
+        text = _load_template('send_expenses').render(expenses=expenses)
+        return len(expenses), len(text.encode())
+    export = await export_expenses(file_format, date_from=_DATE_FROM, date_to=_DATE_TO)
+    with export.file:
+        size = export.file.seek(0, 2)
+    return export.rows, size
+
+
+def _measure(file_format: str, results: Any) -> None:
+    # runs in a fresh process, so that the peak RSS belongs to this export only
+    async def run() -> dict[str, Any]:
+        # a warm-up query imports and connects everything before the baseline is taken
+        await get_service_manager().expense.latest(1)
+        rss_before = _max_rss_kib()
+        started = time.perf_counter()
+        rows, size = await _export(file_format)
+        elapsed = time.perf_counter() - started
+        await get_service_manager().engine.dispose()
+        rss_peak = _max_rss_kib()
+        return {
+            'rows': rows,
+            'bytes': size,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed else None,
+            'max_rss_before_mib': round(rss_before / 1024, 1),
+            'max_rss_peak_mib': round(rss_peak / 1024, 1),
+            'max_rss_growth_mib': round((rss_peak - rss_before) / 1024, 1),
+        }
+
+    results.put(asyncio.run(run()))
+
+
+def benchmark(rows: int, formats: list[str]) -> dict[str, Any]:
+    seeded = asyncio.run(_seed_expenses(rows))
+    context = multiprocessing.get_context('spawn')
+    report: dict[str, Any] = {'config': {'rows': seeded}, 'formats': {}}
+    for file_format in formats:
+        results = context.Queue()
+        process = context.Process(target=_measure, args=(file_format, results))
+        process.start()
+        report['formats'][file_format] = results.get()
+        process.join()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            'Seeds a year of expenses and measures the time and the peak RSS of exporting them, every format in a '
+            'fresh process. `text` is the old message path for comparison, e.g. '
+            '`python -m benchmarks.export_expenses --rows 100000`.'
+        )
+    )
+    parser.add_argument('--rows', type=int, default=100_000, help='number of expenses to export')
+    parser.add_argument(
+        '--formats', nargs='+', default=[*EXPORT_FORMATS, 'text'], choices=[*EXPORT_FORMATS, 'text'], help='formats'
+    )
+    parser.add_argument('--output', type=str, default=None, help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = benchmark(rows=args.rows, formats=args.formats)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
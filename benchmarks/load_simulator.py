@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import itertools
+import json
+import logging
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import types
+from typing import Any, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from telegram import Chat, Message, Update, User
+
+from trackyai.agent.tools import Tool
+from trackyai.app import process_message
+from trackyai.communication import CommunicationProxy
+from trackyai.config import get_settings
+from trackyai.db import Category, EnvironmentConfiguration, Memory, get_service_manager
+from trackyai.session import get_session_manager
+
+logger = logging.getLogger('trackyai.load_simulator')
+
+# (weight, first message, reply to a clarification question)
+_MESSAGE_MIX: list[tuple[int, str, str | None]] = [
+    (50, '{amount} coffee beans', None),
+    (15, 'show my latest expenses', None),
+    (10, 'show me categories', None),
+    (10, 'what did I spend on groceries?', 'the last one'),
+    (5, 'show system settings', None),
+    (10, 'hello there', None),
+]
+
+_SEED_CATEGORIES = [
+    ('Groceries', 'Food and household goods bought in stores, e.g. coffee beans, vegetables, milk'),
+    ('Dining out', 'Restaurants, cafes, bars and food delivery'),
+    ('Transport', 'Public transport, taxi, fuel and parking'),
+]
+
+_SEED_ENV_CONFIGS = [('default_currency', 'EUR', 'Default currency of new expenses')]
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self._waiters: dict[int, asyncio.Future[str]] = {}
+        self.unsolicited = 0
+        self.sent = 0
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future[str]:
+        future: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        return future
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> None:  # noqa: ARG002
+        self.sent += 1
+        future = self._waiters.pop(chat_id, None)
+        if future is None or future.done():
+            self.unsolicited += 1
+            return
+        future.set_result(text)
+
+
+class PoolProbe:
+    def __init__(self) -> None:
+        self._pool = get_service_manager().engine.sync_engine.pool
+        self._connect = self._pool.connect
+        self.checkout_times: list[float] = []
+        self.max_checked_out = 0
+        self.saturated_checkouts = 0
+
+    def install(self) -> None:
+        def connect() -> Any:
+            if self._checked_out() >= self._capacity():
+                self.saturated_checkouts += 1
+            started = time.perf_counter()
+            try:
+                return self._connect()
+            finally:
+                self.checkout_times.append(time.perf_counter() - started)
+                self.max_checked_out = max(self.max_checked_out, self._checked_out())
+
+        self._pool.connect = connect  # type: ignore[method-assign]
+
+    def uninstall(self) -> None:
+        self._pool.connect = self._connect  # type: ignore[method-assign]
+
+    def _checked_out(self) -> int:
+        return getattr(self._pool, 'checkedout', lambda: 0)()
+
+    def _capacity(self) -> int:
+        size = getattr(self._pool, 'size', lambda: 0)()
+        max_overflow = getattr(self._pool, '_max_overflow', 0)
+        return size + max(max_overflow, 0)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.05) -> None:
+        self._interval = interval
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self._interval)
+            self.lags.append(max(loop.time() - started - self._interval, 0.0))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class SimulatedUser:
+    def __init__(self, user_id: int, bot: FakeBot, turns: int, think_time: float, timeout: float) -> None:
+        self._user = User(id=user_id, first_name=f'load-{user_id}', is_bot=False, username=f'load_{user_id}')
+        self._chat = Chat(id=user_id, type=Chat.PRIVATE)
+        self._bot = bot
+        self._turns = turns
+        self._think_time = think_time
+        self._timeout = timeout
+        self._update_ids = itertools.count(1)
+        self.latencies: list[float] = []
+        self.timeouts = 0
+        self.errors = 0
+
+    def _update(self, text: str) -> Update:
+        update_id = next(self._update_ids)
+        message = Message(
+            message_id=update_id,
+            date=datetime.datetime.now(tz=datetime.UTC),
+            chat=self._chat,
+            from_user=self._user,
+            text=text,
+        )
+        return Update(update_id=update_id, message=message)
+
+    async def _turn(self, text: str) -> bool:
+        reply = self._bot.expect_reply(self._user.id)
+        started = time.perf_counter()
+        try:
+            # skip the allow-list check so that arbitrary simulated user ids are accepted
+            await process_message.__wrapped__(self._update(text), None)  # type: ignore[attr-defined]
+            await asyncio.wait_for(reply, timeout=self._timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            return False
+        except Exception as e:
+            logger.error(f'Simulated user {self._user.id} failed a turn', exc_info=e)
+            self.errors += 1
+            return False
+        self.latencies.append(time.perf_counter() - started)
+        return True
+
+    async def run(self, rng: random.Random) -> None:
+        weights = [weight for weight, _, _ in _MESSAGE_MIX]
+        for _ in range(self._turns):
+            _, message, clarification = rng.choices(_MESSAGE_MIX, weights=weights)[0]
+            ok = await self._turn(message.format(amount=rng.randint(1, 5000)))
+            if ok and clarification is not None:
+                await asyncio.sleep(self._think_time)
+                ok = await self._turn(clarification)
+            if not ok:
+                # let a stuck session finish before the next intent, otherwise the next message joins it
+                await asyncio.sleep(self._timeout)
+            await asyncio.sleep(rng.uniform(0, 2 * self._think_time))
+
+
+def _percentiles(values: Iterable[float]) -> dict[str, float | None]:
+    ordered = sorted(values)
+    if not ordered:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 6)
+
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 6)}
+
+
+def _retained_bytes(root: Any) -> int:
+    shared = (
+        type,
+        types.ModuleType,
+        types.FunctionType,
+        types.BuiltinFunctionType,
+        types.MethodType,
+        asyncio.Future,
+        asyncio.AbstractEventLoop,
+        Tool,
+        FakeBot,
+    )
+    seen: set[int] = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, shared):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def _memory_snapshot() -> dict[str, int]:
+    return {
+        'sessions': len(get_session_manager().sessions),
+        'sessions_bytes': _retained_bytes(get_session_manager().sessions),
+        'proxies': len(CommunicationProxy.proxies()),
+        'proxies_bytes': _retained_bytes(CommunicationProxy.proxies()),
+        'traced_bytes': tracemalloc.get_traced_memory()[0],
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+async def _seed(user_ids: Iterable[int]) -> None:
+    await get_service_manager().create_database()
+    async with get_service_manager().category.session_maker() as session, session.begin():
+        if not (await session.scalars(select(Category).limit(1))).first():
+            session.add_all([Category(name=name, description=description) for name, description in _SEED_CATEGORIES])
+        await session.execute(
+            insert(EnvironmentConfiguration)
+            .values([{'key': k, 'value': v, 'description': d} for k, v, d in _SEED_ENV_CONFIGS])
+            .on_conflict_do_nothing()
+        )
+        await session.execute(
+            insert(Memory).values([{'user_id': user_id, 'memory': ''} for user_id in user_ids]).on_conflict_do_nothing()
+        )
+
+
+async def simulate(
+    users: int, turns: int, first_user_id: int, think_time: float, ramp_up: float, timeout: float, seed: int
+) -> dict[str, Any]:
+    user_ids = list(range(first_user_id, first_user_id + users))
+    await _seed(user_ids)
+
+    bot = FakeBot()
+    CommunicationProxy.setup_proxy(bot=bot)  # type: ignore[arg-type]
+    rng = random.Random(seed)
+    simulated = [SimulatedUser(user_id, bot, turns, think_time, timeout) for user_id in user_ids]
+
+    tracemalloc.start()
+    memory_before = _memory_snapshot()
+    probe = PoolProbe()
+    probe.install()
+    lag_monitor = LoopLagMonitor()
+    lag_monitor.start()
+
+    async def start_user(index: int, user: SimulatedUser) -> None:
+        await asyncio.sleep(ramp_up * index / max(users, 1))
+        await user.run(random.Random(rng.random()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start_user(i, user) for i, user in enumerate(simulated)))
+    elapsed = time.perf_counter() - started
+
+    await lag_monitor.stop()
+    probe.uninstall()
+    memory_after = _memory_snapshot()
+    tracemalloc.stop()
+
+    latencies = [latency for user in simulated for latency in user.latencies]
+    return {
+        'config': {
+            'users': users,
+            'turns_per_user': turns,
+            'think_time': think_time,
+            'ramp_up': ramp_up,
+            'stub_latency': get_settings().stub_latency,
+        },
+        'turns': {
+            'completed': len(latencies),
+            'timeouts': sum(user.timeouts for user in simulated),
+            'errors': sum(user.errors for user in simulated),
+            'unsolicited_replies': bot.unsolicited,
+            'latency_seconds': _percentiles(latencies),
+        },
+        'throughput_turns_per_second': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'elapsed_seconds': round(elapsed, 3),
+        'event_loop_lag_seconds': _percentiles(lag_monitor.lags),
+        'db_pool': {
+            'checkouts': len(probe.checkout_times),
+            'checkout_wait_seconds': _percentiles(probe.checkout_times),
+            'saturated_checkouts': probe.saturated_checkouts,
+            'max_checked_out': probe.max_checked_out,
+        },
+        'memory': {
+            'before': memory_before,
+            'after': memory_after,
+            'growth': {key: memory_after[key] - memory_before[key] for key in memory_before},
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            'Drives process_message with simulated Telegram users against the stub LLM and the configured Postgres. '
+            'Run with TRACKYAI_COMPLETION_SERVICE=stub, e.g. `python -m benchmarks.load_simulator --users 100`.'
+        )
+    )
+    parser.add_argument('--users', type=int, default=20, help='number of concurrent simulated users')
+    parser.add_argument('--turns', type=int, default=5, help='number of intents every user sends')
+    parser.add_argument('--first-user-id', type=int, default=10_000_000, help='telegram id of the first user')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean pause between user messages, seconds')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='time to start all users, seconds')
+    parser.add_argument('--timeout', type=float, default=30.0, help='time to wait for a bot reply, seconds')
+    parser.add_argument('--seed', type=int, default=11, help='random seed of the message mix')
+    parser.add_argument('--output', type=str, default=None, help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    if get_settings().completion_service != 'stub':
+        parser.error('the load simulator must run against the stub LLM; set TRACKYAI_COMPLETION_SERVICE=stub')
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(
+        simulate(
+            users=args.users,
+            turns=args.turns,
+            first_user_id=args.first_user_id,
+            think_time=args.think_time,
+            ramp_up=args.ramp_up,
+            timeout=args.timeout,
+            seed=args.seed,
+        )
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+from types import SimpleNamespace
+from typing import Any
+
+from trackyai.agent import Chat, ToolSelector, get_completion_service, load_system_prompt_template
+from trackyai.agent.tool_selector import estimate_schema_tokens
+from trackyai.agent.tools import Tool, ToolCall, ToolResult, tool_registry
+from trackyai.config import get_settings
+
+_FIND_LAST_WEEK = ToolCall(
+    name='find_expenses',
+    id='call_find',
+    parameters={
+        'category_id': 1,
+        'date_from': datetime.datetime(2025, 5, 23),
+        'date_to': datetime.datetime(2025, 5, 30),
+        'currency': 'EUR',
+        'amount_from': 0.0,
+        'amount_to': 1_000_000.0,
+        'limit': 100,
+    },
+)
+
+# (user messages, preceding tool calls with their results, acceptable tools)
+_CASES: list[tuple[list[str], list[tuple[ToolCall, str]], set[str]]] = [
+    (['780 coffee beans'], [], {'add_expense'}),
+    (['spent 25 on a taxi to the airport'], [], {'add_expense'}),
+    (['paid 40 for lunch with colleagues'], [], {'add_expense'}),
+    (['show me categories'], [], {'send_categories'}),
+    (['add a new category for pet food and vet visits'], [], {'add_category'}),
+    (['rename category 3 to Travel'], [], {'update_category'}),
+    (['show system settings'], [], {'send_system_configurations'}),
+    (['set default currency to USD'], [], {'update_environment_config', 'list_environment_configurations'}),
+    (['what did I spend yesterday?'], [], {'find_expenses'}),
+    (['show my last 5 expenses'], [], {'find_expenses', 'send_expenses_list'}),
+    (['how much did I spend on groceries this month'], [], {'find_expenses'}),
+    (['the last expense should be 300 instead of 30'], [], {'update_expense', 'find_expenses'}),
+    (['hi, what can you do?'], [], {'finish_session_with_reply'}),
+    (
+        ['show my expenses from last week'],
+        [(_FIND_LAST_WEEK, 'Expenses:\nid=1\namount=12.5\nid=2\namount=30.0\n')],
+        {'send_expenses_list'},
+    ),
+]
+
+
+def _chat(messages: list[str], tool_calls: list[tuple[ToolCall, str]]) -> Chat:
+    chat = Chat()
+    for message in messages:
+        chat.add_user_message(message)
+    for tool_call, result in tool_calls:
+        chat.add_tool_call(tool_call)
+        chat.add_tool_result(ToolResult(tool_call=tool_call, result=result))
+    return chat
+
+
+def _system_prompt() -> str:
+    return load_system_prompt_template('main').render(
+        ecs=[SimpleNamespace(key='default_currency', value='EUR', description='Default currency of new expenses')],
+        categories=[
+            SimpleNamespace(id=1, name='Groceries', description='Food bought in stores'),
+            SimpleNamespace(id=2, name='Dining out', description='Restaurants, cafes and bars'),
+            SimpleNamespace(id=3, name='Transport', description='Taxi, public transport and fuel'),
+        ],
+        latest_expenses=[],
+        latest_dialog=[],
+        memory='',
+        category_suggestions=[],
+        current_dt_full=datetime.datetime(2025, 5, 30, 16, 54).strftime('%A, %B %d, %Y %H:%M'),
+    )
+
+
+async def evaluate(live: bool) -> dict[str, Any]:
+    tools: list[Tool] = list(tool_registry.get('main'))
+    selector = ToolSelector()
+    completion_service = get_completion_service(get_settings().completion_service) if live else None
+    system_prompt = _system_prompt()
+
+    cases = []
+    for messages, tool_calls, expected in _CASES:
+        chat = _chat(messages, tool_calls)
+        selected = selector.select(chat, tools)
+        case: dict[str, Any] = {
+            'messages': messages,
+            'expected': sorted(expected),
+            'selected': [tool.name for tool in selected],
+            'recalled': bool(expected.intersection(tool.name for tool in selected)),
+            'schema_tokens': {
+                'full': sum(estimate_schema_tokens(tool) for tool in tools),
+                'selected': sum(estimate_schema_tokens(tool) for tool in selected),
+            },
+        }
+        if completion_service is not None:
+            full_choice = await completion_service.infer_toolcall(system_prompt, chat, tools)
+            selected_choice = await completion_service.infer_toolcall(system_prompt, chat, selected)
+            case['choice'] = {'full': full_choice.name, 'selected': selected_choice.name}
+        cases.append(case)
+
+    full_tokens = sum(case['schema_tokens']['full'] for case in cases)
+    selected_tokens = sum(case['schema_tokens']['selected'] for case in cases)
+    summary: dict[str, Any] = {
+        'cases': len(cases),
+        'selector_recall': round(sum(case['recalled'] for case in cases) / len(cases), 3),
+        'mean_selected_tools': round(sum(len(case['selected']) for case in cases) / len(cases), 2),
+        'total_tools': len(tools),
+        'schema_tokens': {
+            'full': full_tokens,
+            'selected': selected_tokens,
+            'saved_ratio': round(1 - selected_tokens / full_tokens, 3),
+        },
+        'system_prompt_tokens_estimate': len(system_prompt) // 4,
+    }
+    if completion_service is not None:
+        summary['accuracy'] = {
+            selection: round(sum(case['choice'][selection] in case['expected'] for case in cases) / len(cases), 3)
+            for selection in ('full', 'selected')
+        }
+    return {'summary': summary, 'cases': cases}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            'Compares tool schema tokens and tool-choice accuracy with and without per-step tool selection on a '
+            'labelled set of user requests, e.g. `python -m benchmarks.tool_selection --live`.'
+        )
+    )
+    parser.add_argument(
+        '--live', action='store_true', help='also ask the configured completion service to choose a tool'
+    )
+    args = parser.parse_args()
+    report = asyncio.run(evaluate(live=args.live))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.load_simulator import _MESSAGE_MIX, _percentiles, _seed
+from trackyai.config import get_settings
+from trackyai.webhook import SECRET_TOKEN_HEADER
+
+_SECRET_TOKEN = 'webhook-load'
+
+
+# Answers the Bot API methods used by the bot and hands sent messages over to the simulated users
+class FakeBotApi:
+    def __init__(self) -> None:
+        self._waiters: dict[int, asyncio.Future[str]] = {}
+        self._message_ids = itertools.count(1)
+        self.calls: dict[str, int] = {}
+        self.unsolicited = 0
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future[str]:
+        future: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        return future
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        payload = dict(await request.post()) if request.can_read_body else {}
+        if method == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'tracky', 'username': 'tracky_bot'}
+        elif method == 'sendMessage':
+            chat_id = int(str(payload['chat_id']))
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': payload.get('text', ''),
+            }
+            future = self._waiters.pop(chat_id, None)
+            if future is None or future.done():
+                self.unsolicited += 1
+            else:
+                future.set_result(str(payload.get('text', '')))
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+class WebhookUser:
+    def __init__(
+        self, user_id: int, api: FakeBotApi, http: aiohttp.ClientSession, webhook: str, update_ids: itertools.count
+    ) -> None:
+        self._user_id = user_id
+        self._api = api
+        self._http = http
+        self._webhook = webhook
+        self._update_ids = update_ids
+        self.ack_latencies: list[float] = []
+        self.latencies: list[float] = []
+        self.timeouts = 0
+        self.errors = 0
+
+    def _update(self, text: str) -> dict[str, Any]:
+        update_id = next(self._update_ids)
+        user = {'id': self._user_id, 'is_bot': False, 'first_name': f'load-{self._user_id}'}
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': self._user_id, 'type': 'private'},
+                'from': user,
+                'text': text,
+            },
+        }
+
+    async def _turn(self, text: str, timeout: float) -> bool:
+        reply = self._api.expect_reply(self._user_id)
+        started = time.perf_counter()
+        try:
+            async with self._http.post(
+                self._webhook, json=self._update(text), headers={SECRET_TOKEN_HEADER: _SECRET_TOKEN}
+            ) as response:
+                response.raise_for_status()
+            self.ack_latencies.append(time.perf_counter() - started)
+            await asyncio.wait_for(reply, timeout=timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            return False
+        except aiohttp.ClientError:
+            self.errors += 1
+            return False
+        self.latencies.append(time.perf_counter() - started)
+        return True
+
+    async def run(self, rng: random.Random, turns: int, think_time: float, timeout: float) -> None:
+        weights = [weight for weight, _, _ in _MESSAGE_MIX]
+        for _ in range(turns):
+            _, message, clarification = rng.choices(_MESSAGE_MIX, weights=weights)[0]
+            ok = await self._turn(message.format(amount=rng.randint(1, 5000)), timeout)
+            if ok and clarification is not None:
+                await asyncio.sleep(think_time)
+                ok = await self._turn(clarification, timeout)
+            if not ok:
+                await asyncio.sleep(timeout)
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+async def _wait_healthy(http: aiohttp.ClientSession, url: str, bot: asyncio.subprocess.Process) -> None:
+    for _ in range(300):
+        if bot.returncode is not None:
+            raise RuntimeError(f'the bot exited with {bot.returncode}')
+        try:
+            async with http.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError('the bot did not start listening in time')
+
+
+async def benchmark(
+    users: int,
+    turns: int,
+    first_user_id: int,
+    think_time: float,
+    ramp_up: float,
+    timeout: float,
+    seed: int,
+    api_port: int,
+    webhook_port: int,
+    concurrent_updates: int,
+) -> dict[str, Any]:
+    user_ids = list(range(first_user_id, first_user_id + users))
+    await _seed(user_ids)
+
+    api = FakeBotApi()
+    api_app = web.Application()
+    api_app.router.add_post('/bot{token}/{method}', api.handle)
+    api_runner = web.AppRunner(api_app)
+    await api_runner.setup()
+    await web.TCPSite(api_runner, host='127.0.0.1', port=api_port).start()
+
+    env = {
+        **os.environ,
+        'TRACKYAI_UPDATES_MODE': 'webhook',
+        'TRACKYAI_WEBHOOK_LISTEN': '127.0.0.1',
+        'TRACKYAI_WEBHOOK_PORT': str(webhook_port),
+        'TRACKYAI_WEBHOOK_SECRET_TOKEN': _SECRET_TOKEN,
+        'TRACKYAI_TELEGRAM_BASE_URL': f'http://127.0.0.1:{api_port}/bot',
+        'TRACKYAI_ALLOWED_USER_IDS': json.dumps(user_ids),
+        'TRACKYAI_CONCURRENT_UPDATES': str(concurrent_updates),
+    }
+    bot = await asyncio.create_subprocess_exec(sys.executable, '-m', 'trackyai.app', env=env)
+    base_url = f'http://127.0.0.1:{webhook_port}'
+    update_ids = itertools.count(1)
+    try:
+        async with aiohttp.ClientSession() as http:
+            await _wait_healthy(http, f'{base_url}/healthz', bot)
+            simulated = [
+                WebhookUser(user_id, api, http, f'{base_url}{get_settings().webhook_path}', update_ids)
+                for user_id in user_ids
+            ]
+            rng = random.Random(seed)
+
+            async def start_user(index: int, user: WebhookUser) -> None:
+                await asyncio.sleep(ramp_up * index / max(users, 1))
+                await user.run(random.Random(rng.random()), turns, think_time, timeout)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(start_user(i, user) for i, user in enumerate(simulated)))
+            elapsed = time.perf_counter() - started
+    finally:
+        if bot.returncode is None:
+            bot.terminate()
+        await bot.wait()
+        await api_runner.cleanup()
+
+    latencies = [latency for user in simulated for latency in user.latencies]
+    return {
+        'config': {
+            'users': users,
+            'turns_per_user': turns,
+            'think_time': think_time,
+            'ramp_up': ramp_up,
+            'concurrent_updates': concurrent_updates,
+            'stub_latency': get_settings().stub_latency,
+        },
+        'turns': {
+            'completed': len(latencies),
+            'timeouts': sum(user.timeouts for user in simulated),
+            'errors': sum(user.errors for user in simulated),
+            'unsolicited_replies': api.unsolicited,
+            'webhook_ack_seconds': _percentiles(latency for user in simulated for latency in user.ack_latencies),
+            'latency_seconds': _percentiles(latencies),
+        },
+        'throughput_turns_per_second': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'elapsed_seconds': round(elapsed, 3),
+        'bot_api_calls': api.calls,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            'Runs the bot in webhook mode against a local fake Bot API and posts fake updates of simulated users to '
+            'it. Run with TRACKYAI_COMPLETION_SERVICE=stub, e.g. `python -m benchmarks.webhook_load --users 100`.'
+        )
+    )
+    parser.add_argument('--users', type=int, default=20, help='number of concurrent simulated users')
+    parser.add_argument('--turns', type=int, default=5, help='number of intents every user sends')
+    parser.add_argument('--first-user-id', type=int, default=10_000_000, help='telegram id of the first user')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean pause between user messages, seconds')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='time to start all users, seconds')
+    parser.add_argument('--timeout', type=float, default=30.0, help='time to wait for a bot reply, seconds')
+    parser.add_argument('--seed', type=int, default=11, help='random seed of the message mix')
+    parser.add_argument('--api-port', type=int, default=8081, help='port of the fake Bot API')
+    parser.add_argument('--webhook-port', type=int, default=8080, help='port of the bot webhook')
+    parser.add_argument('--concurrent-updates', type=int, default=64, help='updates processed concurrently')
+    parser.add_argument('--output', type=str, default=None, help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    if get_settings().completion_service != 'stub':
+        parser.error('the webhook benchmark must run against the stub LLM; set TRACKYAI_COMPLETION_SERVICE=stub')
+
+    report = asyncio.run(
+        benchmark(
+            users=args.users,
+            turns=args.turns,
+            first_user_id=args.first_user_id,
+            think_time=args.think_time,
+            ramp_up=args.ramp_up,
+            timeout=args.timeout,
+            seed=args.seed,
+            api_port=args.api_port,
+            webhook_port=args.webhook_port,
+            concurrent_updates=args.concurrent_updates,
+        )
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
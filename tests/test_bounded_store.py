@@ -0,0 +1,58 @@
+from trackyai.bounded_store import BoundedStore
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    evicted = []
+    store = BoundedStore('test', max_size=2, ttl=100, on_evict=lambda k, v: evicted.append(k), clock=_Clock())
+    store[1] = 'a'
+    store[2] = 'b'
+    assert store.get(1) == 'a'
+    store[3] = 'c'
+    assert evicted == [2]
+    assert 2 not in store
+    assert len(store) == 2
+
+
+def test_lru_eviction_skips_busy_entries():
+    store = BoundedStore('test', max_size=1, ttl=100, can_evict=lambda v: v != 'busy', clock=_Clock())
+    store[1] = 'busy'
+    store[2] = 'idle'
+    store[3] = 'idle'
+    assert 1 in store
+    assert 2 not in store
+    assert 3 in store
+    assert len(store) == 2
+
+
+def test_ttl_eviction():
+    clock = _Clock()
+    evicted = []
+    store = BoundedStore('test', max_size=10, ttl=10, on_evict=lambda k, v: evicted.append(k), clock=clock)
+    store[1] = 'a'
+    clock.now = 5
+    store[2] = 'b'
+    clock.now = 12
+    assert store.get(2) == 'b'
+    assert evicted == [1]
+    clock.now = 30
+    assert store.get(2) is None
+    assert evicted == [1, 2]
+
+
+def test_ttl_eviction_skips_busy_entries():
+    clock = _Clock()
+    store = BoundedStore('test', max_size=10, ttl=10, can_evict=lambda v: v != 'busy', clock=clock)
+    store[1] = 'busy'
+    store[2] = 'idle'
+    clock.now = 20
+    assert store.get(2) is None
+    assert store.get(1) == 'busy'
+    assert len(store) == 1
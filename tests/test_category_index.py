@@ -0,0 +1,42 @@
+from trackyai.agent.category_index import CategoryIndex
+
+
+def _index() -> CategoryIndex:
+    index = CategoryIndex()
+    index.observe_category(1, 'Groceries', 'Food bought in stores: vegetables, milk, bread')
+    index.observe_category(2, 'Dining out', 'Restaurants, cafes and bars')
+    index.observe_category(3, 'Transport', 'Taxi, bus, metro and fuel')
+    return index
+
+
+def test_suggest_by_description():
+    suggestions = _index().suggest('taxi to the airport')
+    assert suggestions[0].category_id == 3
+    assert 0 < suggestions[0].score <= 1
+    assert len(suggestions) <= 3
+
+
+def test_suggest_learns_from_expense_comments():
+    index = _index()
+    assert not index.suggest('780 coffee beans') or index.suggest('780 coffee beans')[0].category_id != 1
+
+    index.observe_expense(10, 1, 'coffee beans')
+    index.observe_expense(11, 1, 'coffee beans and milk')
+    assert index.suggest('780 coffee beans')[0].category_id == 1
+
+    # moving expenses to another category replaces their previous contribution
+    index.observe_expense(10, 2, 'coffee beans')
+    index.observe_expense(11, 2, 'coffee beans and milk')
+    assert index.suggest('780 coffee beans')[0].category_id == 2
+
+
+def test_category_update_replaces_description():
+    index = _index()
+    index.observe_category(3, 'Transport', 'Trains and planes')
+    assert all(suggestion.category_id != 3 for suggestion in index.suggest('taxi'))
+    assert index.suggest('planes')[0].category_id == 3
+
+
+def test_suggest_without_matches():
+    assert _index().suggest('12345') == []
+    assert CategoryIndex().suggest('coffee') == []
@@ -0,0 +1,65 @@
+from trackyai.agent import Chat
+from trackyai.agent.completion_services.openai import _prepare_messages, _serialize_turn
+from trackyai.agent.tools import ToolCall, ToolResult
+
+
+def _counting_serializer():
+    serialized = []
+
+    def serialize(turn):
+        serialized.append(turn)
+        return _serialize_turn(turn)
+
+    return serialize, serialized
+
+
+def test_turns_are_serialized_once():
+    chat = Chat()
+    serialize, serialized = _counting_serializer()
+    chat.add_user_message('780 coffee beans')
+    tool_call = ToolCall(name='list_categories', id='call_1', parameters={})
+    chat.add_tool_call(tool_call)
+    assert len(chat.serialized('test', serialize)) == 2
+
+    chat.add_tool_result(ToolResult(tool_call=tool_call, result='1: Groceries'))
+    messages = chat.serialized('test', serialize)
+
+    assert len(serialized) == 3
+    assert [message['role'] for message in messages] == ['user', 'assistant', 'tool']
+    assert chat.serialized('test', serialize) is messages
+    assert len(serialized) == 3
+
+
+def test_merged_message_is_serialized_again():
+    chat = Chat()
+    serialize, serialized = _counting_serializer()
+    chat.add_agent_message('How much?')
+    chat.add_user_message('780')
+    chat.serialized('test', serialize)
+
+    chat.add_user_message('coffee beans')
+    messages = chat.serialized('test', serialize)
+
+    assert messages[-1] == {'role': 'user', 'content': '780\ncoffee beans'}
+    assert len(serialized) == 3
+    assert messages[0] == {'role': 'assistant', 'content': 'How much?'}
+
+
+def test_cached_messages_equal_fresh_ones():
+    chat = Chat()
+    for i in range(5):
+        chat.add_user_message(f'message {i}')
+        _prepare_messages('system', chat)
+        chat.add_user_message('again')
+        tool_call = ToolCall(name='find_expenses', id=f'call_{i}', parameters={'limit': i})
+        chat.add_tool_call(tool_call)
+        _prepare_messages('system', chat)
+        chat.add_tool_result(ToolResult(tool_call=tool_call, result=None, success=False, exc_message='failed'))
+        chat.add_agent_message('done')
+        _prepare_messages('system', chat)
+        chat.add_agent_message('really')
+
+    fresh = Chat.load(chat.dump())
+
+    assert _prepare_messages('system', chat) == _prepare_messages('system', fresh)
+    assert _prepare_messages('system', chat)[-1] == {'role': 'assistant', 'content': 'done\nreally'}
@@ -0,0 +1,65 @@
+import asyncio
+
+from trackyai.dispatcher import Dispatcher, UserQueue
+from trackyai.metrics import metrics
+
+
+def test_jobs_are_bounded_by_workers_and_keep_user_order():
+    taken: list[tuple[int, list[str]]] = []
+    running = 0
+    max_running = 0
+
+    async def job(inbox: UserQueue) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        taken.append((inbox.user_id, inbox.take()))
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run() -> None:
+        dispatcher = Dispatcher('test-order', job, workers=2, busy_threshold=100, max_user_messages=10)
+        for i in range(4):
+            for user_id in range(5):
+                dispatcher.submit(user_id, f'{user_id}-{i}')
+        while dispatcher._queues:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+    assert max_running == 2
+    for user_id in range(5):
+        messages = [message for user, batch in taken if user == user_id for message in batch]
+        assert messages == [f'{user_id}-{i}' for i in range(4)]
+    assert metrics.histogram('dispatcher_wait_seconds', '', ['dispatcher']).samples()[('test-order',)].total == 20
+
+
+def test_busy_users_are_told_and_full_queues_rejected():
+    busy: list[int] = []
+    async def on_busy(user_id: int) -> None:
+        busy.append(user_id)
+
+    async def run() -> bool:
+        gate = asyncio.Event()
+
+        async def job(inbox: UserQueue) -> None:
+            await gate.wait()
+            inbox.take()
+
+        dispatcher = Dispatcher('test-busy', job, workers=1, busy_threshold=2, max_user_messages=2, on_busy=on_busy)
+        dispatcher.submit(0, 'hi')
+        await asyncio.sleep(0)
+        for user_id in range(1, 4):
+            dispatcher.submit(user_id, 'hi')
+        dispatcher.submit(3, 'again')
+        accepts = dispatcher.can_accept(3)
+        gate.set()
+        while dispatcher._queues:
+            await asyncio.sleep(0.01)
+        return accepts
+
+    accepts = asyncio.run(run())
+
+    # the first user is taken by the only worker, the fourth one finds two users waiting
+    assert busy == [3]
+    assert not accepts
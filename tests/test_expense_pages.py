@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from trackyai.agent.tools.crud import _load_template
+from trackyai.agent.tools.pages import ExpensePages
+from trackyai.db import get_service_manager
+
+
+def _expenses(count):
+    start = datetime.datetime(2025, 1, 1)
+    return [
+        SimpleNamespace(
+            id=i,
+            category=SimpleNamespace(name='food'),
+            date=start + datetime.timedelta(days=i // 2),
+            currency='EUR',
+            amount=float(i),
+            comment=f'expense {i}',
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+class _ExpenseService:
+    def __init__(self, expenses):
+        self._expenses = expenses
+        self.calls = []
+
+    async def page(self, expense_ids, after, limit):
+        self.calls.append(after)
+        found = [e for e in self._expenses if e.id in expense_ids and (after is None or (e.date, e.id) < after)]
+        return sorted(found, key=lambda e: (e.date, e.id), reverse=True)[:limit]
+
+
+def _pages():
+    return ExpensePages(_load_template('send_expenses'), page_size=3, page_ttl=60, list_ttl=60, max_lists=10)
+
+
+def _buttons(page):
+    return [button.callback_data for row in page.reply_markup.inline_keyboard for button in row]
+
+
+def _ids(page):
+    return [int(line.split(': ')[1]) for line in page.text.splitlines() if line.startswith('`id`')]
+
+
+def test_pages_are_loaded_on_demand_with_keyset_pagination(monkeypatch):
+    service = _ExpenseService(_expenses(8))
+    monkeypatch.setattr(get_service_manager(), 'expense', service)
+    pages = _pages()
+
+    async def run():
+        first = await pages.open(user_id=1, expense_ids=[1, 2, 3, 4, 5, 6, 7, 8, 99])
+        assert _ids(first) == [8, 7, 6]
+        assert '(page 1)' in first.text
+        assert len(_buttons(first)) == 1
+        second = await pages.turn(user_id=1, callback_data=_buttons(first)[0])
+        assert _ids(second) == [5, 4, 3]
+        assert len(_buttons(second)) == 2
+        third = await pages.turn(user_id=1, callback_data=_buttons(second)[1])
+        assert _ids(third) == [2, 1]
+        assert len(_buttons(third)) == 1
+        back = await pages.turn(user_id=1, callback_data=_buttons(third)[0])
+        assert back is second
+
+    asyncio.run(run())
+
+    # every page is loaded once, from the last expense of the previous page
+    assert service.calls == [None, (datetime.datetime(2025, 1, 4), 6), (datetime.datetime(2025, 1, 2), 3)]
+
+
+def test_single_page_has_no_buttons(monkeypatch):
+    monkeypatch.setattr(get_service_manager(), 'expense', _ExpenseService(_expenses(3)))
+
+    page = asyncio.run(_pages().open(user_id=1, expense_ids=[1, 2, 3]))
+
+    assert page.reply_markup is None
+    assert 'page' not in page.text
+    assert _ids(page) == [3, 2, 1]
+
+
+def test_foreign_unknown_and_invalid_pages_are_rejected(monkeypatch):
+    monkeypatch.setattr(get_service_manager(), 'expense', _ExpenseService(_expenses(8)))
+    pages = _pages()
+
+    async def run():
+        first = await pages.open(user_id=1, expense_ids=list(range(1, 9)))
+        listing_data = _buttons(first)[0]
+        assert await pages.turn(user_id=2, callback_data=listing_data) is None
+        assert await pages.turn(user_id=1, callback_data='xp:missing:1') is None
+        assert await pages.turn(user_id=1, callback_data=listing_data.replace(':1', ':5')) is None
+        assert await pages.turn(user_id=1, callback_data='xp:garbage') is None
+
+    asyncio.run(run())
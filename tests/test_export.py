@@ -0,0 +1,83 @@
+import asyncio
+import csv
+import datetime
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from trackyai import export as export_module
+from trackyai.db import get_service_manager
+from trackyai.export import EXPORT_COLUMNS, export_expenses
+
+_NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def _rows(count):
+    date = datetime.datetime(2025, 5, 30, 12, 0)
+    return [(i, date, 'Groceries', 'EUR', 12.5 + i, f'coffee "beans" & <milk> #{i}\x01') for i in range(count)]
+
+
+class _ExpenseService:
+    def __init__(self, rows):
+        self._rows = rows
+        self.chunk_sizes = []
+
+    async def stream(self, date_from, date_to, chunk_size):  # noqa: ARG002
+        for i in range(0, len(self._rows), chunk_size):
+            self.chunk_sizes.append(len(self._rows[i : i + chunk_size]))
+            yield self._rows[i : i + chunk_size]
+
+
+def _export(monkeypatch, file_format, rows):
+    service = _ExpenseService(rows)
+    monkeypatch.setattr(get_service_manager(), 'expense', service)
+    result = asyncio.run(export_expenses(file_format, datetime.datetime(2025, 1, 1), datetime.datetime(2025, 12, 31)))
+    return result, service
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch):
+    class _Settings:
+        export_chunk_size = 3
+        export_spool_size = 1024
+
+    monkeypatch.setattr(export_module, 'get_settings', _Settings)
+
+
+def test_csv_export_is_written_in_chunks(monkeypatch):
+    result, service = _export(monkeypatch, 'csv', _rows(7))
+
+    with result.file:
+        lines = list(csv.reader(io.StringIO(result.file.read().decode('utf-8-sig'))))
+    assert service.chunk_sizes == [3, 3, 1]
+    assert result.rows == 7
+    assert result.filename == 'expenses_2025-01-01_2025-12-31.csv'
+    assert lines[0] == list(EXPORT_COLUMNS)
+    assert lines[1] == ['0', '2025-05-30 12:00:00', 'Groceries', 'EUR', '12.5', 'coffee "beans" & <milk> #0\x01']
+    assert len(lines) == 8
+
+
+def test_xlsx_export_is_a_valid_workbook(monkeypatch):
+    result, _ = _export(monkeypatch, 'xlsx', _rows(5))
+
+    with result.file, zipfile.ZipFile(result.file) as workbook:
+        assert workbook.testzip() is None
+        for name in ('[Content_Types].xml', 'xl/workbook.xml', 'xl/styles.xml', 'xl/_rels/workbook.xml.rels'):
+            ElementTree.fromstring(workbook.read(name))
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+    rows = sheet.findall('x:sheetData/x:row', _NS)
+    assert len(rows) == 6
+    assert [cell.findtext('x:is/x:t', namespaces=_NS) for cell in rows[0]] == list(EXPORT_COLUMNS)
+    cells = list(rows[1])
+    assert cells[0].findtext('x:v', namespaces=_NS) == '0'
+    # dates are serial day numbers with a date format, so that spreadsheets can sort and filter them
+    assert cells[1].get('s') == '1'
+    assert float(cells[1].findtext('x:v', namespaces=_NS)) == pytest.approx(45807.5)
+    assert cells[5].findtext('x:is/x:t', namespaces=_NS) == 'coffee "beans" & <milk> #0'
+
+
+def test_unsupported_format_is_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        _export(monkeypatch, 'pdf', _rows(1))
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+# the tools are imported by every entrypoint and benchmark, ~0.3s here; the budget leaves room for slower machines
+_IMPORT_BUDGET_SECONDS = 1.0
+
+_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import trackyai.agent.tools
+elapsed = time.perf_counter() - started
+heavy = [name for name in ('openai', 'telegram', 'sqlalchemy', 'asyncpg', 'aiohttp') if name in sys.modules]
+print(json.dumps({'seconds': elapsed, 'heavy': heavy}))
+"""
+
+
+def _import_tools() -> dict:
+    # neither settings nor secrets are needed to import the tools
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if not name.startswith(('TRACKYAI_', 'POSTGRES_', 'OPENAI_', 'TELEGRAM_'))
+    }
+    result = subprocess.run([sys.executable, '-c', _SCRIPT], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_tools_import_lazily_and_within_budget():
+    result = _import_tools()
+
+    assert result['heavy'] == []
+    assert result['seconds'] < _IMPORT_BUDGET_SECONDS
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from trackyai import log as log_module
+from trackyai.log import log_context, setup_logging, stop_logging
+from trackyai.tracing import span
+
+
+class _Payload:
+    def __init__(self):
+        self.formatted_in = None
+
+    def __str__(self):
+        self.formatted_in = threading.current_thread().name
+        return 'a large payload'
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    settings = SimpleNamespace(log_dir=str(tmp_path), log_level=logging.DEBUG, log_format='json', tracing=True)
+    monkeypatch.setattr(log_module, 'get_settings', lambda: settings)
+    loggers = [logging.getLogger(), logging.getLogger('trackyai.traces')]
+    saved = [(logger.level, logger.handlers[:]) for logger in loggers]
+    setup_logging()
+    yield tmp_path / 'trackyai.log'
+    stop_logging()
+    for logger, (level, handlers) in zip(loggers, saved):
+        logger.setLevel(level)
+        logger.handlers = handlers
+
+
+def _entries(log_file):
+    stop_logging()
+    entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+    return [entry for entry in entries if entry['logger'] in ('trackyai.log', 'trackyai.test')]
+
+
+def test_records_are_written_as_json_with_context(log_file):
+    logger = logging.getLogger('trackyai.test')
+
+    async def step(number):
+        with log_context(step=number):
+            logger.info(f'step {number}')
+
+    async def session():
+        with log_context(session='abc', user_id=1):
+            await asyncio.gather(step(1), step(2))
+        logger.warning('outside')
+
+    asyncio.run(session())
+    entries = _entries(log_file)
+
+    assert entries[0]['message'] == 'Logging has been initialized'
+    assert {'message': 'step 2', 'session': 'abc', 'user_id': 1, 'step': 2}.items() <= entries[2].items()
+    assert entries[3]['level'] == 'WARNING'
+    assert 'session' not in entries[3]
+
+
+def test_lazy_arguments_are_formatted_off_the_calling_thread(log_file):
+    payload = _Payload()
+    logging.getLogger('trackyai.test').debug('completion: %s', payload)
+    entries = _entries(log_file)
+
+    assert entries[-1]['message'] == 'completion: a large payload'
+    assert payload.formatted_in is not None
+    assert payload.formatted_in != threading.current_thread().name
+
+
+def test_spans_are_written_to_their_own_file(log_file):
+    with span('session', user_id=1):
+        logging.getLogger('trackyai.test').info('inside a span')
+    entries = _entries(log_file)
+
+    (line,) = (log_file.parent / 'traces.jsonl').read_text(encoding='utf-8').splitlines()
+    assert json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['name'] == 'session'
+    assert 'resourceSpans' not in entries[-1]['message']
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+
+from trackyai import metrics_server
+from trackyai.config import Settings
+from trackyai.metrics import MetricsRegistry, metrics
+
+
+def test_registry_is_exposed_in_prometheus_format():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests\nby outcome', ['outcome']).inc(3, outcome='say "hi"')
+    registry.gauge('queue_size', 'Queued items').set(1.5)
+    histogram = registry.histogram('latency_seconds', 'Latency', ['method'], buckets=(0.1, 1))
+    histogram.observe(0.05, method='get')
+    histogram.observe(0.5, method='get')
+    histogram.observe(2, method='get')
+
+    assert registry.expose().splitlines() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{method="get",le="0.1"} 1',
+        'latency_seconds_bucket{method="get",le="1"} 2',
+        'latency_seconds_bucket{method="get",le="+Inf"} 3',
+        'latency_seconds_sum{method="get"} 2.55',
+        'latency_seconds_count{method="get"} 3',
+        '# HELP queue_size Queued items',
+        '# TYPE queue_size gauge',
+        'queue_size 1.5',
+        '# HELP requests_total Requests\\nby outcome',
+        '# TYPE requests_total counter',
+        'requests_total{outcome="say \\"hi\\""} 3',
+    ]
+
+
+def test_histogram_times_a_block():
+    histogram = MetricsRegistry().histogram('block_seconds', 'Block', buckets=(10,))
+    with histogram.time():
+        pass
+
+    (sample,) = histogram.samples().values()
+    assert sample.total == 1
+    assert sample.buckets[0] == (10, 1)
+
+
+def test_metrics_are_served(monkeypatch):
+    settings = SimpleNamespace(metrics_listen='127.0.0.1', metrics_port=0)
+    monkeypatch.setattr(metrics_server, 'get_settings', lambda: settings)
+    metrics.counter('test_served_total', 'Served in a test').inc()
+
+    async def scrape():
+        await metrics_server.start_metrics_server()
+        try:
+            assert metrics_server._runner is not None
+            host, port = metrics_server._runner.addresses[0][:2]
+            async with aiohttp.ClientSession() as session, session.get(f'http://{host}:{port}/metrics') as response:
+                return response.status, response.headers['Content-Type'], await response.text()
+        finally:
+            await metrics_server.stop_metrics_server()
+
+    status, content_type, text = asyncio.run(scrape())
+
+    assert status == 200
+    assert content_type.startswith('text/plain; version=0.0.4')
+    assert 'test_served_total 1' in text.splitlines()
+
+
+def test_empty_port_disables_the_endpoint(monkeypatch):
+    monkeypatch.setenv('TRACKYAI_METRICS_PORT', '')
+    assert Settings().metrics_port is None
+    monkeypatch.setenv('TRACKYAI_METRICS_PORT', '9100')
+    assert Settings().metrics_port == 9100
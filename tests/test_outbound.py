@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
+
+from trackyai.outbound import OutboundQueue, split_message
+
+
+def test_split_message_at_line_boundaries():
+    lines = [f'{i:04d} ' + 'x' * 95 for i in range(100)]
+    chunks = split_message('\n'.join(lines), limit=1000)
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert '\n'.join(chunks) == '\n'.join(lines)
+    assert all(chunk.split('\n')[0] in lines for chunk in chunks)
+
+
+def test_split_message_cuts_long_lines_and_counts_utf16():
+    assert split_message('a' * 25, limit=10) == ['a' * 10, 'a' * 10, 'a' * 5]
+    assert split_message('😊' * 6, limit=4) == ['😊' * 2, '😊' * 2, '😊' * 2]
+    assert split_message('short') == ['short']
+
+
+class _Bot:
+    def __init__(self, flood_chat=None):
+        self.sent = []
+        self.markups = []
+        self._flood_chat = flood_chat
+
+    async def send(self, chat_id, text, reply_markup=None):
+        if chat_id == self._flood_chat:
+            self._flood_chat = None
+            raise RetryAfter(1)
+        self.sent.append((chat_id, text, time.monotonic()))
+        self.markups.append(reply_markup)
+
+
+def test_rapid_sends_to_a_chat_are_coalesced():
+    bot = _Bot()
+
+    async def run():
+        queue = OutboundQueue(bot.send, global_rate=100, chat_rate=5, max_retries=1)
+        first = asyncio.create_task(queue.send(1, 'message 0'))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, *(queue.send(1, f'message {i}') for i in range(1, 4)))
+
+    asyncio.run(run())
+
+    # the first text goes out at once, the rest waits for the chat bucket and is sent as one message
+    assert [text for _, text, _ in bot.sent] == ['message 0', 'message 1\n\nmessage 2\n\nmessage 3']
+
+
+def test_texts_with_a_keyboard_are_not_coalesced():
+    bot = _Bot()
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton('>', callback_data='page:2')]])
+
+    async def run():
+        queue = OutboundQueue(bot.send, global_rate=100, chat_rate=5, max_retries=1)
+        first = asyncio.create_task(queue.send(1, 'message 0'))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(
+            first, queue.send(1, 'message 1'), queue.send(1, 'page 1', keyboard), queue.send(1, 'message 2')
+        )
+
+    asyncio.run(run())
+
+    # the page is edited in place later on, so it must not carry the texts queued around it
+    assert [text for _, text, _ in bot.sent] == ['message 0', 'message 1', 'page 1', 'message 2']
+    assert bot.markups == [None, None, keyboard, None]
+
+
+# constructing RetryAfter with seconds is deprecated by PTB
+@pytest.mark.filterwarnings('ignore::telegram.warnings.PTBDeprecationWarning')
+def test_flood_limited_chat_does_not_block_other_chats():
+    bot = _Bot(flood_chat=1)
+
+    async def run():
+        queue = OutboundQueue(bot.send, global_rate=100, chat_rate=100, max_retries=1)
+        started = time.monotonic()
+        await asyncio.gather(queue.send(1, 'to the flooded chat'), queue.send(2, 'to another chat'))
+        return started
+
+    started = asyncio.run(run())
+
+    sent = {chat_id: at - started for chat_id, _, at in bot.sent}
+    assert sent[2] < 0.5
+    assert sent[1] >= 1
+
+
+@pytest.mark.filterwarnings('ignore::telegram.warnings.PTBDeprecationWarning')
+def test_flood_limited_chat_outlives_its_ttl():
+    bot = _Bot(flood_chat=1)
+
+    async def run():
+        queue = OutboundQueue(bot.send, global_rate=100, chat_rate=100, max_retries=1, chat_ttl=0.1)
+        first = asyncio.create_task(queue.send(1, 'first'))
+        await asyncio.sleep(0.5)
+        await asyncio.gather(first, queue.send(1, 'second'))
+        return len(queue._chats)
+
+    # the chat waiting out the flood limit is kept, so the second text is queued behind the first one
+    assert asyncio.run(run()) == 1
+    assert [text for _, text, _ in bot.sent] == ['first', 'second']
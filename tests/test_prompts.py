@@ -0,0 +1,47 @@
+import logging
+
+from jinja2 import Environment
+
+import trackyai.agent as agent_module
+from trackyai.agent import load_system_prompt_template, render_system_prompt
+
+
+def _context(**overrides):
+    context = dict(
+        ecs=[],
+        categories=[],
+        latest_expenses=[],
+        latest_dialog=[],
+        memory='',
+        category_suggestions=[],
+        current_dt_full='Friday, May 30, 2025 16:54',
+    )
+    context.update(overrides)
+    return context
+
+
+def test_main_prompt_starts_with_static_block(caplog):
+    template = load_system_prompt_template('main')
+    static_prefix = ''.join(template.blocks['static'](template.new_context(_context())))
+    assert static_prefix.startswith('<instruction>')
+
+    with caplog.at_level(logging.WARNING):
+        first = render_system_prompt('main', **_context())
+        second = render_system_prompt('main', **_context(memory='Lives in Berlin', current_dt_full='Saturday'))
+    assert first.startswith(static_prefix)
+    assert second.startswith(static_prefix)
+    assert 'Lives in Berlin' in second
+    assert not caplog.records
+
+
+def test_variables_in_the_static_block_are_reported(monkeypatch, caplog):
+    template = Environment().from_string(
+        '{% block static %}<instruction>Today is {{ current_dt_full }}</instruction>{% endblock %}{{ memory }}'
+    )
+    monkeypatch.setattr(agent_module, 'load_system_prompt_template', lambda name: template)
+
+    with caplog.at_level(logging.WARNING):
+        render_system_prompt('leaky', **_context())
+
+    (record,) = caplog.records
+    assert 'has drifted' in record.getMessage()
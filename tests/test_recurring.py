@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from trackyai import recurring
+from trackyai.recurring import detect, detect_groups, normalize_comment, update_recurring_expenses
+
+
+def _row(id, day, comment, amount=9.99, category_id=1, currency='EUR'):
+    date = datetime.datetime(2025, 1, 5) + datetime.timedelta(days=day)
+    return SimpleNamespace(id=id, category_id=category_id, date=date, currency=currency, amount=amount, comment=comment)
+
+
+def test_comments_are_normalized():
+    assert normalize_comment('Netflix 05/2025') == normalize_comment(' netflix, #6!') == 'netflix'
+
+
+def test_regular_expenses_are_detected():
+    dates = [datetime.datetime(2025, month, 5) for month in range(1, 6)]
+
+    assert detect(dates, [9.99] * 5, min_occurrences=3) == 30.5
+    assert detect(dates[:2], [9.99] * 2, min_occurrences=3) is None
+    assert detect(dates, [9.99, 9.99, 30, 9.99, 9.99], min_occurrences=3) is None
+    assert detect([*dates[:4], datetime.datetime(2025, 4, 20)], [9.99] * 5, min_occurrences=3) is None
+
+
+def test_only_groups_of_new_expenses_are_detected():
+    history = [
+        *(_row(i, 30 * i, f'Netflix {i}') for i in range(4)),
+        *(_row(10 + i, 7 * i, 'gym', amount=20) for i in range(4)),
+        *(_row(20 + i, 30 * i, 'coffee', amount=3) for i in (0, 1, 5)),
+    ]
+    keys = {(1, 'netflix', 'EUR'), (1, 'coffee', 'EUR')}
+
+    detected, stale = detect_groups(history, keys, min_occurrences=3)
+
+    (netflix,) = detected
+    assert netflix['comment'] == 'Netflix 3'
+    assert netflix['period_days'] == 30
+    assert netflix['occurrences'] == 4
+    assert netflix['next_date'] == datetime.datetime(2025, 5, 5)
+    assert stale == [(1, 'coffee', 'EUR')]
+
+
+def _change(id, comment, category_id=1, currency='EUR'):
+    return SimpleNamespace(id=id, category_id=category_id, currency=currency, comment=comment)
+
+
+class _Service:
+    def __init__(self, history):
+        self.expenses = history
+        self.changed = []
+        self.committed_during_run = []
+        self.saved = []
+
+    async def has_run(self, job):
+        return bool(self.saved)
+
+    async def recent_groups(self, days):
+        return list(self.expenses)
+
+    async def changes(self):
+        return list(self.changed)
+
+    async def history(self, keys, days):
+        # another transaction commits while the job is running
+        self.changed.extend(self.committed_during_run)
+        self.committed_during_run = []
+        return [row for row in self.expenses if (row.category_id, normalize_comment(row.comment), row.currency) in keys]
+
+    async def save(self, job, detected, stale, changes):
+        self.changed = [row for row in self.changed if row.id not in changes]
+        self.saved.append((job, detected, stale))
+
+
+def _service(monkeypatch, history):
+    service = _Service(history)
+    monkeypatch.setattr(recurring, 'get_service_manager', lambda: SimpleNamespace(recurring=service))
+    settings = SimpleNamespace(recurring_min_occurrences=3, recurring_history_days=1000)
+    monkeypatch.setattr(recurring, 'get_settings', lambda: settings)
+    return service
+
+
+def test_first_run_detects_all_groups_and_later_runs_the_changed_ones(monkeypatch):
+    service = _service(monkeypatch, [_row(i, 30 * i, 'rent', amount=800) for i in range(1, 5)])
+
+    assert asyncio.run(update_recurring_expenses()) == 1
+    assert asyncio.run(update_recurring_expenses()) == 0
+    service.expenses.append(_row(5, 150, 'Rent', amount=800))
+    service.changed.append(_change(1, 'Rent'))
+    assert asyncio.run(update_recurring_expenses()) == 1
+
+    assert [detected[0]['occurrences'] for _, detected, _ in service.saved] == [4, 5]
+    assert service.changed == []
+
+
+def test_expenses_committed_during_a_run_are_seen_by_the_next_one(monkeypatch):
+    service = _service(monkeypatch, [_row(i, 30 * i, 'rent', amount=800) for i in range(1, 4)])
+    asyncio.run(update_recurring_expenses())
+
+    # an expense with a lower id than the last one seen commits late
+    service.expenses.insert(0, _row(0, 0, 'rent', amount=800))
+    service.committed_during_run = [_change(2, 'rent')]
+    service.changed.append(_change(1, 'rent'))
+    asyncio.run(update_recurring_expenses())
+    assert [row.id for row in service.changed] == [2]
+
+    asyncio.run(update_recurring_expenses())
+    assert service.saved[-1][1][0]['occurrences'] == 4
+    assert service.changed == []
+
+
+def test_groups_of_edited_expenses_are_detected_again(monkeypatch):
+    service = _service(monkeypatch, [_row(i, 30 * i, 'gym', amount=20) for i in range(1, 5)])
+    assert asyncio.run(update_recurring_expenses()) == 1
+
+    # the second expense was a gym bag; the change is recorded before and after the edit
+    service.expenses[1] = _row(2, 60, 'gym bag', amount=45)
+    service.changed = [_change(1, 'gym'), _change(2, 'gym bag')]
+    assert asyncio.run(update_recurring_expenses()) == 0
+
+    _, detected, stale = service.saved[-1]
+    assert detected == []
+    assert stale == [(1, 'gym', 'EUR'), (1, 'gym bag', 'EUR')]
+    assert service.changed == []
@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+
+from pydantic import BaseModel
+
+import trackyai.session as session_module
+from trackyai.agent import Chat
+from trackyai.agent.tools import Tool, ToolCall, tool_registry
+from trackyai.communication import CommunicationProxy
+from trackyai.dispatcher import UserQueue
+from trackyai.session import BUDGET_EXHAUSTED_MESSAGE, FALLBACK_MESSAGE, Session, SessionsManager
+
+
+class _Bot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append((chat_id, text))
+
+
+class _Agent:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self._delay = delay
+
+    async def think(self, chat):
+        self.calls += 1
+        await asyncio.sleep(self._delay)
+        return ToolCall(name='not_a_tool', id=f'call_{self.calls}', parameters={})
+
+
+async def _run_session(agent, user_id):
+    session = Session(user_id=user_id)
+    session._chat = Chat()
+    session._agent = agent
+    inbox = UserQueue('test', user_id)
+    inbox.put('780 coffee beans')
+    await asyncio.wait_for(session.process(inbox), timeout=5)
+    return session
+
+
+def test_session_stops_after_max_steps(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_max_steps=3, session_time_budget=60))
+    bot = _Bot()
+    CommunicationProxy.setup_proxy(bot=bot)
+    agent = _Agent()
+
+    session = asyncio.run(_run_session(agent, user_id=1))
+
+    assert agent.calls == 3
+    assert [step.outcome for step in session.steps] == ['retry'] * 3
+    assert bot.messages == [(1, FALLBACK_MESSAGE)]
+    assert session.done()
+
+
+def test_session_stops_when_time_budget_is_exhausted(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_max_steps=100, session_time_budget=0.2))
+    bot = _Bot()
+    CommunicationProxy.setup_proxy(bot=bot)
+    agent = _Agent(delay=0.08)
+
+    session = asyncio.run(_run_session(agent, user_id=2))
+
+    assert agent.calls == 3
+    assert len(session.steps) == 2
+    assert bot.messages == [(2, FALLBACK_MESSAGE)]
+
+
+def test_session_stops_when_time_budget_is_exhausted_by_a_tool(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_max_steps=100, session_time_budget=0.2))
+    bot = _Bot()
+    CommunicationProxy.setup_proxy(bot=bot)
+
+    async def slow_tool():
+        await asyncio.sleep(0.15)
+
+    tool = Tool(
+        name='slow_tool',
+        awaitable=slow_tool,
+        description='Takes its time',
+        arguments=[],
+        arguments_model=BaseModel,
+        terminating=False,
+        scopes=('test',),
+    )
+    monkeypatch.setitem(tool_registry._available_tools, 'slow_tool', tool)
+
+    class _Caller:
+        async def think(self, chat):
+            return ToolCall(name='slow_tool', id='call_1', parameters={})
+
+    session = asyncio.run(_run_session(_Caller(), user_id=2))
+
+    assert [step.outcome for step in session.steps] == ['tool_result']
+    assert bot.messages == [(2, FALLBACK_MESSAGE)]
+
+
+def test_failed_completions_are_retried_until_max_steps(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_max_steps=3, session_time_budget=60))
+    bot = _Bot()
+    CommunicationProxy.setup_proxy(bot=bot)
+
+    class _Failing:
+        async def think(self, chat):
+            raise KeyError('not_a_tool')
+
+    session = asyncio.run(_run_session(_Failing(), user_id=1))
+
+    assert [(step.decision, step.outcome) for step in session.steps] == [('none', 'retry')] * 3
+    assert bot.messages == [(1, FALLBACK_MESSAGE)]
+    assert session.done()
+
+
+def test_session_is_refused_over_the_monthly_budget(monkeypatch):
+    accounting = SimpleNamespace(budget=lambda user_id: asyncio.sleep(0, 'exhausted'))
+    monkeypatch.setattr(session_module, 'get_usage_accounting', lambda: accounting)
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_max_steps=3, session_time_budget=60))
+    bot = _Bot()
+    CommunicationProxy.setup_proxy(bot=bot)
+    agent = _Agent()
+
+    session = asyncio.run(_run_session(agent, user_id=1))
+
+    assert agent.calls == 0
+    assert bot.messages == [(1, BUDGET_EXHAUSTED_MESSAGE)]
+    assert session.done()
+
+
+def test_session_takes_the_fast_path_over_the_daily_budget(monkeypatch):
+    accounting = SimpleNamespace(budget=lambda user_id: asyncio.sleep(0, 'fast_path'))
+    monkeypatch.setattr(session_module, 'get_usage_accounting', lambda: accounting)
+    settings = SimpleNamespace(session_max_steps=10, session_time_budget=60, usage_fast_path_max_steps=2)
+    monkeypatch.setattr(session_module, 'get_settings', lambda: settings)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+    agent = _Agent()
+
+    asyncio.run(_run_session(agent, user_id=2))
+
+    assert agent.calls == 2
+
+
+def test_session_waiting_for_the_user_is_evicted_after_its_ttl(monkeypatch):
+    settings = SimpleNamespace(
+        max_sessions=10,
+        session_idle_ttl=0.05,
+        session_max_steps=3,
+        session_time_budget=60,
+        dispatcher_workers=1,
+        dispatcher_busy_threshold=1,
+        dispatcher_max_user_messages=10,
+    )
+    monkeypatch.setattr(session_module, 'get_settings', lambda: settings)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+
+    class _Asker:
+        async def think(self, chat):
+            return ToolCall(name='ask_user', id='call_1', parameters={'message': 'Which currency?'})
+
+    async def run():
+        manager = SessionsManager()
+        session = manager.sessions[3] = await _run_session(_Asker(), user_id=3)
+        assert 3 in manager.sessions
+        await asyncio.sleep(0.1)
+        return manager, session
+
+    manager, session = asyncio.run(run())
+
+    assert [step.outcome for step in session.steps] == ['asked_user']
+    assert manager.sessions.get(3) is None
+    assert session.done()
@@ -0,0 +1,285 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import trackyai.session as session_module
+from trackyai.agent import Chat
+from trackyai.agent.tools import ToolCall, ToolResult
+from trackyai.communication import CommunicationProxy
+from trackyai.config import get_settings
+from trackyai.db.model import Base
+from trackyai.dispatcher import UserQueue
+from trackyai.session import Session
+from trackyai.session_store import PostgresSessionStore, SessionState
+
+
+class _Lock:
+    def __init__(self, store, user_id):
+        self._store = store
+        self._user_id = user_id
+
+    async def release(self):
+        self._store.locked.discard(self._user_id)
+
+
+class _Store:
+    def __init__(self):
+        self.states = {}
+        self.pending = {}
+        self.locked = set()
+
+    async def try_lock(self, user_id):
+        if user_id in self.locked:
+            return None
+        self.locked.add(user_id)
+        return _Lock(self, user_id)
+
+    async def load(self, user_id):
+        return self.states.get(user_id)
+
+    async def save(self, state):
+        self.states[state.user_id] = state
+
+    async def push_message(self, user_id, message):
+        self.pending.setdefault(user_id, []).append(message)
+
+    async def take_pending(self, user_id):
+        return self.pending.pop(user_id, [])
+
+    async def has_pending(self, user_id):
+        return bool(self.pending.get(user_id))
+
+    async def finish(self, user_id):
+        self.states.pop(user_id, None)
+
+    async def user_ids(self):
+        return list(self.states)
+
+
+class _Agent:
+    system_prompt = 'system prompt'
+
+    def __init__(self, decisions):
+        self._decisions = list(decisions)
+
+    async def think(self, chat):
+        return self._decisions.pop(0)
+
+
+class _Bot:
+    async def send_message(self, chat_id, text, **kwargs):
+        pass
+
+
+async def _save_history(self):
+    pass
+
+
+def _init_agent(decisions):
+    async def init_agent(self):
+        self._chat = Chat()
+        self._agent = _Agent(decisions)
+
+    return init_agent
+
+
+def _settings():
+    return SimpleNamespace(session_max_steps=10, session_time_budget=60, completion_service='stub', tool_selection=False)
+
+
+def test_chat_dump_and_load():
+    chat = Chat()
+    chat.add_user_message('780 coffee beans')
+    tool_call = ToolCall(name='find_expenses', id='call_1', parameters={'date_from': datetime.datetime(2025, 5, 30)})
+    chat.add_tool_call(tool_call)
+    chat.add_tool_result(ToolResult(tool_call=tool_call, result=['a', 'b']))
+    chat.add_agent_message('Which one?')
+
+    restored = Chat.load(chat.dump())
+
+    assert restored.dump() == chat.dump()
+    assert [type(turn) for turn in restored] == [type(turn) for turn in chat]
+    assert list(restored)[2].result == "['a', 'b']"
+
+
+def test_session_checkpoints_and_releases_while_waiting_for_user(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', _settings)
+    monkeypatch.setattr(CommunicationProxy, 'save_history', _save_history)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+    store = _Store()
+    ask = ToolCall(name='ask_user', id='call_1', parameters={'message': 'Which currency?'})
+
+    monkeypatch.setattr(Session, '_init_agent', _init_agent([ask]))
+
+    async def run():
+        await store.push_message(10, '780 coffee beans')
+        session = Session(user_id=10, store=store)
+        await asyncio.wait_for(session.process(UserQueue('test', 10)), timeout=5)
+        return session
+
+    session = asyncio.run(run())
+
+    assert not session.done()
+    assert store.locked == set()
+    state = store.states[10]
+    assert [turn['type'] for turn in state.chat] == ['text', 'text']
+    assert state.chat[-1]['content'] == 'Which currency?'
+    assert [step['outcome'] for step in state.steps] == ['asked_user']
+
+
+def test_session_resumes_from_checkpoint(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', _settings)
+    monkeypatch.setattr(CommunicationProxy, 'save_history', _save_history)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+    store = _Store()
+    chat = Chat()
+    chat.add_user_message('780 coffee beans')
+    chat.add_agent_message('Which currency?')
+    store.states[11] = SessionState(
+        user_id=11, system_prompt='system prompt', chat=chat.dump(), user_messages=[], steps=[], time_left=30
+    )
+
+    finish = _Agent([ToolCall(name='finish', id='call_2', parameters={})])
+    monkeypatch.setattr(Session, '_make_agent', lambda self, system_prompt: finish)
+
+    async def run():
+        await store.push_message(11, 'EUR')
+        session = Session(user_id=11, store=store)
+        await asyncio.wait_for(session.process(UserQueue('test', 11)), timeout=5)
+        return session
+
+    session = asyncio.run(run())
+
+    assert session.done()
+    assert [step.outcome for step in session.steps] == ['terminated']
+    assert session._time_left < 30
+    assert 11 not in store.states
+    assert store.locked == set()
+
+
+def test_jobs_of_a_session_share_its_id_and_start(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', _settings)
+    monkeypatch.setattr(CommunicationProxy, 'save_history', _save_history)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+    store = _Store()
+    ask = ToolCall(name='ask_user', id='call_1', parameters={'message': 'Which currency?'})
+    monkeypatch.setattr(Session, '_init_agent', _init_agent([ask]))
+    finish = _Agent([ToolCall(name='finish', id='call_2', parameters={})])
+    monkeypatch.setattr(Session, '_make_agent', lambda self, system_prompt: finish)
+
+    async def run():
+        sessions = []
+        for message in ('780 coffee beans', 'EUR'):
+            await store.push_message(14, message)
+            sessions.append(Session(user_id=14, store=store))
+            await asyncio.wait_for(sessions[-1].process(UserQueue('test', 14)), timeout=5)
+        return sessions
+
+    first, second = asyncio.run(run())
+
+    assert second.done()
+    assert (second._id, second._started_at) == (first._id, first._started_at)
+
+
+def test_messages_taken_before_the_first_step_survive_a_crash(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', _settings)
+    monkeypatch.setattr(CommunicationProxy, 'save_history', _save_history)
+    CommunicationProxy.setup_proxy(bot=_Bot())
+    store = _Store()
+    # the crashed worker had taken the first message, but had not checkpointed a chat yet
+    store.states[13] = SessionState(
+        user_id=13, system_prompt='', chat=[], user_messages=['780 coffee beans'], steps=[], time_left=None
+    )
+    ask = ToolCall(name='ask_user', id='call_1', parameters={'message': 'Which currency?'})
+    monkeypatch.setattr(Session, '_init_agent', _init_agent([ask]))
+
+    async def run():
+        await store.push_message(13, 'for the office')
+        session = Session(user_id=13, store=store)
+        await asyncio.wait_for(session.process(UserQueue('test', 13)), timeout=5)
+
+    asyncio.run(run())
+
+    assert store.states[13].chat[0]['content'] == '780 coffee beans\nfor the office'
+
+
+def test_session_locked_by_another_worker_is_handed_over(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', _settings)
+    store = _Store()
+
+    async def run():
+        await store.try_lock(12)
+        await store.push_message(12, '780 coffee beans')
+        inbox = UserQueue('test', 12)
+        inbox.put(None)
+        session = Session(user_id=12, store=store)
+        await session.process(inbox)
+        return session, inbox
+
+    session, inbox = asyncio.run(run())
+
+    assert session.steps == ()
+    assert len(inbox) == 0
+    assert store.pending[12] == ['780 coffee beans']
+
+
+def test_postgres_session_store():
+    user_id = 999_000_001
+
+    async def run():
+        engine = create_async_engine(get_settings().db_uri)
+        store = PostgresSessionStore(engine)
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+            await store.take_pending(user_id)
+            await store.finish(user_id)
+
+            lock = await store.try_lock(user_id)
+            assert lock is not None
+            assert await store.try_lock(user_id) is None
+            await lock.release()
+            lock = await store.try_lock(user_id)
+            assert lock is not None
+            await lock.release()
+
+            await store.push_message(user_id, '780 coffee beans')
+            await store.push_message(user_id, 'EUR')
+            assert await store.has_pending(user_id)
+            assert await store.take_pending(user_id) == ['780 coffee beans', 'EUR']
+            assert await store.take_pending(user_id) == []
+            assert (await store.load(user_id)).user_messages == ['780 coffee beans', 'EUR']
+
+            state = SessionState(
+                user_id=user_id,
+                system_prompt='system prompt',
+                chat=[{'type': 'text', 'role': 'user', 'content': '780 coffee beans'}],
+                user_messages=[],
+                steps=[],
+                time_left=30,
+                session_id='a' * 32,
+                started_at=1.5,
+            )
+            await store.save(state)
+            assert await store.load(user_id) == state
+            assert user_id in await store.user_ids()
+
+            # a message that arrives while finishing starts the next session
+            await store.push_message(user_id, 'and 5 more')
+            await store.finish(user_id)
+            restarted = await store.load(user_id)
+            assert (restarted.chat, restarted.session_id) == ([], None)
+            assert await store.take_pending(user_id) == ['and 5 more']
+            await store.finish(user_id)
+            assert await store.load(user_id) is None
+        finally:
+            await store.close()
+            await engine.dispose()
+
+    try:
+        asyncio.run(run())
+    except OSError as e:
+        pytest.skip(f'Postgres is not reachable: {e}')
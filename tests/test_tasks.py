@@ -0,0 +1,54 @@
+import asyncio
+import logging
+
+from trackyai.dispatcher import Dispatcher, UserQueue
+from trackyai.tasks import TaskSupervisor
+
+
+def test_supervisor_logs_failures_and_drains_within_deadline(caplog):
+    supervisor = TaskSupervisor()
+    finished = []
+
+    async def work(delay: float) -> None:
+        await asyncio.sleep(delay)
+        finished.append(delay)
+
+    async def fail() -> None:
+        raise RuntimeError('boom')
+
+    async def run() -> list[asyncio.Task]:
+        tasks = [
+            supervisor.spawn(work(0.01), name='short'),
+            supervisor.spawn(work(10), name='long'),
+            supervisor.spawn(fail(), name='failing'),
+        ]
+        await supervisor.drain(timeout=0.2)
+        return tasks
+
+    with caplog.at_level(logging.WARNING, logger='trackyai.tasks'):
+        short, long, failing = asyncio.run(run())
+
+    assert finished == [0.01]
+    assert long.cancelled()
+    assert len(supervisor) == 0
+    assert 'Background task failing failed' in caplog.text
+    assert 'Background task long was cancelled' in caplog.text
+
+
+def test_dispatcher_close_finishes_queued_jobs():
+    processed = []
+
+    async def job(inbox: UserQueue) -> None:
+        await asyncio.sleep(0.01)
+        processed.extend(inbox.take())
+
+    async def run() -> None:
+        dispatcher = Dispatcher('test-close', job, workers=1, busy_threshold=100, max_user_messages=10)
+        for user_id in range(3):
+            dispatcher.submit(user_id, str(user_id))
+        await dispatcher.close(timeout=5)
+        dispatcher.submit(4, 'late')
+
+    asyncio.run(run())
+
+    assert processed == ['0', '1', '2']
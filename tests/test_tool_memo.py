@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Annotated
+
+import pytest
+
+import trackyai.session as session_module
+from trackyai.agent.tools import ToolCall, tool, tool_registry
+from trackyai.agent.tools.memo import ToolMemo, _requests
+from trackyai.session import Session
+
+_calls = []
+
+
+@tool(pure=True, reads=('memo_test',))
+async def memo_test_read(limit: Annotated[int, 'a limit']) -> str:
+    """ reads """
+    _calls.append(limit)
+    return f'{limit} rows, version {len(_calls)}'
+
+
+@tool(writes=('memo_test',))
+async def memo_test_write() -> str:
+    """ writes """
+    return 'written'
+
+
+def _call(session, name, **parameters):
+    return asyncio.run(session._make_toolcall(ToolCall(name=name, id=f'call_{name}', parameters=parameters)))
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(session_module, 'get_settings', lambda: SimpleNamespace(session_time_budget=60))
+    monkeypatch.setattr(session_module, 'get_tool_memo', lambda memo=ToolMemo(max_size=10, ttl=60): memo)
+    _calls.clear()
+    return Session(user_id=1)
+
+
+def test_pure_tool_results_are_reused(session):
+    hits = _requests.value(tool='memo_test_read', outcome='hit')
+
+    first = _call(session, 'memo_test_read', limit=5)
+    second = _call(Session(user_id=2), 'memo_test_read', limit=5)
+    other = _call(session, 'memo_test_read', limit=10)
+
+    assert _calls == [5, 10]
+    assert second.result == first.result
+    assert second.tool_call.id == 'call_memo_test_read'
+    assert other.result == '10 rows, version 2'
+    assert _requests.value(tool='memo_test_read', outcome='hit') == hits + 1
+
+
+def test_writes_invalidate_results_of_read_tables(session):
+    _call(session, 'memo_test_read', limit=5)
+    _call(session, 'memo_test_write')
+    result = _call(session, 'memo_test_read', limit=5)
+
+    assert _calls == [5, 5]
+    assert result.result == '5 rows, version 2'
+
+
+def test_pure_tools_cannot_write():
+    with pytest.raises(ValueError):
+        @tool(pure=True, writes=('memo_test',))
+        async def memo_test_invalid() -> str:
+            return ''
+
+    assert 'memo_test_invalid' not in tool_registry
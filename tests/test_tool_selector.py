@@ -0,0 +1,35 @@
+from trackyai.agent import Chat, ToolSelector
+from trackyai.agent.tools import ToolCall, ToolResult, tool_registry
+
+
+def _names(chat: Chat) -> list[str]:
+    return [tool.name for tool in ToolSelector().select(chat, list(tool_registry.get('main')))]
+
+
+def test_select_by_keywords():
+    chat = Chat()
+    chat.add_user_message('780 coffee beans')
+    names = _names(chat)
+    assert 'add_expense' in names
+    assert 'ask_user' in names
+    assert 'finish_session_with_reply' in names
+    assert 'send_system_configurations' not in names
+
+
+def test_select_follow_ups_of_called_tools():
+    chat = Chat()
+    chat.add_user_message('hmm')
+    tool_call = ToolCall(name='find_expenses', id='call_1', parameters={})
+    chat.add_tool_call(tool_call)
+    chat.add_tool_result(ToolResult(tool_call=tool_call, result='Expenses:'))
+    names = _names(chat)
+    assert 'find_expenses' in names
+    assert 'send_expenses_list' in names
+    assert 'send_expense_single' in names
+    assert 'add_category' not in names
+
+
+def test_select_everything_without_matches():
+    chat = Chat()
+    chat.add_user_message('hmm')
+    assert _names(chat) == [tool.name for tool in tool_registry.get('main')]
@@ -1,7 +1,15 @@
-from typing import Annotated
+import asyncio
+import datetime
+from types import SimpleNamespace
+from typing import Annotated, Literal
 
-from trackyai.agent.tools import tool_registry, tool
 import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from trackyai.agent.completion_services.openai import _strict_schema
+from trackyai.agent.tools import SendTextMessage, crud, tool_registry, tool
+from trackyai.config import get_settings
+from trackyai.db.service import ExpenseService
 
 
 def test_registry():
@@ -57,3 +65,94 @@ def test_registry():
         @tool
         def test_h(a: Annotated[int, 'a description']):
             return a
+
+
+def test_arguments_are_validated_at_once():
+    @tool
+    async def test_arguments(
+        when: Annotated[datetime.datetime, 'a datetime'],
+        ids: Annotated[list[int], 'a list of ids'],
+        kind: Annotated[Literal['csv', 'xlsx'], 'an enum'] = 'csv',
+        comment: Annotated[str | None, 'an optional comment'] = None,
+    ):
+        """ function description """
+
+    t = tool_registry[test_arguments]
+    assert [a.type for a in t.arguments] == ['datetime', 'list[int]', "Literal['csv', 'xlsx']", 'str | None']
+    assert t.parse_arguments('{"when": "2025-05-30T16:54:43", "ids": [1, "2"], "kind": "xlsx", "comment": null}') == {
+        'when': datetime.datetime(2025, 5, 30, 16, 54, 43),
+        'ids': [1, 2],
+        'kind': 'xlsx',
+        'comment': None,
+    }
+    assert t.parse_arguments({'when': '2025-05-30 16:54:43', 'ids': []})['kind'] == 'csv'
+
+    for arguments in (
+        '{"when": "yesterday", "ids": []}',
+        '{"when": "2025-05-30T16:54:43", "ids": [], "kind": "pdf"}',
+        '{"when": "2025-05-30T16:54:43", "ids": [], "unknown": 1}',
+        '{"ids": []}',
+    ):
+        with pytest.raises(ValueError):
+            t.parse_arguments(arguments)
+
+    schema = _strict_schema(t.arguments_schema())
+    assert schema['required'] == ['when', 'ids', 'kind', 'comment']
+    assert schema['additionalProperties'] is False
+    assert schema['properties']['kind'] == {'description': 'an enum', 'enum': ['csv', 'xlsx'], 'type': 'string'}
+    assert schema['properties']['comment']['anyOf'] == [{'type': 'string'}, {'type': 'null'}]
+
+    class Unsupported:
+        pass
+
+    with pytest.raises(ValueError):
+        @tool
+        async def test_unsupported(a: Annotated[Unsupported, 'a description']):
+            return a
+
+
+def test_expenses_over_a_budget_are_followed_by_an_alert(monkeypatch):
+    category = SimpleNamespace(name='Dining out')
+    expense = SimpleNamespace(
+        id=1, category_id=2, category=category, date=datetime.datetime(2025, 5, 10), currency='EUR', amount=50, comment=''
+    )
+    budget = SimpleNamespace(
+        category=category, period='month', amount=100, spent=120, currency='EUR', period_start=datetime.datetime(2025, 5, 1)
+    )
+    exceeded = []
+
+    async def add(**kwargs):
+        return expense, exceeded
+
+    monkeypatch.setattr(crud, 'get_service_manager', lambda: SimpleNamespace(expense=SimpleNamespace(add=add)))
+
+    reply = asyncio.run(crud.add_expense(category_id=2, currency='EUR', amount=50))
+    assert isinstance(reply, SendTextMessage)
+
+    exceeded.append(budget)
+    reply = asyncio.run(crud.add_expense(category_id=2, currency='EUR', amount=50))
+    first, alert = reply.actions
+    assert first.text.startswith('Added a new expense')
+    assert alert.text == (
+        '⚠️ The monthly budget of 100 EUR for Dining out is exceeded: 120 EUR spent since 2025-05-01.'
+    )
+
+
+def test_datetimes_with_an_offset_are_bound_as_naive_utc():
+    arguments = tool_registry['find_expenses'].parse_arguments(
+        '{"date_from": "2025-05-01T00:00:00Z", "date_to": "2025-05-31T23:59:59+02:00", "limit": 1}'
+    )
+    assert arguments['date_from'] == datetime.datetime(2025, 5, 1)
+    assert arguments['date_to'] == datetime.datetime(2025, 5, 31, 21, 59, 59)
+
+    async def find():
+        engine = create_async_engine(get_settings().db_uri)
+        try:
+            return await ExpenseService(engine).find(date_from=arguments['date_from'], date_to=arguments['date_to'])
+        finally:
+            await engine.dispose()
+
+    try:
+        asyncio.run(find())
+    except OSError as e:
+        pytest.skip(f'Postgres is not available: {e}')
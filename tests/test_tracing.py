@@ -0,0 +1,76 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from trackyai import tracing
+from trackyai.tracing import instrument_engine, span
+
+
+class _Spans(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.spans = []
+
+    def emit(self, record):
+        (resource_spans,) = json.loads(record.getMessage())['resourceSpans']
+        self.spans.extend(resource_spans['scopeSpans'][0]['spans'])
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    handler = _Spans()
+    monkeypatch.setattr(tracing._exporter, 'level', logging.INFO)
+    monkeypatch.setattr(tracing._exporter, 'handlers', [handler])
+    tracing._exporter.manager._clear_cache()
+    yield handler.spans
+    tracing._exporter.manager._clear_cache()
+
+
+def test_spans_are_nested_within_a_trace(exported):
+    with span('session', 'a' * 32, user_id=1):
+        with span('agent_step', step=1) as step:
+            step.set(decision='add_expense')
+        with pytest.raises(ValueError), span('tool_call', tool='add_expense'):
+            raise ValueError('no category')
+
+    step, tool_call, session = exported
+    assert {s['traceId'] for s in exported} == {'a' * 32}
+    assert 'parentSpanId' not in session
+    assert step['parentSpanId'] == tool_call['parentSpanId'] == session['spanId']
+    assert step['attributes'] == [
+        {'key': 'step', 'value': {'intValue': '1'}},
+        {'key': 'decision', 'value': {'stringValue': 'add_expense'}},
+    ]
+    assert step['status'] == {'code': 1}
+    assert tool_call['status'] == {'code': 2, 'message': "ValueError('no category')"}
+    assert int(session['startTimeUnixNano']) <= int(step['startTimeUnixNano']) <= int(session['endTimeUnixNano'])
+
+
+def test_spans_are_not_created_while_tracing_is_disabled(monkeypatch):
+    monkeypatch.setattr(tracing._exporter, 'level', logging.WARNING)
+    tracing._exporter.manager._clear_cache()
+
+    with span('session') as disabled:
+        disabled.set(user_id=1)
+
+    assert disabled is tracing._NO_SPAN
+
+
+def test_statements_are_traced_and_slow_ones_logged(exported, caplog):
+    engine = create_engine('sqlite://')
+    instrument_engine(SimpleNamespace(sync_engine=engine), slow_query_seconds=0)
+
+    with caplog.at_level(logging.WARNING, logger='trackyai.db.slow_queries'), span('session'):
+        with engine.connect() as connection:
+            connection.execute(text('SELECT :value'), {'value': 42})
+
+    statement, session = exported
+    assert statement['name'] == 'db.statement'
+    assert statement['parentSpanId'] == session['spanId']
+    assert {'key': 'db.statement', 'value': {'stringValue': 'SELECT ?'}} in statement['attributes']
+    (slow_query,) = caplog.records
+    assert 'SELECT ?' in slow_query.getMessage()
+    assert '42' in slow_query.getMessage()
@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+
+from telegram import Chat, Message, Update, User
+
+from trackyai.update_processor import PerUserUpdateProcessor
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name='user', is_bot=False)
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(tz=datetime.UTC),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=user,
+        text='hi',
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_updates_of_a_user_are_ordered_and_users_are_concurrent():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=16)
+    processed: list[tuple[int, int]] = []
+    running = 0
+    max_running = 0
+
+    async def handle(update_id: int, user_id: int, delay: float) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(delay)
+        processed.append((user_id, update_id))
+        running -= 1
+
+    async def run() -> None:
+        tasks = []
+        for update_id in range(12):
+            user_id = update_id % 3
+            # earlier updates take longer, so they would finish last without ordering
+            coroutine = handle(update_id, user_id, delay=0.01 * (12 - update_id))
+            tasks.append(asyncio.create_task(processor.process_update(_update(update_id, user_id), coroutine)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    for user_id in range(3):
+        assert [update_id for user, update_id in processed if user == user_id] == list(range(user_id, 12, 3))
+    assert max_running == 3
+    assert processor._locks == {}
+
+
+def test_queued_updates_of_a_user_do_not_hold_slots():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    processed: list[tuple[int, int]] = []
+
+    async def handle(update_id: int, user_id: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        processed.append((user_id, update_id))
+
+    async def run() -> None:
+        tasks = [
+            asyncio.create_task(processor.process_update(_update(update_id, 1), handle(update_id, 1, delay=0.05)))
+            for update_id in range(5)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(_update(5, 2), handle(5, 2, delay=0.01))))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert processed[0] == (2, 5)
+    assert [update_id for user, update_id in processed if user == 1] == list(range(5))
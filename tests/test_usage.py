@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import trackyai.usage as usage_module
+from trackyai.usage import UsageAccounting, UsageTotals, usage_owner
+
+
+class _UsageService:
+    def __init__(self, today=UsageTotals(), month=UsageTotals()):
+        self.batches = []
+        self.totals_read = 0
+        self._totals = today, month
+
+    async def add_many(self, records):
+        self.batches.append(records)
+
+    async def totals(self, user_id, day_start, month_start):
+        self.totals_read += 1
+        return self._totals
+
+
+def _accounting(monkeypatch, service, **kwargs):
+    monkeypatch.setattr(usage_module, 'get_service_manager', lambda: SimpleNamespace(usage=service))
+    options = dict(batch_size=2, flush_interval=60, daily_budget=None, monthly_budget=None, max_users=10, totals_ttl=60)
+    return UsageAccounting(**{**options, **kwargs})
+
+
+def _record(accounting, cost=0.01):
+    accounting.record(model='m', prompt_tokens=100, cached_tokens=50, completion_tokens=10, cost=cost, latency=0.5)
+
+
+def test_usage_is_written_in_batches(monkeypatch):
+    service = _UsageService()
+    accounting = _accounting(monkeypatch, service)
+
+    async def main():
+        _record(accounting)
+        with usage_owner(1, 'session-a'):
+            _record(accounting)
+            await asyncio.sleep(0)
+            assert service.batches == []
+            _record(accounting)
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+
+    (batch,) = service.batches
+    assert [(record['user_id'], record['session'], record['cached_tokens']) for record in batch] == [
+        (1, 'session-a', 50),
+        (1, 'session-a', 50),
+    ]
+
+
+def test_budgets_are_checked_against_running_totals(monkeypatch):
+    service = _UsageService(today=UsageTotals(3, 300, 0, 30, 0.095), month=UsageTotals(30, 3000, 0, 300, 0.985))
+    accounting = _accounting(monkeypatch, service, daily_budget=0.1, monthly_budget=1)
+
+    async def main():
+        states = [await accounting.budget(1)]
+        with usage_owner(1, 'session-a'):
+            _record(accounting)
+            states.append(await accounting.budget(1))
+            _record(accounting)
+            states.append(await accounting.budget(1))
+        return states
+
+    assert asyncio.run(main()) == ['ok', 'fast_path', 'exhausted']
+    assert service.totals_read == 1
+
@@ -0,0 +1,66 @@
+import asyncio
+import itertools
+
+from trackyai import warmup
+from trackyai.agent import load_system_prompt_template
+from trackyai.agent.completion_services.stub import Stub
+from trackyai.agent.tools.crud import _load_template
+from trackyai.warmup import StartupTimeline
+
+
+def test_timeline_reports_stages_with_offsets():
+    ticks = itertools.count()
+    timeline = StartupTimeline(clock=lambda: float(next(ticks)))
+    with timeline.stage('templates'):
+        pass
+    with timeline.stage('db_connections'):
+        pass
+
+    report = timeline.report()
+
+    assert timeline.stages == [('templates', 1.0, 1.0), ('db_connections', 3.0, 1.0)]
+    assert report.splitlines()[0] == 'Ready in 5.000s:'
+    assert 'templates' in report.splitlines()[1]
+
+
+class _FailingServiceManager:
+    async def warm_up(self):
+        raise ConnectionRefusedError('no database')
+
+
+def test_warm_up_survives_unavailable_connections(monkeypatch):
+    timeline = StartupTimeline()
+    monkeypatch.setattr(warmup, 'startup', timeline)
+    monkeypatch.setattr(warmup, 'get_service_manager', _FailingServiceManager)
+    monkeypatch.setattr(warmup, 'get_completion_service', lambda name: Stub())
+    load_system_prompt_template.cache_clear()
+    _load_template.cache_clear()
+
+    asyncio.run(warmup.warm_up())
+
+    assert [name for name, _, _ in timeline.stages] == [
+        'templates',
+        'tool_selection',
+        'db_connections',
+        'completion_service',
+    ]
+    assert load_system_prompt_template.cache_info().currsize >= 1
+    assert _load_template.cache_info().currsize >= 10
+
+
+class _UnreachableProvider(Stub):
+    async def warm_up(self, tools):
+        await asyncio.sleep(60)
+
+
+def test_warm_up_gives_up_on_an_unreachable_provider(monkeypatch):
+    timeline = StartupTimeline()
+    monkeypatch.setattr(warmup, 'startup', timeline)
+    monkeypatch.setattr(warmup, 'get_service_manager', _FailingServiceManager)
+    monkeypatch.setattr(warmup, 'get_completion_service', lambda name: _UnreachableProvider())
+    monkeypatch.setattr(warmup, 'COMPLETION_SERVICE_TIMEOUT', 0.05)
+
+    asyncio.run(asyncio.wait_for(warmup.warm_up(), timeout=5))
+
+    assert timeline.stages[-1][0] == 'completion_service'
+    assert timeline.stages[-1][2] < 1
@@ -1,12 +1,13 @@
 import logging
 from functools import cache
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import Any, Iterable, Sequence
 
-from jinja2 import Environment, FileSystemLoader, Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 
 from trackyai.agent.chat import Chat, TextMessage
 from trackyai.agent.completion_services import CompletionService, get_completion_service
+from trackyai.agent.tool_selector import ToolSelector
 from trackyai.agent.tools import (
     SendTextMessage,
     TgAction,
@@ -20,16 +21,22 @@ from trackyai.agent.tools import (
 
 logger = logging.getLogger(__name__)
 
-_jinja_env = Environment(loader=FileSystemLoader(searchpath=Path(__file__).parent / 'prompt_templates'))
+_jinja_env = Environment(
+    loader=FileSystemLoader(searchpath=Path(__file__).parent / 'prompt_templates'),
+    bytecode_cache=FileSystemBytecodeCache(),
+)
 
 
 __all__ = [
     'Agent',
     'load_system_prompt_template',
+    'precompile_system_prompt_templates',
+    'render_system_prompt',
     'TextMessage',
     'Chat',
     'get_completion_service',
     'CompletionService',
+    'ToolSelector',
     'Tool',
     'ToolArgument',
     'ToolCall',
@@ -47,13 +54,55 @@ def load_system_prompt_template(template_name: str) -> Template:
     return _jinja_env.get_template(template_name + '.jinja2')
 
 
+def precompile_system_prompt_templates() -> int:
+    names = [name.removesuffix('.jinja2') for name in _jinja_env.list_templates(extensions=['jinja2'])]
+    for name in names:
+        load_system_prompt_template(name)
+    return len(names)
+
+
+@cache
+def _bare_static_block(template: Template) -> str:
+    # the static block as rendered without any variables, once per template
+    return ''.join(template.blocks['static'](template.new_context({})))
+
+
+def render_system_prompt(template_name: str, **context: Any) -> str:
+    template = load_system_prompt_template(template_name)
+    system_prompt = template.render(**context)
+    if 'static' not in template.blocks:
+        return system_prompt
+
+    # the static block is the prefix cached by completion providers, it must be byte-identical across sessions and
+    # users; a variable leaking into it makes it differ from the block rendered without variables
+    static_prefix = ''.join(template.blocks['static'](template.new_context(context)))
+    if static_prefix != _bare_static_block(template):
+        logger.warning(
+            f'The static prefix of the "{template_name}" system prompt has drifted: it depends on the variables. '
+            'Provider-side prompt caching is not effective while it changes.'
+        )
+    if not system_prompt.startswith(static_prefix):
+        logger.warning(f'The static block of the "{template_name}" system prompt is not its prefix')
+    return system_prompt
+
+
 class Agent:
-    def __init__(self, system_prompt: str, tools: Iterable[Tool], completion_service: CompletionService):
+    def __init__(
+        self,
+        system_prompt: str,
+        tools: Iterable[Tool],
+        completion_service: CompletionService,
+        tool_selector: ToolSelector | None = None,
+    ):
         self._system_prompt = system_prompt
         self._tools: Sequence[Tool] = list(tools)
         self._completion_service = completion_service
+        self._tool_selector = tool_selector
+
+    @property
+    def system_prompt(self) -> str:
+        return self._system_prompt
 
     async def think(self, chat: Chat) -> ToolCall:
-        return await self._completion_service.infer_toolcall(
-            system_prompt=self._system_prompt, chat=chat, tools=self._tools
-        )
+        tools = self._tools if self._tool_selector is None else self._tool_selector.select(chat, self._tools)
+        return await self._completion_service.infer_toolcall(system_prompt=self._system_prompt, chat=chat, tools=tools)
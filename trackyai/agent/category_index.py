@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import math
+import re
+from collections import Counter
+
+from pydantic import BaseModel
+
+from trackyai.db import get_service_manager
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r'[^\W\d_]+')
+_NGRAM_SIZE = 3
+
+
+def _ngrams(text: str) -> Counter[str]:
+    grams: Counter[str] = Counter()
+    for word in _WORD_PATTERN.findall(text.lower()):
+        padded = f' {word} '
+        grams.update(padded[i : i + _NGRAM_SIZE] for i in range(len(padded) - _NGRAM_SIZE + 1))
+    return grams
+
+
+class CategorySuggestion(BaseModel, frozen=True):
+    category_id: int
+    name: str
+    score: float
+
+
+# TF-IDF index over character trigrams. Every category is a single document made of its name, description and
+# comments of its expenses. Updates are incremental: a category or an expense replaces its previous contribution.
+class CategoryIndex:
+    def __init__(self) -> None:
+        self._names: dict[int, str] = {}
+        self._category_grams: dict[int, Counter[str]] = {}
+        self._expenses: dict[int, tuple[int, Counter[str]]] = {}
+        self._counts: dict[int, Counter[str]] = {}
+        self._document_frequency: Counter[str] = Counter()
+        self._norms: dict[int, float] | None = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            categories = await get_service_manager().category.get_all()
+            comments = await get_service_manager().expense.comments()
+            for category in categories:
+                self.observe_category(category.id, category.name, category.description)
+            for expense_id, category_id, comment in comments:
+                self.observe_expense(expense_id, category_id, comment)
+            self._loaded = True
+            logger.info(f'Category index loaded: {len(categories)} categories, {len(comments)} expense comments')
+
+    def observe_category(self, category_id: int, name: str, description: str) -> None:
+        if category_id in self._category_grams:
+            self._update_counts(category_id, self._category_grams.pop(category_id), -1)
+        grams = _ngrams(f'{name} {description}')
+        self._names[category_id] = name
+        self._category_grams[category_id] = grams
+        self._update_counts(category_id, grams, 1)
+
+    def observe_expense(self, expense_id: int, category_id: int, comment: str) -> None:
+        if expense_id in self._expenses:
+            previous_category_id, previous_grams = self._expenses.pop(expense_id)
+            self._update_counts(previous_category_id, previous_grams, -1)
+        grams = _ngrams(comment)
+        if grams:
+            self._expenses[expense_id] = (category_id, grams)
+            self._update_counts(category_id, grams, 1)
+
+    def suggest(self, text: str, k: int = 3) -> list[CategorySuggestion]:
+        query = _ngrams(text)
+        if not query or not self._names:
+            return []
+        norms = self._category_norms()
+        query_weights = {gram: (1 + math.log(count)) * self._idf(gram) for gram, count in query.items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query_weights.values()))
+        if query_norm == 0:
+            return []
+
+        scores: list[CategorySuggestion] = []
+        for category_id, name in self._names.items():
+            counts = self._counts.get(category_id)
+            if not counts or not norms.get(category_id):
+                continue
+            dot = sum(
+                weight * (1 + math.log(counts[gram])) * self._idf(gram)
+                for gram, weight in query_weights.items()
+                if counts[gram] > 0
+            )
+            if dot > 0:
+                score = dot / (query_norm * norms[category_id])
+                scores.append(CategorySuggestion(category_id=category_id, name=name, score=round(score, 3)))
+        scores.sort(key=lambda suggestion: suggestion.score, reverse=True)
+        return scores[:k]
+
+    def _idf(self, gram: str) -> float:
+        return math.log((len(self._names) + 1) / (self._document_frequency[gram] + 1)) + 1
+
+    def _category_norms(self) -> dict[int, float]:
+        if self._norms is None:
+            self._norms = {
+                category_id: math.sqrt(
+                    sum(((1 + math.log(count)) * self._idf(gram)) ** 2 for gram, count in counts.items())
+                )
+                for category_id, counts in self._counts.items()
+            }
+        return self._norms
+
+    def _update_counts(self, category_id: int, grams: Counter[str], sign: int) -> None:
+        counts = self._counts.setdefault(category_id, Counter())
+        for gram, count in grams.items():
+            before = counts[gram]
+            after = before + sign * count
+            if after > 0:
+                counts[gram] = after
+            else:
+                del counts[gram]
+            if before <= 0 < after:
+                self._document_frequency[gram] += 1
+            elif after <= 0 < before:
+                self._document_frequency[gram] -= 1
+                if self._document_frequency[gram] <= 0:
+                    del self._document_frequency[gram]
+        self._norms = None
+
+
+category_index = CategoryIndex()
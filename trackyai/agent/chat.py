@@ -1,4 +1,5 @@
-from typing import Literal
+import sys
+from typing import Any, Callable, Literal, Sequence
 
 from pydantic import BaseModel
 
@@ -12,9 +13,27 @@ class TextMessage(BaseModel):
     content: str
 
 
+Turn = TextMessage | ToolCall | ToolResult
+
+
+# Besides the turns, a chat keeps the turns serialized for every completion provider that has asked for them. A turn is
+# serialized once, when it is first sent; merging a message into the last text turn serializes that turn again.
 class Chat:
     def __init__(self):
-        self._conversation: list[TextMessage | ToolCall | ToolResult] = []
+        self._conversation: list[Turn] = []
+        self._serialized: dict[str, list[dict[str, Any]]] = {}
+
+    def _invalidate_last(self) -> None:
+        for serialized in self._serialized.values():
+            if len(serialized) == len(self._conversation):
+                serialized.pop()
+
+    def serialized(self, provider: str, serialize: Callable[[Turn], dict[str, Any]]) -> Sequence[dict[str, Any]]:
+        # the returned messages are shared with the later calls and must not be changed
+        serialized = self._serialized.setdefault(provider, [])
+        for turn in self._conversation[len(serialized) :]:
+            serialized.append(serialize(turn))
+        return serialized
 
     def add_user_message(self, text: str) -> None:
         is_last_user = (
@@ -24,6 +43,7 @@ class Chat:
         )
         if is_last_user:
             assert isinstance(self._conversation[-1], TextMessage)
+            self._invalidate_last()
             self._conversation[-1].content += '\n' + text
         else:
             self._conversation.append(TextMessage(role='user', content=text))
@@ -36,6 +56,7 @@ class Chat:
         )
         if is_last_agent:
             assert isinstance(self._conversation[-1], TextMessage)
+            self._invalidate_last()
             self._conversation[-1].content += '\n' + text
         else:
             self._conversation.append(TextMessage(role='assistant', content=text))
@@ -46,6 +67,47 @@ class Chat:
     def add_tool_result(self, tool_result: ToolResult) -> None:
         self._conversation.append(tool_result)
 
+    def retained_bytes(self) -> int:
+        size = 0
+        for turn in self._conversation:
+            if isinstance(turn, TextMessage):
+                size += sys.getsizeof(turn.content)
+            elif isinstance(turn, ToolCall):
+                size += sys.getsizeof(str(turn.parameters))
+            else:
+                size += sys.getsizeof(str(turn.result))
+        return size
+
+    def last(self) -> Turn | None:
+        return self._conversation[-1] if self._conversation else None
+
+    def dump(self) -> list[dict[str, Any]]:
+        # tool results are sent to the model as strings anyway, so they are stored as strings
+        turns: list[dict[str, Any]] = []
+        for turn in self._conversation:
+            if isinstance(turn, TextMessage):
+                turns.append({'type': 'text', **turn.model_dump()})
+            elif isinstance(turn, ToolCall):
+                turns.append({'type': 'tool_call', **turn.model_dump(mode='json')})
+            else:
+                dumped = turn.model_dump(mode='json', exclude={'result'})
+                turns.append({'type': 'tool_result', 'result': str(turn.result), **dumped})
+        return turns
+
+    @classmethod
+    def load(cls, turns: list[dict[str, Any]]) -> 'Chat':
+        chat = cls()
+        for turn in turns:
+            turn = dict(turn)
+            turn_type = turn.pop('type')
+            if turn_type == 'text':
+                chat._conversation.append(TextMessage.model_validate(turn))
+            elif turn_type == 'tool_call':
+                chat._conversation.append(ToolCall.model_validate(turn))
+            else:
+                chat._conversation.append(ToolResult.model_validate(turn))
+        return chat
+
     def __iter__(self):
         return iter(self._conversation)
 
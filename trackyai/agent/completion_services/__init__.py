@@ -2,14 +2,21 @@ from functools import cache
 from typing import Literal
 
 from trackyai.agent.completion_services.base import CompletionService
-from trackyai.agent.completion_services.openai import OpenAI
-from trackyai.config import settings
+from trackyai.config import get_settings
 
 __all__ = ['get_completion_service', 'CompletionService']
 
 
+# provider SDKs are heavy to import, so that only the configured service is imported, when it is first needed
 @cache
-def get_completion_service(name: Literal['openai']) -> CompletionService:
-    if name != 'openai':
-        raise NotImplementedError(f'{name} completion service is not implemented.')
-    return OpenAI(base_url=settings.openai.base_url, api_key=settings.openai.api_key)
+def get_completion_service(name: Literal['openai', 'stub']) -> CompletionService:
+    if name == 'openai':
+        from trackyai.agent.completion_services.openai import OpenAI
+
+        settings = get_settings()
+        return OpenAI(base_url=settings.openai.base_url, api_key=settings.openai.api_key)
+    if name == 'stub':
+        from trackyai.agent.completion_services.stub import Stub
+
+        return Stub(latency=get_settings().stub_latency)
+    raise NotImplementedError(f'{name} completion service is not implemented.')
@@ -6,3 +6,7 @@ from trackyai.agent.tools import Tool, ToolCall
 
 class CompletionService(Protocol):
     async def infer_toolcall(self, system_prompt: str, chat: Chat, tools: Sequence[Tool]) -> ToolCall: ...
+
+    async def warm_up(self, tools: Sequence[Tool]) -> None: ...
+
+    async def close(self) -> None: ...
@@ -1,152 +1,166 @@
 import json
 import logging
-from datetime import datetime
+import time
+from functools import cache
 from typing import Any, Sequence
 
 from openai import AsyncOpenAI
 
 from trackyai.agent.chat import Chat, TextMessage
 from trackyai.agent.completion_services.base import CompletionService
-from trackyai.agent.tools import Tool, ToolArgument, ToolCall, ToolResult, tool_registry
+from trackyai.agent.tools import Tool, ToolCall, ToolResult, tool_registry
+from trackyai.metrics import TOKEN_BUCKETS, metrics
+from trackyai.usage import get_usage_accounting
 
-# string
-# number
-# boolean
-# null/empty
-# object
-# array
+logger = logging.getLogger(__name__)
 
+MODEL = 'gpt-4o-mini'
+
+# USD per million of prompt, cached prompt and completion tokens
+PRICES = {'gpt-4o-mini': (0.15, 0.075, 0.6)}
+
+_tokens = metrics.counter('llm_tokens_total', 'Tokens processed by the completion provider', ['model', 'kind'])
+_prompt_tokens = metrics.histogram('llm_prompt_tokens', 'Prompt tokens of a completion', ['model'], TOKEN_BUCKETS)
+_completion_tokens = metrics.histogram(
+    'llm_completion_tokens', 'Completion tokens of a completion', ['model'], TOKEN_BUCKETS
+)
+_inference_seconds = metrics.histogram('llm_inference_seconds', 'Time to infer a tool call', ['model'])
+_retries = metrics.counter('llm_retries_total', 'Completion requests retried by the client', ['model'])
+
+
+def _strict_schema(schema: Any) -> Any:
+    # strict mode requires every property, forbids extra ones and does not support titles and defaults;
+    # optional arguments stay nullable, so the model passes null for them
+    if isinstance(schema, list):
+        return [_strict_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    strict: dict[str, Any] = {}
+    for key, value in schema.items():
+        if key in ('title', 'default'):
+            continue
+        if key in ('properties', '$defs'):
+            strict[key] = {name: _strict_schema(item) for name, item in value.items()}
+        else:
+            strict[key] = _strict_schema(value)
+    if strict.get('type') == 'object':
+        strict['required'] = list(strict.get('properties', {}))
+        strict['additionalProperties'] = False
+    return strict
+
+
+@cache
+def _tool_payload(tool: Tool) -> dict:
+    # tools never change after registration, so that their payloads are built once
+    return {
+        'type': 'function',
+        'function': {
+            'name': tool.name,
+            'description': tool.description,
+            'parameters': _strict_schema(tool.arguments_schema()),
+            'strict': True,
+        },
+    }
 
-logger = logging.getLogger(__name__)
 
+def _prepare_tools(tools: Sequence[Tool]) -> list[dict]:
+    return [_tool_payload(tool) for tool in tools]
 
-def _as_json_schema_type(t: str) -> str:
-    match t:
-        case 'int':
-            return 'number'
-        case 'float':
-            return 'number'
-        case 'str':
-            return 'string'
-        case 'bool':
-            return 'boolean'
-        case _:
-            raise ValueError(f'{t} is not a valid type for OpenAI CompletionService')
-
-
-def _parse_tool_input(t: str, param: Any) -> Any:
-    match t:
-        case 'int':
-            return int(param)
-        case 'float':
-            return float(param)
-        case 'str':
-            return str(param)
-        case 'bool':
-            if isinstance(param, bool):
-                return param
-            if str(param).lower() == 'true':
-                return True
-            if str(param).lower() == 'false':
-                return False
-            raise ValueError(f'{param} is not a valid boolean')
-        case 'datetime':
-            return datetime.strptime(param, '%d-%m-%Y %H:%M:%S')
-        case 'list':
-            if isinstance(param, list):
-                return param
-            if isinstance(param, str):
-                return json.loads(param)
-            raise ValueError(f'{param} is not a valid list')
-        case _:
-            raise ValueError(f'{t} is not a valid type for OpenAI CompletionService')
-
-
-def _make_func_property(arg: ToolArgument) -> dict:
-    if arg.type == 'datetime':
+
+def _serialize_turn(turn: TextMessage | ToolCall | ToolResult) -> dict[str, Any]:
+    if isinstance(turn, TextMessage):
+        return turn.model_dump()
+    if isinstance(turn, ToolCall):
         return {
-            'type': 'string',
-            'description': arg.description
-            + '\nPass datetime as a string in the following format: %d-%m-%Y %H:%M:%S. Example: '
-            + datetime(2025, 5, 30, 16, 54, 43).strftime('%d-%m-%Y %H:%M:%S'),
+            'role': 'assistant',
+            'tool_calls': [
+                {
+                    'id': turn.id,
+                    'type': 'function',
+                    'function': {'name': turn.name, 'arguments': json.dumps(turn.parameters, default=str)},
+                }
+            ],
         }
-    if arg.type == 'list':
-        return {'type': 'array', 'items': {'type': 'number'}, 'description': arg.description}
-    return {'type': _as_json_schema_type(arg.type), 'description': arg.description}
-
-
-def _prepare_tools(tools: Sequence[Tool]) -> list[dict]:
-    openai_tools = []
-    for tool in tools:
-        openai_tools.append(
-            {
-                'type': 'function',
-                'function': {
-                    'name': tool.name,
-                    'description': tool.description,
-                    'parameters': {
-                        'type': 'object',
-                        'properties': {arg.name: _make_func_property(arg) for arg in tool.arguments},
-                        'required': [arg.name for arg in tool.arguments],
-                        'additionalProperties': False,
-                    },
-                    'strict': True,
-                },
-            }
-        )
-    return openai_tools
+    return {
+        'role': 'tool',
+        'tool_call_id': turn.tool_call.id,
+        'content': str(turn.result) if turn.success else str(turn.exc_message),
+    }
+
+
+def _prepare_messages(system_prompt: str, chat: Chat) -> list[dict[str, Any]]:
+    # turns are serialized once and cached on the chat, every step only serializes the turns added since the last one
+    return [{'role': 'system', 'content': system_prompt}, *chat.serialized('openai', _serialize_turn)]
+
+
+def _cost(prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    prompt_price, cached_price, completion_price = PRICES.get(MODEL, (0, 0, 0))
+    cost = (prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+    return (cost + completion_tokens * completion_price) / 1_000_000
+
+
+def _record_usage(completion: Any, latency: float) -> None:
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        logger.warning('OpenAI completion has no usage information')
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', None) or 0) if details is not None else 0
+    _tokens.inc(usage.prompt_tokens, model=completion.model, kind='prompt')
+    _tokens.inc(cached_tokens, model=completion.model, kind='cached')
+    _tokens.inc(usage.completion_tokens, model=completion.model, kind='completion')
+    _prompt_tokens.observe(usage.prompt_tokens, model=completion.model)
+    _completion_tokens.observe(usage.completion_tokens, model=completion.model)
+    get_usage_accounting().record(
+        model=completion.model,
+        prompt_tokens=usage.prompt_tokens,
+        cached_tokens=cached_tokens,
+        completion_tokens=usage.completion_tokens,
+        cost=_cost(usage.prompt_tokens, cached_tokens, usage.completion_tokens),
+        latency=latency,
+    )
+    cache_ratio = cached_tokens / usage.prompt_tokens if usage.prompt_tokens else 0
+    logger.info(
+        f'OpenAI usage: prompt_tokens={usage.prompt_tokens} cached_tokens={cached_tokens} '
+        f'({cache_ratio:.0%} cache hit) completion_tokens={usage.completion_tokens}'
+    )
 
 
 class OpenAI(CompletionService):
     def __init__(self, base_url: str, api_key: str):
         self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=90)
 
+    async def warm_up(self, tools: Sequence[Tool]) -> None:
+        _prepare_tools(tools)
+        # any request opens the connection of the HTTP client; listing models is the cheapest one
+        await self.client.models.list()
+
+    async def close(self) -> None:
+        await self.client.close()
+
     async def infer_toolcall(self, system_prompt: str, chat: Chat, tools: Sequence[Tool]) -> ToolCall:
-        messages: list[dict[str, Any]] = [{'role': 'system', 'content': system_prompt}]
-        for turn in chat:
-            if isinstance(turn, TextMessage):
-                messages.append(turn.model_dump())
-            elif isinstance(turn, ToolCall):
-                messages.append(
-                    {
-                        'role': 'assistant',
-                        'tool_calls': [
-                            {
-                                'id': turn.id,
-                                'type': 'function',
-                                'function': {'name': turn.name, 'arguments': json.dumps(turn.parameters, default=str)},
-                            }
-                        ],
-                    }
-                )
-            elif isinstance(turn, ToolResult):
-                messages.append(
-                    {
-                        'role': 'tool',
-                        'tool_call_id': turn.tool_call.id,
-                        'content': str(turn.result) if turn.success else str(turn.exc_message),
-                    }
-                )
-
-        completion = await self.client.chat.completions.create(  # type: ignore
-            model='gpt-4o-mini',
-            messages=messages,
-            temperature=0,
-            seed=11,
-            tools=_prepare_tools(tools),
-            tool_choice='required',
-            parallel_tool_calls=False,
-        )
-        logger.debug(f'OpenAI completion: {completion}')
+        messages = _prepare_messages(system_prompt=system_prompt, chat=chat)
+
+        started_at = time.perf_counter()
+        with _inference_seconds.time(model=MODEL):
+            response = await self.client.chat.completions.with_raw_response.create(  # type: ignore
+                model=MODEL,
+                messages=messages,
+                temperature=0,
+                seed=11,
+                tools=_prepare_tools(tools),
+                tool_choice='required',
+                parallel_tool_calls=False,
+            )
+        latency = time.perf_counter() - started_at
+        if response.retries_taken:
+            _retries.inc(response.retries_taken, model=MODEL)
+        completion = response.parse()
+        logger.debug('OpenAI completion: %s', completion)
+        _record_usage(completion, latency)
 
         tool_call = completion.choices[0].message.tool_calls[0]
-        logger.debug(f'OpenAI tool call: {tool_call}')
-        args = json.loads(tool_call.function.arguments)
-
+        logger.debug('OpenAI tool call: %s', tool_call)
         tool: Tool = tool_registry[tool_call.function.name]
 
-        return ToolCall(
-            name=tool.name,
-            id=tool_call.id,
-            parameters={arg.name: _parse_tool_input(arg.type, args[arg.name]) for arg in tool.arguments},
-        )
+        return ToolCall(name=tool.name, id=tool_call.id, parameters=tool.parse_arguments(tool_call.function.arguments))
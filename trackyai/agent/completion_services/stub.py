@@ -0,0 +1,83 @@
+import asyncio
+import datetime
+import re
+import time
+import uuid
+from typing import Any, Sequence
+
+from trackyai.agent.chat import Chat, TextMessage
+from trackyai.agent.completion_services.base import CompletionService
+from trackyai.agent.tools import Tool, ToolCall, ToolResult
+from trackyai.usage import get_usage_accounting
+
+_AMOUNT_PATTERN = re.compile(r'^\s*(\d+(?:[.,]\d+)?)\s*(.*)$')
+
+
+# A deterministic rule-based stand-in for an LLM, used for load tests and local runs without a provider.
+# `latency` simulates the time a provider spends on a single completion. Usage is recorded at no cost, with tokens
+# estimated at ~4 characters each, so that load tests exercise the accounting as well.
+class Stub(CompletionService):
+    def __init__(self, latency: float = 0.0, category_id: int = 1, currency: str = 'EUR'):
+        self._latency = latency
+        self._category_id = category_id
+        self._currency = currency
+
+    async def warm_up(self, tools: Sequence[Tool]) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def infer_toolcall(self, system_prompt: str, chat: Chat, tools: Sequence[Tool]) -> ToolCall:
+        started_at = time.perf_counter()
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+        available = {tool.name for tool in tools}
+        turns = list(chat)
+        name, parameters = self._decide(turns)
+        if name not in available:
+            name, parameters = 'finish_session_with_reply', {'message': f'Stub: {name} is not available.'}
+        get_usage_accounting().record(
+            model='stub',
+            prompt_tokens=(len(system_prompt) + sum(len(str(turn)) for turn in turns)) // 4,
+            cached_tokens=0,
+            completion_tokens=len(str(parameters)) // 4,
+            cost=0,
+            latency=time.perf_counter() - started_at,
+        )
+        return ToolCall(name=name, id=f'call_{uuid.uuid4().hex}', parameters=parameters)
+
+    def _decide(self, turns: list[Any]) -> tuple[str, dict[str, Any]]:
+        last = turns[-1] if turns else None
+        if isinstance(last, ToolResult):
+            return 'finish_session_with_reply', {'message': f'Stub: {last.tool_call.name} returned a result.'}
+
+        text = last.content.strip() if isinstance(last, TextMessage) else ''
+        asked_user = any(isinstance(turn, TextMessage) and turn.role == 'assistant' for turn in turns)
+        lowered = text.lower()
+
+        if asked_user:
+            return 'finish_session_with_reply', {'message': 'Stub: thanks for the clarification.'}
+        if match := _AMOUNT_PATTERN.match(text):
+            return 'add_expense', {
+                'category_id': self._category_id,
+                'currency': self._currency,
+                'amount': float(match.group(1).replace(',', '.')),
+                'comment': match.group(2),
+            }
+        if 'categor' in lowered:
+            return 'send_categories', {}
+        if 'config' in lowered or 'setting' in lowered:
+            return 'send_system_configurations', {}
+        if 'latest' in lowered or 'last' in lowered or 'find' in lowered:
+            now = datetime.datetime.now()
+            return 'find_expenses', {
+                'category_id': self._category_id,
+                'date_from': now - datetime.timedelta(days=30),
+                'date_to': now,
+                'currency': self._currency,
+                'limit': 10,
+            }
+        if text.endswith('?'):
+            return 'ask_user', {'message': 'Stub: could you clarify your question?'}
+        return 'finish_session_with_reply', {'message': 'Stub: hello!'}
@@ -0,0 +1,70 @@
+import logging
+import re
+from functools import cache
+from typing import Sequence
+
+from trackyai.agent.chat import Chat, TextMessage
+from trackyai.agent.tools import Tool, ToolCall
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# any step of the main scope may need to ask the user or reply, whatever the chat is about; most of the other main tools
+# are terminating as well, so the flag cannot tell these two apart
+ALWAYS_SELECTED = frozenset({'ask_user', 'finish_session_with_reply'})
+
+_steps = metrics.counter('tool_selection_steps_total', 'Agent steps that went through tool selection', ['outcome'])
+_schema_tokens = metrics.counter(
+    'tool_selection_schema_tokens_total', 'Estimated tokens of tool schemas sent to the model', ['selection']
+)
+
+
+@cache
+def _keywords_pattern(tool: Tool) -> re.Pattern[str] | None:
+    return re.compile('|'.join(f'(?:{keyword})' for keyword in tool.keywords)) if tool.keywords else None
+
+
+@cache
+def estimate_schema_tokens(tool: Tool) -> int:
+    # ~4 characters per token is close enough to compare tool sets with each other
+    size = len(tool.name) + len(tool.description)
+    size += sum(len(arg.name) + len(arg.type) + len(arg.description) for arg in tool.arguments)
+    return size // 4 + 1
+
+
+# Picks the tools relevant to the current step: tools whose keywords match the user messages, tools that have already
+# been called in the chat and tools that follow them. Falls back to all tools when nothing matches.
+class ToolSelector:
+    @staticmethod
+    def warm_up(tools: Sequence[Tool]) -> None:
+        # compiles the keyword patterns and estimates the schemas of the tools ahead of the first step
+        for tool in tools:
+            _keywords_pattern(tool)
+            estimate_schema_tokens(tool)
+
+    def select(self, chat: Chat, tools: Sequence[Tool]) -> list[Tool]:
+        text = '\n'.join(turn.content for turn in chat if isinstance(turn, TextMessage) and turn.role == 'user')
+        text = text.lower()
+        called = {turn.name for turn in chat if isinstance(turn, ToolCall)}
+
+        matched = set()
+        for tool in tools:
+            pattern = _keywords_pattern(tool)
+            if tool.name in called or (pattern is not None and pattern.search(text)):
+                matched.add(tool.name)
+        matched.update(tool.name for tool in tools if called.intersection(tool.follows))
+
+        full_tokens = sum(estimate_schema_tokens(tool) for tool in tools)
+        _schema_tokens.inc(full_tokens, selection='full')
+        if not matched:
+            _steps.inc(outcome='fallback')
+            _schema_tokens.inc(full_tokens, selection='selected')
+            logger.debug('No tools matched the chat, selecting all tools')
+            return list(tools)
+
+        # keeps the registry order, so that equal subsets produce identical payloads
+        selected = [tool for tool in tools if tool.name in matched or tool.name in ALWAYS_SELECTED]
+        _steps.inc(outcome='selected')
+        _schema_tokens.inc(sum(estimate_schema_tokens(tool) for tool in selected), selection='selected')
+        logger.debug(f'Selected {len(selected)} of {len(tools)} tools: {[tool.name for tool in selected]}')
+        return selected
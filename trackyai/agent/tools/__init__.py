@@ -1,6 +1,16 @@
-from trackyai.agent.tools.base import SendTextMessage, TgAction, Tool, ToolArgument, ToolCall, ToolResult
+from trackyai.agent.tools.base import SendDocument, SendTextMessage, TgAction, Tool, ToolArgument, ToolCall, ToolResult
 from trackyai.agent.tools.common import *  # noqa: F403
 from trackyai.agent.tools.crud import *  # noqa: F403
 from trackyai.agent.tools.registry import tool, tool_registry
 
-__all__ = ['Tool', 'ToolArgument', 'ToolCall', 'ToolResult', 'TgAction', 'SendTextMessage', 'tool_registry', 'tool']
+__all__ = [
+    'Tool',
+    'ToolArgument',
+    'ToolCall',
+    'ToolResult',
+    'TgAction',
+    'SendTextMessage',
+    'SendDocument',
+    'tool_registry',
+    'tool',
+]
@@ -1,8 +1,9 @@
-from typing import Any, Callable, Coroutine, Protocol, Self, runtime_checkable
+from typing import IO, TYPE_CHECKING, Any, Callable, Coroutine, Protocol, Self, runtime_checkable
 
 from pydantic import BaseModel, model_validator
 
-from trackyai.communication import CommunicationProxy
+if TYPE_CHECKING:
+    from telegram import InlineKeyboardMarkup
 
 
 class ToolArgument(BaseModel, frozen=True):
@@ -16,8 +17,16 @@ class Tool(BaseModel, frozen=True):
     awaitable: Callable[..., Coroutine[Any, Any, Any]]
     description: str
     arguments: list[ToolArgument]
+    # validates all arguments of a call at once, built by the `tool` decorator from the signature
+    arguments_model: type[BaseModel]
     terminating: bool
     scopes: tuple[str, ...]
+    keywords: tuple[str, ...] = ()
+    follows: tuple[str, ...] = ()
+    # pure tools only read the tables in `reads`, so that their results are memoized; `writes` invalidates them
+    pure: bool = False
+    reads: tuple[str, ...] = ()
+    writes: tuple[str, ...] = ()
 
     def __hash__(self) -> int:
         return hash(self.name)
@@ -28,12 +37,28 @@ class Tool(BaseModel, frozen=True):
             raise ValueError('At least one scope must be specified')
         return self
 
+    @model_validator(mode='after')
+    def verify_purity(self) -> Self:
+        if self.pure and self.writes:
+            raise ValueError(f'A pure tool cannot write, {self.name} writes {self.writes}')
+        if self.pure and self.terminating:
+            raise ValueError(f'A pure tool cannot be terminating, {self.name} is')
+        return self
+
     def is_terminating(self) -> bool:
         return self.terminating
 
     def is_ask_user(self) -> bool:
         return self.name == 'ask_user'
 
+    def parse_arguments(self, arguments: str | dict[str, Any]) -> dict[str, Any]:
+        if isinstance(arguments, str):
+            return dict(self.arguments_model.model_validate_json(arguments))
+        return dict(self.arguments_model.model_validate(arguments))
+
+    def arguments_schema(self) -> dict[str, Any]:
+        return self.arguments_model.model_json_schema()
+
 
 class ToolCall(BaseModel, frozen=True):
     name: str
@@ -57,8 +82,28 @@ class TgAction(Protocol):
 
 
 class SendTextMessage(TgAction):
-    def __init__(self, text: str) -> None:
+    def __init__(self, text: str, reply_markup: 'InlineKeyboardMarkup | None' = None) -> None:
         self.text = text
+        self.reply_markup = reply_markup
 
     async def perform(self, user_id: int) -> None:
-        await CommunicationProxy.get_for(user_id=user_id).send_text(message=self.text)
+        # telegram is only imported once there is something to send
+        from trackyai.communication import CommunicationProxy
+
+        await CommunicationProxy.get_for(user_id=user_id).send_text(message=self.text, reply_markup=self.reply_markup)
+
+
+class SendDocument(TgAction):
+    # the document is closed once it is sent
+    def __init__(self, document: IO[bytes], filename: str, caption: str | None = None) -> None:
+        self.document = document
+        self.filename = filename
+        self.caption = caption
+
+    async def perform(self, user_id: int) -> None:
+        from trackyai.communication import CommunicationProxy
+
+        with self.document:
+            await CommunicationProxy.get_for(user_id=user_id).send_document(
+                document=self.document, filename=self.filename, caption=self.caption
+            )
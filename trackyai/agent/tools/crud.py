@@ -1,13 +1,22 @@
 import datetime
 from functools import cache
 from pathlib import Path
-from typing import Annotated, Sequence
+from typing import TYPE_CHECKING, Annotated, Literal, Sequence
 
-from jinja2 import Environment, FileSystemLoader, Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 
-from trackyai.agent.tools.base import SendTextMessage, TgAction
+from trackyai.agent.category_index import category_index
+from trackyai.agent.tools.base import SendDocument, SendTextMessage, TgAction
+from trackyai.agent.tools.pages import ExpensePages
 from trackyai.agent.tools.registry import tool
-from trackyai.db import Category, EnvironmentConfiguration, Expense, service_manager
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.export import ExportFormat, export_expenses
+
+if TYPE_CHECKING:
+    from trackyai.db import Budget, Category, EnvironmentConfiguration, Expense, RecurringExpense
+
+BudgetPeriod = Literal['week', 'month', 'year']
 
 
 class _UpdateMemory(TgAction):
@@ -15,10 +24,67 @@ class _UpdateMemory(TgAction):
         self.mem = mem
 
     async def perform(self, user_id: int) -> None:
-        await service_manager.memory.update(user_id=user_id, memory=self.mem)
+        await get_service_manager().memory.update(user_id=user_id, memory=self.mem)
+
+
+class _SendAll(TgAction):
+    # a reply followed by the messages it brings about, e.g. alerts of exceeded budgets
+    def __init__(self, *actions: TgAction):
+        self.actions = actions
+
+    async def perform(self, user_id: int) -> None:
+        for action in self.actions:
+            await action.perform(user_id)
 
 
-_jinja_env = Environment(loader=FileSystemLoader(searchpath=Path(__file__).parent / 'message_templates'))
+class _SendExpensesList(TgAction):
+    def __init__(self, expense_ids: list[int]):
+        self.expense_ids = expense_ids
+
+    async def perform(self, user_id: int) -> None:
+        page = await get_expense_pages().open(user_id=user_id, expense_ids=self.expense_ids)
+        await SendTextMessage(page.text, reply_markup=page.reply_markup).perform(user_id)
+
+
+class _SendExpensesFile(TgAction):
+    def __init__(self, file_format: str, date_from: datetime.datetime, date_to: datetime.datetime):
+        self.file_format = file_format
+        self.date_from = date_from
+        self.date_to = date_to
+
+    async def perform(self, user_id: int) -> None:
+        export = await export_expenses(self.file_format, date_from=self.date_from, date_to=self.date_to)
+        if not export.rows:
+            export.file.close()
+            await SendTextMessage(f'There are no expenses from {self.date_from} to {self.date_to}.').perform(user_id)
+            return
+        caption = f'{export.rows} expenses from {self.date_from} to {self.date_to}'
+        await SendDocument(export.file, filename=export.filename, caption=caption).perform(user_id)
+
+
+_jinja_env = Environment(
+    loader=FileSystemLoader(searchpath=Path(__file__).parent / 'message_templates'),
+    bytecode_cache=FileSystemBytecodeCache(),
+)
+
+
+_SHOW_KEYWORDS = (
+    r'\bshow',
+    r'\bsend',
+    r'\blist',
+    r'\bwhat',
+    r'\bwhich',
+    r'\bhow much',
+    r'\blast',
+    r'\blatest',
+    r'\byesterday',
+    r'\btoday',
+    r'\bweek',
+    r'\bmonth',
+    r'\byear',
+)
+_CHANGE_KEYWORDS = (r'\bupdate', r'\bchange', r'\bedit', r'\bfix', r'\bcorrect', r'\bwrong', r'\binstead', r'\brename')
+_CONFIG_KEYWORDS = (r'\bconfig', r'\bsetting', r'\bdefault')
 
 
 @cache
@@ -26,7 +92,33 @@ def _load_template(template_name: str) -> Template:
     return _jinja_env.get_template(template_name + '.jinja2')
 
 
-@tool(terminating=True, scopes='memory')
+def _with_budget_alerts(reply: SendTextMessage, exceeded: Sequence['Budget']) -> TgAction:
+    if not exceeded:
+        return reply
+    template = _load_template('budget_alert')
+    return _SendAll(reply, *(SendTextMessage(text=template.render(budget=budget)) for budget in exceeded))
+
+
+def precompile_message_templates() -> int:
+    names = [name.removesuffix('.jinja2') for name in _jinja_env.list_templates(extensions=['jinja2'])]
+    for name in names:
+        _load_template(name)
+    return len(names)
+
+
+@cache
+def get_expense_pages() -> ExpensePages:
+    settings = get_settings()
+    return ExpensePages(
+        template=_load_template('send_expenses'),
+        page_size=settings.expenses_page_size,
+        page_ttl=settings.expenses_page_ttl,
+        list_ttl=settings.expenses_list_ttl,
+        max_lists=settings.max_expense_lists,
+    )
+
+
+@tool(terminating=True, scopes='memory', writes=('memory',))
 async def update_memory(new_memory: Annotated[str, 'A new memory to save instead of the previous one']) -> TgAction:
     """
     Updates system memory about the current user with the new memory.
@@ -36,7 +128,12 @@ async def update_memory(new_memory: Annotated[str, 'A new memory to save instead
     return _UpdateMemory(new_memory)
 
 
-@tool(terminating=True)
+@tool(
+    terminating=True,
+    keywords=(r'\bcategor', r'\bnew\b', r'\bcreate'),
+    follows=('list_categories',),
+    writes=('category',),
+)
 async def add_category(
     name: Annotated[str, 'The name of the new category. Must differ from existing categories.'],
     description: Annotated[
@@ -44,156 +141,204 @@ async def add_category(
     ],
 ) -> SendTextMessage:
     """Adds a new category to the system. This new category must have a unique name."""
-    category: Category = await service_manager.category.add(name=name, description=description)
+    category: Category = await get_service_manager().category.add(name=name, description=description)
+    category_index.observe_category(category.id, category.name, category.description)
     message_template = _load_template('add_category')
     return SendTextMessage(text=message_template.render(category=category))
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=(r'\bcategor', *_CHANGE_KEYWORDS), follows=('list_categories',), writes=('category',))
 async def update_category(
     category_id: Annotated[int, 'The ID of the category to be updated.'],
-    new_name: Annotated[str, 'The new name of the category. If name is not updated - must be the current name.'],
+    new_name: Annotated[str | None, 'The new name of the category, null if the name is not changing.'] = None,
     new_description: Annotated[
-        str, 'The new description of the category. If description is not updated - must be the current description.'
-    ],
+        str | None, 'The new description of the category, null if the description is not changing.'
+    ] = None,
 ) -> SendTextMessage:
-    """Updates an existing category with the new name and description."""
-    category: Category = await service_manager.category.update(
+    """Updates an existing category with the new name and/or description."""
+    category: Category = await get_service_manager().category.update(
         category_id=category_id, name=new_name, description=new_description
     )
+    category_index.observe_category(category.id, category.name, category.description)
     message_template = _load_template('update_category')
     return SendTextMessage(text=message_template.render(category=category))
 
 
-@tool(terminating=True)
+@tool(
+    terminating=True,
+    keywords=(*_CONFIG_KEYWORDS, *_CHANGE_KEYWORDS),
+    follows=('list_environment_configurations',),
+    writes=('env_config',),
+)
 async def update_environment_config(
     key: Annotated[str, 'Key of an environment configuration to be updated. Must be present.'],
     value: Annotated[str, 'New value of the environment configuration for the given key.'],
 ) -> SendTextMessage:
     """Updates an existing environment configuration with the new value for the given key."""
-    ec: EnvironmentConfiguration = await service_manager.env_config.update(key=key, value=value)
+    ec: EnvironmentConfiguration = await get_service_manager().env_config.update(key=key, value=value)
     message_template = _load_template('update_environment_config')
     return SendTextMessage(text=message_template.render(ec=ec))
 
 
-@tool(terminating=True)
+@tool(
+    terminating=True,
+    keywords=(r'\d', r'\bspen[dt]', r'\bpa(y|id)', r'\bb(uy|ought)', r'\bcost', r'\badd'),
+    writes=('expense', 'budget'),
+)
 async def add_expense(
     category_id: Annotated[int, 'The ID of the category for the new expense.'],
     currency: Annotated[str, 'The currency of the expense. If not provided, the default value must be used.'],
     amount: Annotated[float, 'The amount of the expense. Must be greater than or equal to 0.'],
-    comment: Annotated[str, 'An optional comment to the expense.'],
-) -> SendTextMessage:
+    comment: Annotated[str | None, 'An optional comment to the expense.'] = None,
+) -> TgAction:
     """Adds a new expense to the system. This new expense must correspond to an existing category."""
-    expense: Expense = await service_manager.expense.add(
+    expense, exceeded = await get_service_manager().expense.add(
         category_id=category_id, currency=currency, amount=amount, comment=comment
     )
+    category_index.observe_expense(expense.id, expense.category_id, expense.comment)
     message_template = _load_template('add_expense')
-    return SendTextMessage(text=message_template.render(expense=expense))
+    return _with_budget_alerts(SendTextMessage(text=message_template.render(expense=expense)), exceeded)
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=_CHANGE_KEYWORDS, follows=('find_expenses',), writes=('expense', 'budget'))
 async def update_expense(
     expense_id: Annotated[int, 'The ID of the expense to be updated.'],
-    category_id: Annotated[
-        int,
-        (
-            'The ID of the category for the expense. Must be present. '
-            'Must equal to the current one if it is not changing by user request.'
-        ),
-    ],
-    date: Annotated[
-        datetime.datetime,
-        'The new datetime of the expense. Must equal to the current one if it is not changing by user request.',
-    ],
-    currency: Annotated[
-        str, 'The new currency of the expense. Must equal to the current one if it is not changing by user request.'
-    ],
-    amount: Annotated[
-        float,
-        (
-            'The new amount of the expense. Must be greater than or equal to 0. '
-            'Must equal to the current one if it is not changing by user request.'
-        ),
-    ],
-    comment: Annotated[
-        str, 'The new comment of the expense. Must equal to the current one if it is not changing by user request.'
-    ],
-) -> SendTextMessage:
+    category_id: Annotated[int | None, 'The ID of the new category of the expense.'] = None,
+    date: Annotated[datetime.datetime | None, 'The new datetime of the expense.'] = None,
+    currency: Annotated[str | None, 'The new currency of the expense.'] = None,
+    amount: Annotated[float | None, 'The new amount of the expense. Must be greater than or equal to 0.'] = None,
+    comment: Annotated[str | None, 'The new comment of the expense.'] = None,
+) -> TgAction:
     """
-    Updates an existing expense by id. Characteristics that are not changing must be provided as well;
-    they must equal to their current values.
+    Updates an existing expense by id. Only the characteristics changing by user request are given, the others are
+    null.
     """
-    expense: Expense = await service_manager.expense.update(
+    expense, exceeded = await get_service_manager().expense.update(
         expense_id=expense_id, category_id=category_id, date=date, currency=currency, amount=amount, comment=comment
     )
+    category_index.observe_expense(expense.id, expense.category_id, expense.comment)
     message_template = _load_template('update_expense')
-    return SendTextMessage(text=message_template.render(expense=expense))
+    return _with_budget_alerts(SendTextMessage(text=message_template.render(expense=expense)), exceeded)
+
+
+@tool(
+    terminating=True,
+    keywords=(r'\bbudget', r'\blimit', r'\bwarn', r'\balert', r'\bnotify', r'\bpass', r'\bexceed'),
+    follows=('list_categories',),
+    writes=('budget',),
+)
+async def set_budget(
+    category_id: Annotated[int, 'The ID of the category of the budget.'],
+    currency: Annotated[str, 'The currency of the budget. If not provided, the default value must be used.'],
+    period: Annotated[BudgetPeriod, 'The period of the budget: week, month or year.'],
+    amount: Annotated[float, 'The amount of the budget. Must be greater than 0.'],
+) -> SendTextMessage:
+    """
+    Sets a budget of a category for every week, month or year. The user is warned as soon as the expenses of the
+    category in the currency pass the amount within a period. Setting a budget again changes its amount.
+    """
+    budget: Budget = await get_service_manager().budget.set(
+        category_id=category_id, currency=currency, period=period, amount=amount
+    )
+    message_template = _load_template('set_budget')
+    return SendTextMessage(text=message_template.render(budget=budget))
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=(r'\bcategor',))
 async def send_categories() -> SendTextMessage:
     """Sends a list of all available categories to the user."""
-    categories: Sequence[Category] = await service_manager.category.get_all()
+    categories: Sequence[Category] = await get_service_manager().category.get_all()
     message_template = _load_template('send_categories')
     return SendTextMessage(text=message_template.render(categories=categories))
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=_CONFIG_KEYWORDS)
 async def send_system_configurations() -> SendTextMessage:
     """Sends a list of all current system configurations to the user."""
-    ecs: Sequence[EnvironmentConfiguration] = await service_manager.env_config.get_all()
+    ecs: Sequence[EnvironmentConfiguration] = await get_service_manager().env_config.get_all()
     message_template = _load_template('send_system_configurations')
     return SendTextMessage(text=message_template.render(ecs=ecs))
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=(r'\brecurr', r'\bsubscri', r'\bregular', r'\brent\b', r'\bevery', r'\bbills?\b'))
+async def send_recurring_expenses() -> SendTextMessage:
+    """
+    Sends the recurring expenses (subscriptions, rent, bills) detected in the expense history to the user, with the
+    dates they are expected next.
+    """
+    recurring: Sequence[RecurringExpense] = await get_service_manager().recurring.get_all()
+    message_template = _load_template('send_recurring_expenses')
+    return SendTextMessage(text=message_template.render(recurring_expenses=recurring))
+
+
+@tool(terminating=True, keywords=_SHOW_KEYWORDS, follows=('find_expenses',))
 async def send_expense_single(
     expense_id: Annotated[int, 'The ID of the expense to send to the user.'],
 ) -> SendTextMessage:
     """Sends a single expense to the user (whole information about this expense)."""
-    expense: Expense = await service_manager.expense.get(expense_id=expense_id)
+    expense: Expense = await get_service_manager().expense.get(expense_id=expense_id)
     message_template = _load_template('send_expense_single')
     return SendTextMessage(text=message_template.render(expense=expense))
 
 
-@tool(terminating=True)
+@tool(terminating=True, keywords=_SHOW_KEYWORDS, follows=('find_expenses',))
 async def send_expenses_list(
     expense_ids: Annotated[list[int], 'The list of IDs (integers) of the expenses to send to the user.'],
-) -> SendTextMessage:
-    """Sends multiple expenses to the user (whole information about expenses)."""
-    expenses: Sequence[Expense] = await service_manager.expense.get_many(expense_ids=expense_ids)
-    message_template = _load_template('send_expenses')
-    return SendTextMessage(text=message_template.render(expenses=expenses))
+) -> TgAction:
+    """Sends multiple expenses to the user (whole information about expenses), page by page."""
+    return _SendExpensesList(expense_ids)
+
+
+@tool(
+    terminating=True,
+    keywords=(r'\bfile', r'\bexport', r'\bcsv', r'\bxlsx?\b', r'\bexcel', r'\bspreadsheet', r'\bdownload', r'\ball\b'),
+)
+async def send_expenses_file(
+    date_from: Annotated[datetime.datetime, 'The datetime from which to export expenses.'],
+    date_to: Annotated[datetime.datetime, 'The datetime until which to export expenses.'],
+    file_format: Annotated[ExportFormat, 'The format of the file. Use csv by default.'] = 'csv',
+) -> TgAction:
+    """
+    Sends all expenses in the given period to the user as a file.
+    Used for large exports, e.g. all expenses of the last year, or when the user asks for a file or a spreadsheet.
+    """
+    return _SendExpensesFile(file_format, date_from=date_from, date_to=date_to)
 
 
-@tool
+@tool(keywords=(r'\bcategor', r'\d', r'\bspen[dt]', r'\bpa(y|id)', r'\bb(uy|ought)'), pure=True, reads=('category',))
 async def list_categories() -> str:
     """Loads the list of all available expense categories."""
-    categories: Sequence[Category] = await service_manager.category.get_all()
+    categories: Sequence[Category] = await get_service_manager().category.get_all()
     template = _load_template('list_categories')
     return template.render(categories=categories)
 
 
-@tool
+@tool(keywords=(*_CONFIG_KEYWORDS, r'\bcurrenc'), pure=True, reads=('env_config',))
 async def list_environment_configurations() -> str:
     """Loads the list of all environment configurations for the current user."""
-    ecs: Sequence[EnvironmentConfiguration] = await service_manager.env_config.get_all()
+    ecs: Sequence[EnvironmentConfiguration] = await get_service_manager().env_config.get_all()
     template = _load_template('list_environment_configurations')
     return template.render(ecs=ecs)
 
 
-@tool
+@tool(
+    keywords=(*_SHOW_KEYWORDS, *_CHANGE_KEYWORDS, r'\bfind', r'\bsearch', r'\btotal', r'\bsum\b', r'\bspen[dt]'),
+    pure=True,
+    reads=('expense', 'category'),
+)
 async def find_expenses(
-    category_id: Annotated[int, ('The ID of the category for the expenses. ')],
-    date_from: Annotated[datetime.datetime, 'The datetime from which to find expenses.'],
-    date_to: Annotated[datetime.datetime, 'The datetime until which to find expenses.'],
-    currency: Annotated[str, 'The currency of expenses to find.'],
-    amount_from: Annotated[float, ('The amount from which to find expenses.')],
-    amount_to: Annotated[float, ('The amount to which to find expenses.')],
-    limit: Annotated[int, 'Limit - maximum number of expenses to find. Put a bigger value if you want to find all.'],
+    category_id: Annotated[int | None, 'The ID of the category for the expenses.'] = None,
+    date_from: Annotated[datetime.datetime | None, 'The datetime from which to find expenses.'] = None,
+    date_to: Annotated[datetime.datetime | None, 'The datetime until which to find expenses.'] = None,
+    currency: Annotated[str | None, 'The currency of expenses to find.'] = None,
+    amount_from: Annotated[float | None, 'The amount from which to find expenses.'] = None,
+    amount_to: Annotated[float | None, 'The amount to which to find expenses.'] = None,
+    limit: Annotated[
+        int, 'Limit - maximum number of expenses to find. Put a bigger value if you want to find all.'
+    ] = 10,
 ) -> str:
-    """Finds a list of expenses in the database according to given filters."""
-    expenses: Sequence[Expense] = await service_manager.expense.find(
+    """Finds a list of expenses in the database according to given filters. Null filters are not applied."""
+    expenses: Sequence[Expense] = await get_service_manager().expense.find(
         category_id=category_id,
         date_from=date_from,
         date_to=date_to,
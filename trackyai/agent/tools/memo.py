@@ -0,0 +1,51 @@
+import json
+import logging
+from collections import Counter
+from functools import cache
+from typing import Any, Hashable
+
+from trackyai.agent.tools.base import Tool
+from trackyai.bounded_store import BoundedStore
+from trackyai.config import get_settings
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_requests = metrics.counter('tool_memo_requests_total', 'Calls of pure tools by memo outcome', ['tool', 'outcome'])
+
+MemoKey = tuple[Hashable, ...]
+
+
+# Results of pure tools, shared by all sessions. A key holds the tool arguments and the data versions of the tables
+# the tool reads; tools writing a table bump its version, so that older results are never hit again and expire.
+# Versions are per process: the TTL bounds staleness when another worker writes the same tables.
+class ToolMemo:
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._results: BoundedStore[MemoKey, Any] = BoundedStore('tool_memo', max_size=max_size, ttl=ttl)
+        self._versions: Counter[str] = Counter()
+
+    def key(self, tool: Tool, parameters: dict[str, Any]) -> MemoKey | None:
+        if not tool.pure:
+            return None
+        arguments = json.dumps(parameters, sort_keys=True, default=str)
+        return tool.name, arguments, *(self._versions[table] for table in tool.reads)
+
+    def get(self, tool: Tool, key: MemoKey) -> Any | None:
+        result = self._results.get(key)
+        _requests.inc(tool=tool.name, outcome='miss' if result is None else 'hit')
+        return result
+
+    def put(self, key: MemoKey, result: Any) -> None:
+        if result is not None:
+            self._results[key] = result
+
+    def invalidate(self, tool: Tool) -> None:
+        for table in tool.writes:
+            self._versions[table] += 1
+            logger.debug(f'{tool.name} bumped the data version of {table} to {self._versions[table]}')
+
+
+@cache
+def get_tool_memo() -> ToolMemo:
+    settings = get_settings()
+    return ToolMemo(max_size=settings.tool_memo_max_size, ttl=settings.tool_memo_ttl)
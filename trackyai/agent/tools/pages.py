@@ -0,0 +1,97 @@
+import datetime
+import logging
+import secrets
+from typing import TYPE_CHECKING, NamedTuple
+
+from jinja2 import Template
+
+from trackyai.bounded_store import BoundedStore
+from trackyai.db import get_service_manager
+from trackyai.metrics import metrics
+
+if TYPE_CHECKING:
+    from telegram import InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+EXPENSES_PAGE_PREFIX = 'xp:'
+
+_page_requests = metrics.counter('expense_page_requests_total', 'Requested pages of expense lists', ['outcome'])
+
+
+class ExpensePage(NamedTuple):
+    text: str
+    reply_markup: 'InlineKeyboardMarkup | None'
+
+
+class _Listing:
+    def __init__(self, user_id: int, expense_ids: list[int]) -> None:
+        self.user_id = user_id
+        self.expense_ids = expense_ids
+        # keyset cursor of every page seen so far, i.e. (date, id) of the last expense of the previous page
+        self.cursors: list[tuple[datetime.datetime, int] | None] = [None]
+
+
+# Expense lists sent page by page. A list keeps only the requested expense ids, every page is loaded when it is shown
+# for the first time with keyset pagination from the cursor of the previous page. Shown pages are cached for a while,
+# so going back is instant. Callback data of the page buttons is `xp:<list id>:<page>`.
+class ExpensePages:
+    def __init__(self, template: Template, page_size: int, page_ttl: float, list_ttl: float, max_lists: int) -> None:
+        self._template = template
+        self._page_size = page_size
+        self._listings: BoundedStore[str, _Listing] = BoundedStore('expense_lists', max_size=max_lists, ttl=list_ttl)
+        self._pages: BoundedStore[tuple[str, int], ExpensePage] = BoundedStore(
+            'expense_pages', max_size=max_lists, ttl=page_ttl
+        )
+
+    async def open(self, user_id: int, expense_ids: list[int]) -> ExpensePage:
+        listing_id = secrets.token_urlsafe(6)
+        self._listings[listing_id] = _Listing(user_id, list(dict.fromkeys(expense_ids)))
+        page = await self._get(user_id, listing_id, 0)
+        assert page is not None
+        return page
+
+    async def turn(self, user_id: int, callback_data: str) -> ExpensePage | None:
+        # None when the list has expired or the data is not a page of a list of this user
+        try:
+            listing_id, page = callback_data.removeprefix(EXPENSES_PAGE_PREFIX).rsplit(':', 1)
+            return await self._get(user_id, listing_id, int(page))
+        except ValueError:
+            logger.warning(f'Invalid expense page callback data from user {user_id}: {callback_data}')
+            return None
+
+    async def _get(self, user_id: int, listing_id: str, page: int) -> ExpensePage | None:
+        listing = self._listings.get(listing_id)
+        if listing is None or listing.user_id != user_id or not 0 <= page < len(listing.cursors):
+            _page_requests.inc(outcome='expired')
+            return None
+        cached = self._pages.get((listing_id, page))
+        if cached is not None:
+            _page_requests.inc(outcome='cached')
+            return cached
+
+        _page_requests.inc(outcome='loaded')
+        expenses = await get_service_manager().expense.page(
+            listing.expense_ids, after=listing.cursors[page], limit=self._page_size + 1
+        )
+        has_next = len(expenses) > self._page_size
+        expenses = expenses[: self._page_size]
+        if has_next and len(listing.cursors) == page + 1:
+            listing.cursors.append((expenses[-1].date, expenses[-1].id))
+
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+        buttons = []
+        if page > 0:
+            buttons.append(
+                InlineKeyboardButton('« Previous', callback_data=f'{EXPENSES_PAGE_PREFIX}{listing_id}:{page - 1}')
+            )
+        if has_next:
+            buttons.append(
+                InlineKeyboardButton('Next »', callback_data=f'{EXPENSES_PAGE_PREFIX}{listing_id}:{page + 1}')
+            )
+        paged = page > 0 or has_next
+        text = self._template.render(expenses=expenses, page=page + 1 if paged else None)
+        result = ExpensePage(text=text, reply_markup=InlineKeyboardMarkup([buttons]) if buttons else None)
+        self._pages[(listing_id, page)] = result
+        return result
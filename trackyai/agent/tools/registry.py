@@ -1,8 +1,11 @@
 import asyncio
+import datetime
 import inspect
 import logging
 from typing import Annotated, Any, Callable, Coroutine, Iterable, Sequence, get_args, get_origin
 
+from pydantic import BaseModel, ConfigDict, Field, PydanticUserError, create_model, field_validator
+
 from trackyai.agent.tools.base import Tool, ToolArgument, ToolCall, ToolResult
 
 logger = logging.getLogger(__name__)
@@ -51,23 +54,45 @@ class _ToolsRegistry:
         logger.debug(f'Getting registered tools for: {scopes_or_tools}')
         if not scopes_or_tools:
             return self._available_tools.values()
-        tools = set()
+        # a dict keeps registration order, so that the same scopes always produce the same tools payload
+        tools: dict[Tool, None] = {}
         for scope_or_tool in scopes_or_tools:
             if isinstance(scope_or_tool, str) and scope_or_tool in self._scoped_tools:
-                tools.update(self._scoped_tools[scope_or_tool])
+                tools.update(dict.fromkeys(self._scoped_tools[scope_or_tool]))
             else:
-                tools.add(self[scope_or_tool])
-        return tools
+                tools[self[scope_or_tool]] = None
+        return list(tools)
 
 
 tool_registry: _ToolsRegistry = _ToolsRegistry()
 
 
-def _as_supported_typename(t: Any) -> str:
-    tname: str = str(t.__name__) if hasattr(t, '__name__') else str(t)
-    if tname not in ('int', 'float', 'str', 'datetime', 'bool', 'list'):
-        raise ValueError(f'{tname} is not a supported type')
-    return tname
+def _typename(t: Any) -> str:
+    # plain classes by name, generics and unions as written, e.g. `int | None` or `list[int]`
+    if isinstance(t, type) and not get_args(t):
+        return t.__name__
+    return str(t).replace('typing.', '').replace('datetime.', '')
+
+
+def _naive_utc(cls: type[BaseModel], value: Any) -> Any:  # noqa: ARG001
+    # the schema asks for RFC 3339 datetimes, i.e. with an offset; DB columns are naive UTC timestamps
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.UTC).replace(tzinfo=None)
+    return value
+
+
+def _arguments_model(name: str, fields: dict[str, Any]) -> type[BaseModel]:
+    try:
+        model = create_model(
+            f'{name}_arguments',
+            __config__=ConfigDict(extra='forbid'),
+            __validators__={'naive_utc': field_validator('*')(_naive_utc)},
+            **fields,
+        )
+        model.model_json_schema()
+    except (PydanticUserError, TypeError) as e:
+        raise ValueError(f'Arguments of {name} are not supported: {e}') from e
+    return model
 
 
 def tool(
@@ -76,6 +101,11 @@ def tool(
     *,
     terminating: bool = False,
     scopes: str | Sequence[str] = 'main',
+    keywords: Sequence[str] = (),
+    follows: Sequence[str] = (),
+    pure: bool = False,
+    reads: Sequence[str] = (),
+    writes: Sequence[str] = (),
 ) -> (
     Callable[[Callable[..., Coroutine[Any, Any, Any]]], Callable[..., Coroutine[Any, Any, Any]]]
     | Callable[..., Coroutine[Any, Any, Any]]
@@ -85,6 +115,7 @@ def tool(
             raise ValueError('A tool must be a coroutine function')
 
         tool_arguments: list[ToolArgument] = []
+        fields: dict[str, Any] = {}
 
         params = inspect.signature(func).parameters
         for param_name, param in params.items():
@@ -95,17 +126,23 @@ def tool(
                 raise ValueError('Argument annotations must contain exactly 2 values: type and description')
             if not isinstance(type_args[1], str):
                 raise ValueError(f'Second argument in argument annotation must be a string, {type_args=}')
-            tool_arguments.append(
-                ToolArgument(name=param_name, type=_as_supported_typename(type_args[0]), description=type_args[1])
-            )
+            tool_arguments.append(ToolArgument(name=param_name, type=_typename(type_args[0]), description=type_args[1]))
+            default = ... if param.default is inspect.Parameter.empty else param.default
+            fields[param_name] = (type_args[0], Field(default, description=type_args[1]))
 
         functool = Tool(
             name=func.__name__,
             awaitable=func,
             description=(func.__doc__ or '') + f'\nTerminating: {terminating}.',
             arguments=tool_arguments,
+            arguments_model=_arguments_model(func.__name__, fields),
             terminating=terminating,
             scopes=[scopes] if isinstance(scopes, str) else tuple(scopes),
+            keywords=tuple(keywords),
+            follows=tuple(follows),
+            pure=pure,
+            reads=tuple(reads),
+            writes=tuple(writes),
         )
 
         tool_registry.add(functool)
@@ -1,14 +1,35 @@
+import asyncio
 import logging
 from functools import wraps
 from typing import Any, Callable, Coroutine
 
 from telegram import Update
-from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters
-
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
+
+from trackyai.agent.completion_services import get_completion_service
+from trackyai.agent.tools.crud import get_expense_pages
+from trackyai.agent.tools.pages import EXPENSES_PAGE_PREFIX
 from trackyai.communication import CommunicationProxy, TelegramChatUpdate, comm_proxy_receive
-from trackyai.config import settings
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
 from trackyai.log import setup_logging
-from trackyai.session import session_manager
+from trackyai.metrics_server import start_metrics_server, stop_metrics_server
+from trackyai.recurring import update_recurring_expenses
+from trackyai.session import get_session_manager
+from trackyai.session_store import get_session_store
+from trackyai.tasks import supervisor
+from trackyai.update_processor import PerUserUpdateProcessor
+from trackyai.usage import UsageTotals, get_usage_accounting
+from trackyai.warmup import startup, warm_up
+from trackyai.webhook import serve_webhook
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +42,12 @@ I'm Tracky AI - smart expenses tracker with (almost) unlimited analytics feature
 Talk to me 😊
 """
 
+EXPIRED_PAGE_MESSAGE = 'This list has expired, ask me for the expenses again.'
+
+USAGE_MESSAGE = """Your usage of AI requests (UTC)
+Today: {today}
+This month: {month}"""
+
 
 async def send_restricted(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
     await context.bot.send_message(chat_id=user_id, text=RESTRICTED_MESSAGE)
@@ -31,12 +58,14 @@ def restricted(
 ) -> Callable[[Update, ContextTypes.DEFAULT_TYPE], Coroutine[Any, Any, Any]]:
     @wraps(handler)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.effective_user is None or update.message is None:
-            logger.warning('Got an Update without effective_user or message')
+        query = update.callback_query
+        if update.effective_user is None or (update.message is None and query is None):
+            logger.warning('Got an Update without effective_user, message or callback query')
             return
         user_id = update.effective_user.id
-        if user_id not in settings.allowed_user_ids:
-            logger.warning(f'Unauthorized user {update.effective_user.username} ({user_id}): {update.message.text}')
+        if user_id not in get_settings().allowed_user_ids:
+            text = update.message.text if update.message is not None else query.data if query is not None else None
+            logger.warning(f'Unauthorized user {update.effective_user.username} ({user_id}): {text}')
             await send_restricted(user_id, context)
             return
         return await handler(update, context)
@@ -55,23 +84,118 @@ async def start(update: TelegramChatUpdate) -> None:
 @comm_proxy_receive
 async def process_message(update: TelegramChatUpdate) -> None:
     logger.info(f'Got message from {update.user.username} ({update.user.id})')
-    session = session_manager.get_or_create_session(user_id=update.user.id)
-    session.add_user_message(message=update.message.text or '')
+    await get_session_manager().deliver(user_id=update.user.id, message=update.message.text or '')
 
 
-def run() -> None:
-    setup_logging()
+def _describe_usage(totals: UsageTotals, budget: float | None) -> str:
+    text = (
+        f'{totals.calls} requests, {totals.prompt_tokens} prompt tokens ({totals.cached_tokens} cached), '
+        f'{totals.completion_tokens} completion tokens, ${totals.cost:.4f}'
+    )
+    return text if budget is None else f'{text} of ${budget:.2f}'
 
-    application: Application = ApplicationBuilder().token(settings.bot_token).build()
+
+@restricted
+@comm_proxy_receive
+async def usage(update: TelegramChatUpdate) -> None:
+    logger.info(f'Got /usage request from {update.user.username} ({update.user.id})')
+    accounting = get_usage_accounting()
+    user_usage = await accounting.usage(update.user.id)
+    await CommunicationProxy.get_for(user_id=update.user.id).send_text(
+        message=USAGE_MESSAGE.format(
+            today=_describe_usage(user_usage.today, accounting.daily_budget),
+            month=_describe_usage(user_usage.month, accounting.monthly_budget),
+        )
+    )
+
+
+@restricted
+async def turn_expenses_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:  # noqa: ARG001
+    query = update.callback_query
+    if query is None or query.data is None:
+        return
+    page = await get_expense_pages().turn(user_id=query.from_user.id, callback_data=query.data)
+    if page is None:
+        await query.answer(text=EXPIRED_PAGE_MESSAGE)
+        return
+    await query.answer()
+    await query.edit_message_text(text=page.text, reply_markup=page.reply_markup)
+
+
+async def detect_recurring_expenses(context: ContextTypes.DEFAULT_TYPE) -> None:  # noqa: ARG001
+    await update_recurring_expenses()
+
+
+async def start_up(application: Application) -> None:  # noqa: ARG001
+    with startup.stage('metrics_server'):
+        await start_metrics_server()
+    await warm_up()
+    with startup.stage('resume_sessions'):
+        await get_session_manager().resume()
+    startup.report()
+
+
+async def drain(application: Application) -> None:  # noqa: ARG001
+    # runs while the bot can still send messages: sessions first, then the tool calls and replies they left behind
+    timeout = get_settings().shutdown_timeout
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    await get_session_manager().drain(timeout=timeout)
+    await get_usage_accounting().close()
+    await supervisor.drain(timeout=max(deadline - loop.time(), 0))
+    await CommunicationProxy.save_all_histories()
+
+
+async def close_resources(application: Application) -> None:  # noqa: ARG001
+    await get_completion_service(get_settings().completion_service).close()
+    session_store = get_session_store()
+    if session_store is not None:
+        await session_store.close()
+    await get_service_manager().engine.dispose()
+    await stop_metrics_server()
+    logger.info('Shut down')
+
+
+def build_application() -> Application:
+    settings = get_settings()
+    builder = ApplicationBuilder().token(settings.bot_token)
+    builder = builder.post_init(start_up).post_stop(drain).post_shutdown(close_resources)
+    builder = builder.concurrent_updates(PerUserUpdateProcessor(settings.concurrent_updates))
+    if settings.telegram_base_url:
+        builder = builder.base_url(settings.telegram_base_url)
+    if settings.updates_mode == 'webhook':
+        builder = builder.updater(None)
+    application: Application = builder.build()
     CommunicationProxy.setup_proxy(bot=application.bot)
 
     start_handler = CommandHandler('start', start)
+    usage_handler = CommandHandler('usage', usage)
     messages_handler = MessageHandler(filters.TEXT, process_message)
+    expenses_page_handler = CallbackQueryHandler(turn_expenses_page, pattern=f'^{EXPENSES_PAGE_PREFIX}')
 
     application.add_handler(start_handler)
+    application.add_handler(usage_handler)
     application.add_handler(messages_handler)
+    application.add_handler(expenses_page_handler)
 
-    application.run_polling()
+    if application.job_queue is None:
+        logger.warning('The job queue of python-telegram-bot is not installed, recurring expenses are not detected')
+    else:
+        application.job_queue.run_repeating(
+            detect_recurring_expenses, interval=settings.recurring_detection_interval, first=60, name='recurring'
+        )
+    return application
+
+
+def run() -> None:
+    with startup.stage('logging'):
+        setup_logging()
+    with startup.stage('application'):
+        application = build_application()
+    if get_settings().updates_mode == 'webhook':
+        asyncio.run(serve_webhook(application))
+    else:
+        application.run_polling()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Iterator, TypeVar
+
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_evictions = metrics.counter('bounded_store_evictions_total', 'Entries evicted from bounded stores', ['store'])
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+
+# A mapping bounded by size and idle time. Entries are kept in the order of their last access, so the least recently
+# used ones are evicted first and the TTL sweep stops at the first entry that is still fresh.
+# Entries rejected by `can_evict` are never evicted: the TTL sweep counts them as just used.
+class BoundedStore(Generic[K, V]):
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl: float,
+        can_evict: Callable[[V], bool] = lambda _: True,
+        on_evict: Callable[[K, V], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self._max_size = max_size
+        self._ttl = ttl
+        self._can_evict = can_evict
+        self._on_evict = on_evict
+        self._clock = clock
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._entries))
+
+    def get(self, key: K) -> V | None:
+        self._evict_expired()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries[key] = (entry[0], self._clock())
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def __getitem__(self, key: K) -> V:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._entries[key] = (value, self._clock())
+        self._entries.move_to_end(key)
+        self._evict_expired()
+        self._evict_oversize(keep=key)
+
+    def values(self) -> list[V]:
+        return [value for value, _ in self._entries.values()]
+
+    def pop(self, key: K) -> V | None:
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def _evict(self, key: K) -> None:
+        value, _ = self._entries.pop(key)
+        _evictions.inc(store=self.name)
+        if self._on_evict is not None:
+            try:
+                self._on_evict(key, value)
+            except Exception as e:
+                logger.error(f'Error while evicting {key} from {self.name}', exc_info=e)
+
+    def _evict_expired(self) -> None:
+        deadline = self._clock() - self._ttl
+        while self._entries:
+            key, (_, last_access) = next(iter(self._entries.items()))
+            if last_access > deadline:
+                return
+            value = self._entries[key][0]
+            if not self._can_evict(value):
+                self._entries[key] = (value, self._clock())
+                self._entries.move_to_end(key)
+                continue
+            logger.debug(f'Evicting idle {key} from {self.name}')
+            self._evict(key)
+
+    def _evict_oversize(self, keep: K) -> None:
+        if len(self._entries) <= self._max_size:
+            return
+        for key in [key for key, (value, _) in self._entries.items() if key != keep and self._can_evict(value)]:
+            if len(self._entries) <= self._max_size:
+                return
+            logger.debug(f'Evicting least recently used {key} from {self.name}')
+            self._evict(key)
+        if len(self._entries) > self._max_size:
+            logger.warning(f'{self.name} holds {len(self._entries)} entries over its limit of {self._max_size}')
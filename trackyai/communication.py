@@ -1,13 +1,25 @@
 import logging
+import sys
 from collections import deque
-from typing import Any, Callable, Coroutine, Literal, Sequence
+from typing import IO, Any, Callable, Coroutine, Literal, Sequence
 
 from pydantic import BaseModel
-from telegram import Bot, Message, Update, User
+from telegram import Bot, InlineKeyboardMarkup, Message, Update, User
 from telegram.ext import ContextTypes
 
+from trackyai.bounded_store import BoundedStore
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.metrics import metrics
+from trackyai.outbound import OutboundQueue
+from trackyai.tasks import supervisor
+
 logger = logging.getLogger(__name__)
 
+_HISTORY_LENGTH = 6
+
+_request_seconds = metrics.histogram('telegram_request_seconds', 'Duration of Bot API requests', ['method'])
+
 
 class _ChatTurn(BaseModel, frozen=True):
     role: Literal['user', 'agent']
@@ -19,24 +31,58 @@ class TelegramChatUpdate(BaseModel, frozen=True, arbitrary_types_allowed=True):
     message: Message
 
 
+def _save_evicted_history(user_id: int, proxy: 'CommunicationProxy') -> None:
+    logger.info(f'Evicting CommunicationProxy for {user_id}')
+    supervisor.spawn(proxy.save_history(), name='save_evicted_history')
+
+
 class CommunicationProxy:
     _bot: Bot | None = None
-    _communication_proxies: dict[int, 'CommunicationProxy'] = {}
+    _outbound: OutboundQueue | None = None
+    _communication_proxies: BoundedStore[int, 'CommunicationProxy'] | None = None
 
     def __init__(self, user_id: int):
         logger.info(f'Initializing CommunicationProxy for {user_id}')
         self._user_id = user_id
-        self._message_history: deque[_ChatTurn] = deque(maxlen=6)
+        self._message_history: deque[_ChatTurn] = deque(maxlen=_HISTORY_LENGTH)
+        self._history_restored = False
 
     @classmethod
     def setup_proxy(cls, bot: Bot):
+        settings = get_settings()
         CommunicationProxy._bot = bot
 
+        async def send_message(chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None) -> None:
+            with _request_seconds.time(method='send_message'):
+                await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+
+        CommunicationProxy._outbound = OutboundQueue(
+            send=send_message,
+            global_rate=settings.outbound_global_rate,
+            chat_rate=settings.outbound_chat_rate,
+            max_retries=settings.outbound_max_retries,
+        )
+
+    @classmethod
+    def proxies(cls) -> BoundedStore[int, 'CommunicationProxy']:
+        if CommunicationProxy._communication_proxies is None:
+            settings = get_settings()
+            CommunicationProxy._communication_proxies = BoundedStore(
+                'communication_proxies',
+                max_size=settings.max_communication_proxies,
+                ttl=settings.communication_proxy_idle_ttl,
+                on_evict=_save_evicted_history,
+            )
+        return CommunicationProxy._communication_proxies
+
     @classmethod
     def get_for(cls, user_id: int) -> 'CommunicationProxy':
-        if user_id not in CommunicationProxy._communication_proxies:
-            CommunicationProxy._communication_proxies[user_id] = CommunicationProxy(user_id=user_id)
-        return CommunicationProxy._communication_proxies[user_id]
+        proxies = CommunicationProxy.proxies()
+        proxy = proxies.get(user_id)
+        if proxy is None:
+            proxy = CommunicationProxy(user_id=user_id)
+            proxies[user_id] = proxy
+        return proxy
 
     def receive(self, update: Update, *args, **kwargs) -> TelegramChatUpdate:  # noqa: ARG002
         if update.message is None or update.effective_user is None:
@@ -50,16 +96,58 @@ class CommunicationProxy:
         self._message_history.append(_ChatTurn(role='user', message=chat_update.message.text))
         return chat_update
 
-    async def send_text(self, message: str) -> None:
-        if self._bot is None:
+    async def send_text(self, message: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        if self._outbound is None:
             raise RuntimeError('Communication proxy is not initialized')
         self._message_history.append(_ChatTurn(role='agent', message=message))
-        await self._bot.send_message(chat_id=self._user_id, text=message)
+        await self._outbound.send(self._user_id, message, reply_markup)
+
+    async def send_document(self, document: IO[bytes], filename: str, caption: str | None = None) -> None:
+        # documents are rare and large, they are uploaded directly instead of going through the text queue
+        if self._bot is None:
+            raise RuntimeError('Communication proxy is not initialized')
+        self._message_history.append(_ChatTurn(role='agent', message=caption or filename))
+        with _request_seconds.time(method='send_document'):
+            await self._bot.send_document(chat_id=self._user_id, document=document, filename=filename, caption=caption)
 
     @property
     def history(self) -> Sequence[_ChatTurn]:
         return tuple(self._message_history)
 
+    async def restore_history(self) -> None:
+        # the history of an evicted proxy is persisted, a new proxy for the same user picks it up once
+        if self._history_restored:
+            return
+        self._history_restored = True
+        dialog = await get_service_manager().dialog.get(self._user_id)
+        if dialog is not None:
+            restored = [_ChatTurn.model_validate(turn) for turn in dialog.turns]
+            self._message_history = deque([*restored, *self._message_history], maxlen=_HISTORY_LENGTH)
+
+    async def save_history(self) -> None:
+        await get_service_manager().dialog.save(self._user_id, [turn.model_dump() for turn in self._message_history])
+
+    def retained_bytes(self) -> int:
+        return sum(sys.getsizeof(turn.message or '') for turn in self._message_history)
+
+    @classmethod
+    async def save_all_histories(cls) -> None:
+        proxies = CommunicationProxy.proxies().values()
+        logger.info(f'Saving dialogs of {len(proxies)} communication proxies')
+        for proxy in proxies:
+            try:
+                await proxy.save_history()
+            except Exception as e:
+                logger.error(f'Error while saving the dialog of user {proxy._user_id}', exc_info=e)
+
+
+metrics.gauge('communication_proxies', 'Communication proxies kept in memory').set_function(
+    lambda: len(CommunicationProxy.proxies())
+)
+metrics.gauge('communication_proxies_bytes', 'Approximate bytes retained by communication proxies').set_function(
+    lambda: sum(proxy.retained_bytes() for proxy in CommunicationProxy.proxies().values())
+)
+
 
 def comm_proxy_receive(
     func: Callable[[TelegramChatUpdate], Coroutine[Any, Any, Any]],
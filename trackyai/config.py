@@ -1,7 +1,6 @@
 import logging
-from functools import cached_property
-from pathlib import Path
-from typing import Annotated, Any
+from functools import cache, cached_property
+from typing import Annotated, Literal
 
 from pydantic import Field, computed_field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -28,6 +27,22 @@ class Settings(BaseSettings):
     # telegram
     bot_token: str
     allowed_user_ids: frozenset[int]
+    telegram_base_url: str | None = None
+    concurrent_updates: int = 64
+
+    # telegram updates are polled, or received with a webhook served on webhook_listen:webhook_port
+    updates_mode: Literal['polling', 'webhook'] = 'polling'
+    webhook_url: str | None = None
+    webhook_path: str = '/telegram'
+    webhook_listen: str = '0.0.0.0'
+    webhook_port: int = 8080
+    webhook_secret_token: str | None = None
+    webhook_max_connections: int = 40
+
+    # telegram flood limits of outbound messages, per second
+    outbound_global_rate: float = 30
+    outbound_chat_rate: float = 1
+    outbound_max_retries: int = 3
 
     # postgres
     pg_host: str
@@ -37,10 +52,73 @@ class Settings(BaseSettings):
     # openai
     openai: Annotated[_OpenAISettings, Field(default_factory=_OpenAISettings)]
 
+    # completion service
+    completion_service: Literal['openai', 'stub'] = 'openai'
+    stub_latency: float = 0.5
+    # off by default: a tools payload changing between steps defeats provider-side prompt caching
+    tool_selection: bool = False
+
+    # agent sessions
+    session_max_steps: int = 10
+    session_time_budget: float = 120
+    session_store: Literal['memory', 'postgres'] = 'memory'
+
+    # session jobs run on a pool of workers; users waiting for a worker over the threshold are told that they are queued
+    dispatcher_workers: int = 32
+    dispatcher_busy_threshold: int = 64
+    dispatcher_max_user_messages: int = 20
+
+    # time for in-flight sessions and background tasks to finish on shutdown
+    shutdown_timeout: float = 30
+
+    # expense lists are sent page by page; pages are cached for back-navigation, lists expire with their buttons
+    expenses_page_size: int = 10
+    expenses_page_ttl: float = 5 * 60
+    expenses_list_ttl: float = 24 * 60 * 60
+    max_expense_lists: int = 1000
+
+    # expense exports are streamed from the DB in chunks into a file kept in memory up to export_spool_size bytes
+    export_chunk_size: int = 1000
+    export_spool_size: int = 1024 * 1024
+
+    # results of pure tools are shared by sessions until the tables they read change, or for tool_memo_ttl seconds
+    tool_memo_max_size: int = 1000
+    tool_memo_ttl: float = 60
+
+    # usage of completions is written to the DB in batches of usage_batch_size, at least every usage_flush_interval
+    # seconds; over the daily budget (USD) sessions of a user take the fast path of up to usage_fast_path_max_steps
+    # steps, over the monthly budget the bot refuses to run them
+    usage_batch_size: int = 100
+    usage_flush_interval: float = 5
+    usage_totals_ttl: float = 60
+    usage_daily_budget: float | None = None
+    usage_monthly_budget: float | None = None
+    usage_fast_path_max_steps: int = 3
+
+    # recurring expenses are detected by a periodic job, in groups of at least recurring_min_occurrences expenses
+    # made within the last recurring_history_days days (long enough for yearly expenses)
+    recurring_detection_interval: float = 6 * 60 * 60
+    recurring_min_occurrences: int = 3
+    recurring_history_days: int = 3 * 366
+
+    # metrics in the Prometheus format are served on metrics_listen:metrics_port/metrics, unless the port is empty
+    metrics_listen: str = '127.0.0.1'
+    metrics_port: int | None = 9464
+
+    # in-memory state
+    max_sessions: int = 1000
+    session_idle_ttl: float = 30 * 60
+    max_communication_proxies: int = 10000
+    communication_proxy_idle_ttl: float = 6 * 60 * 60
+
     # logging & debug
     debug_mode: bool = False
     log_dir: str = '/var/log'
     log_level: int | str = logging.INFO
+    log_format: Literal['text', 'json'] = 'json'
+    # spans of sessions, steps, tool calls and DB statements are written to log_dir/traces.jsonl
+    tracing: bool = True
+    slow_query_seconds: float = 0.5
 
     @computed_field  # type: ignore[misc]
     @cached_property
@@ -63,8 +141,16 @@ class Settings(BaseSettings):
             raise ValueError(f'Invalid log level: {log_level}')
         return log_level
 
-    def model_post_init(self, __context: Any) -> None:
-        Path(self.log_dir).mkdir(parents=True, exist_ok=True)
+    @field_validator('metrics_port', mode='before')
+    @classmethod
+    def validate_metrics_port(cls, metrics_port: int | str | None) -> int | str | None:
+        # TRACKYAI_METRICS_PORT= disables the endpoint
+        if isinstance(metrics_port, str) and not metrics_port.strip():
+            return None
+        return metrics_port
 
 
-settings = Settings()
+# settings are read from the environment when they are first needed, not when the package is imported
+@cache
+def get_settings() -> Settings:
+    return Settings()
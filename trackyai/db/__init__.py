@@ -1,12 +1,69 @@
 import asyncio
+from functools import cache
+from typing import TYPE_CHECKING, Any
 
-from trackyai.db.model import Category, EnvironmentConfiguration, Expense, Memory
-from trackyai.db.service import ServiceManager
+if TYPE_CHECKING:
+    from trackyai.db.model import (
+        Budget,
+        Category,
+        Dialog,
+        EnvironmentConfiguration,
+        Expense,
+        ExpenseChange,
+        JobState,
+        LlmUsage,
+        Memory,
+        RecurringExpense,
+        SessionCheckpoint,
+    )
+    from trackyai.db.service import ServiceManager
 
-service_manager = ServiceManager()
+__all__ = [
+    'get_service_manager',
+    'Expense',
+    'Category',
+    'EnvironmentConfiguration',
+    'Memory',
+    'Dialog',
+    'SessionCheckpoint',
+    'LlmUsage',
+    'Budget',
+    'RecurringExpense',
+    'JobState',
+    'ExpenseChange',
+]
 
-__all__ = ['service_manager', 'Expense', 'Category', 'EnvironmentConfiguration', 'Memory']
+_MODELS = (
+    'Budget',
+    'Category',
+    'Dialog',
+    'EnvironmentConfiguration',
+    'Expense',
+    'ExpenseChange',
+    'JobState',
+    'LlmUsage',
+    'Memory',
+    'RecurringExpense',
+    'SessionCheckpoint',
+)
+
+
+# the models and SQLAlchemy are imported when they are first used, so that importing modules that only call the
+# service manager at runtime stays cheap
+def __getattr__(name: str) -> Any:
+    if name in _MODELS:
+        from trackyai.db import model
+
+        return getattr(model, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+@cache
+def get_service_manager() -> 'ServiceManager':
+    from trackyai.db.service import ServiceManager
+
+    return ServiceManager()
 
 
 if __name__ == '__main__':
-    asyncio.run(service_manager.create_database())
+    asyncio.run(get_service_manager().create_database())
@@ -1,10 +1,25 @@
 import datetime
+from typing import Any
 
-from sqlalchemy import CheckConstraint, ForeignKey, Text, func
+from sqlalchemy import JSON, CheckConstraint, ForeignKey, Index, String, Text, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-__all__ = ['Base', 'EnvironmentConfiguration', 'Expense', 'Category', 'Memory']
+__all__ = [
+    'Base',
+    'EnvironmentConfiguration',
+    'Expense',
+    'Category',
+    'Memory',
+    'Dialog',
+    'SessionCheckpoint',
+    'LlmUsage',
+    'Budget',
+    'RecurringExpense',
+    'JobState',
+    'ExpenseChange',
+]
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -46,8 +61,118 @@ class Category(Base):
     expenses: Mapped[list[Expense]] = relationship('Expense', back_populates='category')
 
 
+class Budget(Base):
+    __tablename__ = 'budget'
+
+    __table_args__ = (
+        UniqueConstraint('category_id', 'currency', 'period', name='uq_budget_category_id_currency_period'),
+        CheckConstraint('amount > 0', name='check_budget_amount_positive'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    category_id: Mapped[int] = mapped_column(ForeignKey('category.id'))
+    currency: Mapped[str]
+    # a `date_trunc` field: week, month or year
+    period: Mapped[str]
+    amount: Mapped[float]
+    # the running total of the expenses of the period starting at period_start, kept up to date by ExpenseService
+    spent: Mapped[float] = mapped_column(default=0)
+    period_start: Mapped[datetime.datetime]
+
+    # Relationships
+    category: Mapped[Category] = relationship('Category')
+
+
+class RecurringExpense(Base):
+    __tablename__ = 'recurring_expense'
+
+    __table_args__ = (
+        UniqueConstraint(
+            'category_id', 'comment_key', 'currency', name='uq_recurring_expense_category_id_comment_key_currency'
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    category_id: Mapped[int] = mapped_column(ForeignKey('category.id'))
+    # the normalized comment shared by the expenses, `comment` is the latest one as it was written
+    comment_key: Mapped[str] = mapped_column(Text)
+    comment: Mapped[str] = mapped_column(Text)
+    currency: Mapped[str]
+    amount: Mapped[float]
+    period_days: Mapped[float]
+    occurrences: Mapped[int]
+    last_date: Mapped[datetime.datetime]
+    next_date: Mapped[datetime.datetime]
+
+    # Relationships
+    category: Mapped[Category] = relationship('Category')
+
+
+class JobState(Base):
+    __tablename__ = 'job_state'
+
+    # a batch job that has run at least once, `updated_at` is the time of its last run
+    name: Mapped[str] = mapped_column(primary_key=True)
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+
+class ExpenseChange(Base):
+    __tablename__ = 'expense_change'
+
+    # the group of an added expense, or of an edited one before and after the edit, until the recurring expenses job
+    # has detected it again; rows become visible with the commit of the expense, so the job never skips one
+    id: Mapped[int] = mapped_column(primary_key=True)
+    category_id: Mapped[int]
+    currency: Mapped[str]
+    comment: Mapped[str] = mapped_column(Text)
+
+
 class Memory(Base):
     __tablename__ = 'memory'
 
     user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
     memory: Mapped[str] = mapped_column(Text)
+
+
+class Dialog(Base):
+    __tablename__ = 'dialog'
+
+    user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    turns: Mapped[list[dict[str, Any]]] = mapped_column(JSON)
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+
+class SessionCheckpoint(Base):
+    __tablename__ = 'session_state'
+
+    user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    system_prompt: Mapped[str] = mapped_column(Text, default='')
+    chat: Mapped[list[dict[str, Any]]] = mapped_column(JSONB, default=list)
+    user_messages: Mapped[list[str]] = mapped_column(JSONB, default=list)
+    pending_messages: Mapped[list[str]] = mapped_column(JSONB, default=list)
+    steps: Mapped[list[dict[str, Any]]] = mapped_column(JSONB, default=list)
+    time_left: Mapped[float | None]
+    # the trace id of the session and its start as a unix time, shared by all jobs of the session
+    session_id: Mapped[str | None]
+    started_at: Mapped[float | None]
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+
+class LlmUsage(Base):
+    __tablename__ = 'llm_usage'
+
+    __table_args__ = (Index('ix_llm_usage_user_id_created_at', 'user_id', 'created_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int]
+    session: Mapped[str] = mapped_column(String(32))
+    model: Mapped[str]
+    prompt_tokens: Mapped[int]
+    cached_tokens: Mapped[int]
+    completion_tokens: Mapped[int]
+    # USD
+    cost: Mapped[float]
+    # seconds
+    latency: Mapped[float]
+    # UTC; records are written in batches, so the time of the completion is set by the bot, not by the DB
+    created_at: Mapped[datetime.datetime]
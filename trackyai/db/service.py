@@ -1,19 +1,87 @@
 import datetime
+import inspect
 import logging
-from typing import Sequence, cast
+from contextlib import AsyncExitStack
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, Coroutine, Sequence, cast
 
-from sqlalchemy import ColumnElement, select
+from sqlalchemy import ColumnElement, Row, and_, case, delete, func, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import joinedload
 
-from trackyai.config import settings
-from trackyai.db.model import Base, Category, EnvironmentConfiguration, Expense, Memory
+from trackyai.config import get_settings
+from trackyai.db.model import (
+    Base,
+    Budget,
+    Category,
+    Dialog,
+    EnvironmentConfiguration,
+    Expense,
+    ExpenseChange,
+    JobState,
+    LlmUsage,
+    Memory,
+    RecurringExpense,
+)
+from trackyai.metrics import metrics
+from trackyai.tracing import instrument_engine
+from trackyai.usage import UsageTotals
 
 logger = logging.getLogger(__name__)
 
+_call_seconds = metrics.histogram('db_call_seconds', 'Duration of DB service calls', ['service', 'method'])
+
+
+def _timed(service: str, method: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Coroutine[Any, Any, Any]]:
+    @wraps(method)
+    async def wrapped(*args: Any, **kwargs: Any) -> Any:
+        with _call_seconds.time(service=service, method=method.__name__):
+            return await method(*args, **kwargs)
+
+    return wrapped
+
+
+async def _track_budgets(
+    session: AsyncSession, category_id: int, currency: str, date: datetime.datetime, amount: float
+) -> Sequence[Budget]:
+    # Adds the amount of an expense to the running totals of its budgets, within the transaction changing the expense,
+    # and returns the budgets pushed over their amounts. A single indexed UPDATE: expenses of older periods are not
+    # counted, an expense of a newer period starts the new period of a budget.
+    period_start = func.date_trunc(Budget.period, date)
+    spent: ColumnElement[float]
+    if amount >= 0:
+        within = period_start >= Budget.period_start
+        spent = case((period_start == Budget.period_start, Budget.spent + amount), else_=amount)
+    else:
+        within = period_start == Budget.period_start
+        spent = Budget.spent + amount
+    stmt = (
+        update(Budget)
+        .where(Budget.category_id == category_id, Budget.currency == currency, within)
+        .values(spent=spent, period_start=period_start)
+        .returning(Budget)
+    )
+    exceeded = [
+        budget
+        for budget in (await session.scalars(stmt)).all()
+        if budget.spent - amount < budget.amount <= budget.spent
+    ]
+    for budget in exceeded:
+        # the category is in the identity map already, alerts name it
+        await budget.awaitable_attrs.category
+    return exceeded
+
 
 class DbService:
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        # every public coroutine method of a service is timed; streams are timed by their consumers
+        super().__init_subclass__(**kwargs)
+        for name, attribute in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(attribute):
+                setattr(cls, name, _timed(cls.__name__, attribute))
+
     def __init__(self, engine: AsyncEngine):
         self.session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -57,6 +125,21 @@ class MemoryService(DbService):
             return mem
 
 
+class DialogService(DbService):
+    async def get(self, user_id: int) -> Dialog | None:
+        stmt = select(Dialog).where(cast(ColumnElement[bool], Dialog.user_id == user_id))
+        async with self.session_maker() as session:
+            return (await session.scalars(stmt)).one_or_none()
+
+    async def save(self, user_id: int, turns: list[dict[str, Any]]) -> None:
+        stmt = insert(Dialog).values(user_id=user_id, turns=turns)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Dialog.user_id], set_={'turns': stmt.excluded.turns, 'updated_at': func.now()}
+        )
+        async with self.session_maker() as session, session.begin():
+            await session.execute(stmt)
+
+
 class CategoryService(DbService):
     async def get(self, category_id: int) -> Category:
         stmt = select(Category).where(cast(ColumnElement[bool], Category.id == category_id))
@@ -91,6 +174,39 @@ class CategoryService(DbService):
             return category
 
 
+class BudgetService(DbService):
+    async def set(self, category_id: int, currency: str, period: str, amount: float) -> Budget:
+        # a new budget starts with the expenses of the current period, an existing one only changes its amount
+        period_start = func.date_trunc(period, func.now())
+        spent = (
+            select(func.coalesce(func.sum(Expense.amount), 0))
+            .where(Expense.category_id == category_id, Expense.currency == currency, Expense.date >= period_start)
+            .scalar_subquery()
+        )
+        stmt = insert(Budget).values(
+            category_id=category_id,
+            currency=currency,
+            period=period,
+            amount=amount,
+            spent=spent,
+            period_start=period_start,
+        )
+        upsert = stmt.on_conflict_do_update(
+            index_elements=[Budget.category_id, Budget.currency, Budget.period], set_={'amount': stmt.excluded.amount}
+        ).returning(Budget.id)
+        async with self.session_maker() as session, session.begin():
+            if await session.get(Category, category_id) is None:
+                raise ValueError(f'Category with id {category_id} does not exist')
+            budget_id = (await session.execute(upsert)).scalar_one()
+            return (
+                await session.scalars(
+                    select(Budget)
+                    .where(cast(ColumnElement[bool], Budget.id == budget_id))
+                    .options(joinedload(Budget.category, innerjoin=True))
+                )
+            ).one()
+
+
 class ExpenseService(DbService):
     async def get(self, expense_id: int) -> Expense:
         stmt = (
@@ -110,12 +226,39 @@ class ExpenseService(DbService):
         async with self.session_maker() as session:
             return (await session.scalars(stmt)).all()
 
+    async def page(
+        self, expense_ids: list[int], after: tuple[datetime.datetime, int] | None, limit: int
+    ) -> Sequence[Expense]:
+        # keyset pagination, newest first: `after` is the (date, id) of the last expense of the previous page
+        conditions: list[ColumnElement[bool]] = [Expense.id.in_(expense_ids)]
+        if after is not None:
+            conditions.append(tuple_(Expense.date, Expense.id) < tuple_(*after))
+        stmt = (
+            select(Expense)
+            .where(*conditions)
+            .options(joinedload(Expense.category, innerjoin=True))
+            .order_by(Expense.date.desc(), Expense.id.desc())
+            .limit(limit)
+        )
+        async with self.session_maker() as session:
+            return (await session.scalars(stmt)).all()
+
     async def get_all(self) -> Sequence[Expense]:
         stmt = select(Expense).options(joinedload(Expense.category, innerjoin=True))
         async with self.session_maker() as session:
             return (await session.scalars(stmt)).all()
 
-    async def add(self, category_id: int, currency: str, amount: float, comment: str | None = None) -> Expense:
+    async def comments(self) -> Sequence[tuple[int, int, str]]:
+        stmt = select(Expense.id, Expense.category_id, Expense.comment).where(
+            cast(ColumnElement[bool], Expense.comment != '')
+        )
+        async with self.session_maker() as session:
+            return [(row.id, row.category_id, row.comment) for row in await session.execute(stmt)]
+
+    async def add(
+        self, category_id: int, currency: str, amount: float, comment: str | None = None
+    ) -> tuple[Expense, Sequence[Budget]]:
+        # returns the new expense and the budgets it has pushed over their amounts
         async with self.session_maker() as session, session.begin():
             try:
                 category = (
@@ -125,7 +268,10 @@ class ExpenseService(DbService):
                 raise ValueError(f'Category with id {category_id} does not exist') from None
             expense = Expense(currency=currency, amount=amount, comment=comment or '', category=category)
             session.add(expense)
-            return expense
+            await session.flush()
+            session.add(ExpenseChange(category_id=category.id, currency=currency, comment=expense.comment))
+            exceeded = await _track_budgets(session, category.id, currency, expense.date, amount)
+            return expense, exceeded
 
     async def update(
         self,
@@ -135,7 +281,8 @@ class ExpenseService(DbService):
         currency: str | None = None,
         amount: float | None = None,
         comment: str | None = None,
-    ) -> Expense:
+    ) -> tuple[Expense, Sequence[Budget]]:
+        # returns the updated expense and the budgets it has pushed over their amounts
         if not any(map(lambda x: x is not None, (category_id, date, currency, amount, comment))):
             raise ValueError('At least one value must be specified to update an expense')
         async with self.session_maker() as session, session.begin():
@@ -149,6 +296,9 @@ class ExpenseService(DbService):
                 ).one()
             except NoResultFound:
                 raise ValueError(f'Expense with id {expense_id} does not exist') from None
+            previous = (expense.category_id, expense.currency, expense.date)
+            previous_amount = expense.amount
+            previous_group = (expense.category_id, expense.currency, expense.comment)
             if category_id is not None:
                 try:
                     category = (
@@ -167,7 +317,22 @@ class ExpenseService(DbService):
                 expense.amount = amount
             if comment is not None:
                 expense.comment = comment
-            return expense
+            await session.flush()
+            # the recurring expenses job detects the groups the expense has left and joined again
+            group = (expense.category_id, expense.currency, expense.comment)
+            await session.execute(
+                insert(ExpenseChange).values(
+                    [dict(zip(('category_id', 'currency', 'comment'), changed)) for changed in {previous_group, group}]
+                )
+            )
+            if (expense.category_id, expense.currency, expense.date) == previous:
+                exceeded = await _track_budgets(session, *previous, expense.amount - previous_amount)
+            else:
+                await _track_budgets(session, *previous, -previous_amount)
+                exceeded = await _track_budgets(
+                    session, expense.category_id, expense.currency, expense.date, expense.amount
+                )
+            return expense, exceeded
 
     async def find(
         self,
@@ -212,6 +377,22 @@ class ExpenseService(DbService):
         async with self.session_maker() as session:
             return (await session.scalars(stmt)).all()
 
+    async def stream(
+        self, date_from: datetime.datetime, date_to: datetime.datetime, chunk_size: int
+    ) -> AsyncIterator[Sequence[Row[int, datetime.datetime, str, str, float, str]]]:
+        # plain rows in chunks from a server-side cursor, so that exports never hold the whole history in memory
+        stmt = (
+            select(Expense.id, Expense.date, Category.name, Expense.currency, Expense.amount, Expense.comment)
+            .join(Expense.category)
+            .where(Expense.date >= date_from, Expense.date <= date_to)
+            .order_by(Expense.date, Expense.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        async with self.session_maker() as session:
+            result = await session.stream(stmt)
+            async for chunk in result.partitions():
+                yield chunk
+
     async def latest(self, limit: int) -> Sequence[Expense]:
         stmt = (
             select(Expense)
@@ -223,15 +404,148 @@ class ExpenseService(DbService):
             return (await session.scalars(stmt)).all()
 
 
+class UsageService(DbService):
+    async def add_many(self, records: Sequence[dict[str, Any]]) -> None:
+        async with self.session_maker() as session, session.begin():
+            await session.execute(insert(LlmUsage), records)
+
+    async def totals(
+        self, user_id: int, day_start: datetime.datetime, month_start: datetime.datetime
+    ) -> tuple[UsageTotals, UsageTotals]:
+        # the totals of the day and of the month in a single scan of the user's month
+        def columns(start: datetime.datetime) -> list[ColumnElement[Any]]:
+            within = LlmUsage.created_at >= start
+            sums = [
+                func.coalesce(func.sum(column).filter(within), 0)
+                for column in (
+                    LlmUsage.prompt_tokens,
+                    LlmUsage.cached_tokens,
+                    LlmUsage.completion_tokens,
+                    LlmUsage.cost,
+                )
+            ]
+            return [func.count().filter(within), *sums]
+
+        stmt = select(*columns(day_start), *columns(month_start)).where(
+            LlmUsage.user_id == user_id, LlmUsage.created_at >= month_start
+        )
+        async with self.session_maker() as session:
+            row = (await session.execute(stmt)).one()
+        return UsageTotals(*row[:5]), UsageTotals(*row[5:])
+
+
+class RecurringExpenseService(DbService):
+    async def get_all(self) -> Sequence[RecurringExpense]:
+        stmt = (
+            select(RecurringExpense)
+            .options(joinedload(RecurringExpense.category, innerjoin=True))
+            .order_by(RecurringExpense.next_date)
+        )
+        async with self.session_maker() as session:
+            return (await session.scalars(stmt)).all()
+
+    async def has_run(self, job: str) -> bool:
+        async with self.session_maker() as session:
+            return await session.get(JobState, job) is not None
+
+    async def recent_groups(self, days: int) -> Sequence[Row[int, str, str]]:
+        stmt = (
+            select(Expense.category_id, Expense.currency, Expense.comment)
+            .where(Expense.date >= func.now() - datetime.timedelta(days=days))
+            .distinct()
+        )
+        async with self.session_maker() as session:
+            return (await session.execute(stmt)).all()
+
+    async def changes(self) -> Sequence[Row[int, int, str, str]]:
+        stmt = select(ExpenseChange.id, ExpenseChange.category_id, ExpenseChange.currency, ExpenseChange.comment)
+        async with self.session_maker() as session:
+            return (await session.execute(stmt)).all()
+
+    async def history(
+        self, keys: Sequence[tuple[int, str, str]], days: int
+    ) -> Sequence[Row[int, int, datetime.datetime, str, float, str]]:
+        # the expenses of the last days that may belong to the groups: comments are normalized by the caller, so they
+        # are only narrowed down to the ones containing every word of a group's comment
+        groups = [
+            and_(
+                cast(ColumnElement[bool], Expense.category_id == category_id),
+                cast(ColumnElement[bool], Expense.currency == currency),
+                *(func.lower(Expense.comment).contains(word, autoescape=True) for word in comment_key.split()),
+            )
+            for category_id, comment_key, currency in keys
+        ]
+        stmt = (
+            select(Expense.id, Expense.category_id, Expense.date, Expense.currency, Expense.amount, Expense.comment)
+            .where(or_(*groups), Expense.date >= func.now() - datetime.timedelta(days=days))
+            .order_by(Expense.date, Expense.id)
+        )
+        async with self.session_maker() as session:
+            return (await session.execute(stmt)).all()
+
+    async def save(
+        self,
+        job: str,
+        detected: Sequence[dict[str, Any]],
+        stale: Sequence[tuple[int, str, str]],
+        changes: Sequence[int],
+    ) -> None:
+        # detected patterns replace the stored ones, stale groups are no longer recurring; the expense changes the job
+        # has seen are dropped in the same transaction
+        key = tuple_(RecurringExpense.category_id, RecurringExpense.comment_key, RecurringExpense.currency)
+        async with self.session_maker() as session, session.begin():
+            if changes:
+                await session.execute(delete(ExpenseChange).where(ExpenseChange.id.in_(changes)))
+            if stale:
+                await session.execute(delete(RecurringExpense).where(key.in_(stale)))
+            if detected:
+                stmt = insert(RecurringExpense).values(list(detected))
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[
+                        RecurringExpense.category_id,
+                        RecurringExpense.comment_key,
+                        RecurringExpense.currency,
+                    ],
+                    set_={
+                        name: stmt.excluded[name]
+                        for name in ('comment', 'amount', 'period_days', 'occurrences', 'last_date', 'next_date')
+                    },
+                )
+                await session.execute(stmt)
+            state = insert(JobState).values(name=job)
+            await session.execute(
+                state.on_conflict_do_update(index_elements=[JobState.name], set_={'updated_at': func.now()})
+            )
+
+
 class ServiceManager:
     def __init__(self):
+        settings = get_settings()
         self._engine: AsyncEngine = create_async_engine(
             url=settings.db_uri, echo='debug' if settings.debug_mode else False, logging_name='trackyai.db.engine'
         )
+        instrument_engine(self._engine, slow_query_seconds=settings.slow_query_seconds)
         self.env_config = EnvConfigService(self._engine)
         self.category = CategoryService(self._engine)
         self.expense = ExpenseService(self._engine)
         self.memory = MemoryService(self._engine)
+        self.dialog = DialogService(self._engine)
+        self.usage = UsageService(self._engine)
+        self.budget = BudgetService(self._engine)
+        self.recurring = RecurringExpenseService(self._engine)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self._engine
+
+    async def warm_up(self) -> int:
+        # opens every connection of the pool, so that the first requests do not wait for connecting
+        size = getattr(self._engine.sync_engine.pool, 'size', lambda: 1)()
+        async with AsyncExitStack() as stack:
+            for _ in range(size):
+                connection = await stack.enter_async_context(self._engine.connect())
+                await connection.execute(text('SELECT 1'))
+        return size
 
     async def create_database(self) -> None:
         async with self._engine.begin() as conn:
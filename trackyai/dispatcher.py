@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Coroutine
+
+from trackyai.metrics import metrics
+from trackyai.tasks import supervisor
+
+logger = logging.getLogger(__name__)
+
+_wait_seconds = metrics.histogram(
+    'dispatcher_wait_seconds', 'Time from queueing a message until a job takes it', ['dispatcher']
+)
+_busy_replies = metrics.counter(
+    'dispatcher_busy_replies_total', 'Jobs queued while all workers were busy', ['dispatcher']
+)
+_rejected_messages = metrics.counter(
+    'dispatcher_rejected_messages_total', 'Messages rejected because of a full user queue', ['dispatcher']
+)
+
+
+# Messages of a single user in arrival order. A message may be None, which only asks for a job for the user, e.g. when
+# the message itself is kept elsewhere.
+class UserQueue:
+    def __init__(self, dispatcher: str, user_id: int) -> None:
+        self.user_id = user_id
+        self._dispatcher = dispatcher
+        self._messages: deque[tuple[str | None, float]] = deque()
+        self.scheduled = False
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def put(self, message: str | None) -> None:
+        self._messages.append((message, time.monotonic()))
+
+    def take(self) -> list[str]:
+        now = time.monotonic()
+        messages = []
+        while self._messages:
+            message, queued_at = self._messages.popleft()
+            _wait_seconds.observe(now - queued_at, dispatcher=self._dispatcher)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+
+# Runs jobs of users on a fixed number of workers. A user has at most one job at a time and their messages are taken
+# by the job in order; users whose queues got new messages during a job are queued again behind the other users.
+class Dispatcher:
+    def __init__(
+        self,
+        name: str,
+        job: Callable[[UserQueue], Awaitable[None]],
+        workers: int,
+        busy_threshold: int,
+        max_user_messages: int,
+        on_busy: Callable[[int], Coroutine[Any, Any, None]] | None = None,
+    ) -> None:
+        self.name = name
+        self._job = job
+        self._workers_count = workers
+        self._busy_threshold = busy_threshold
+        self._max_user_messages = max_user_messages
+        self._on_busy = on_busy
+        self._queues: dict[int, UserQueue] = {}
+        self._ready: asyncio.Queue[UserQueue] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._closed = False
+        self._drained = asyncio.Event()
+        self._busy_workers = 0
+        metrics.gauge('dispatcher_queued_messages', 'Messages waiting for a job', ['dispatcher']).set_function(
+            lambda: sum(len(queue) for queue in self._queues.values()), dispatcher=name
+        )
+        metrics.gauge('dispatcher_ready_users', 'Users waiting for a free worker', ['dispatcher']).set_function(
+            lambda: self._ready.qsize(), dispatcher=name
+        )
+        metrics.gauge('dispatcher_busy_workers', 'Workers running a job', ['dispatcher']).set_function(
+            lambda: self._busy_workers, dispatcher=name
+        )
+
+    def can_accept(self, user_id: int) -> bool:
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self._max_user_messages:
+            _rejected_messages.inc(dispatcher=self.name)
+            return False
+        return True
+
+    def submit(self, user_id: int, message: str | None) -> None:
+        if self._closed:
+            logger.warning(f'{self.name} is closed, dropping a message of user {user_id}')
+            return
+        self._start()
+        self._drained.clear()
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = UserQueue(self.name, user_id)
+        queue.put(message)
+        if queue.scheduled:
+            return
+        queue.scheduled = True
+        if self._ready.qsize() >= self._busy_threshold:
+            logger.warning(f'{self._ready.qsize()} users are waiting for {self.name} workers, queueing {user_id}')
+            _busy_replies.inc(dispatcher=self.name)
+            if self._on_busy is not None:
+                supervisor.spawn(self._on_busy(user_id), name=f'{self.name}_busy_reply')
+        self._ready.put_nowait(queue)
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            logger.info(f'{self.name} is restarted in a new event loop, dropping {len(self._queues)} user queues')
+            self._queues.clear()
+            self._ready = asyncio.Queue()
+            self._drained = asyncio.Event()
+        self._loop = loop
+        self._workers = [
+            asyncio.create_task(self._work(), name=f'{self.name}-worker-{i}') for i in range(self._workers_count)
+        ]
+
+    async def _work(self) -> None:
+        while True:
+            queue = await self._ready.get()
+            self._busy_workers += 1
+            try:
+                await self._job(queue)
+            except Exception as e:
+                logger.error(f'Error in a {self.name} job of user {queue.user_id}', exc_info=e)
+            finally:
+                self._busy_workers -= 1
+                if queue:
+                    self._ready.put_nowait(queue)
+                else:
+                    queue.scheduled = False
+                    del self._queues[queue.user_id]
+                    if not self._queues:
+                        self._drained.set()
+
+    async def close(self, timeout: float) -> None:
+        # stops taking messages and lets the queued jobs finish; jobs still running after the timeout are cancelled
+        self._closed = True
+        if not self._workers:
+            return
+        if self._queues:
+            logger.info(f'Waiting up to {timeout}s for {len(self._queues)} users in {self.name}...')
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+            except TimeoutError:
+                logger.warning(f'Cancelling {self.name} jobs of users {list(self._queues)}')
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,165 @@
+import csv
+import datetime
+import io
+import logging
+import re
+import tempfile
+import time
+import zipfile
+from typing import IO, Any, Callable, Literal, NamedTuple, Protocol, Sequence, get_args
+from xml.sax.saxutils import escape
+
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ('id', 'date', 'category', 'currency', 'amount', 'comment')
+
+_exports = metrics.counter('expense_exports_total', 'Exported expense files', ['format'])
+_exported_rows = metrics.counter('expense_export_rows_total', 'Exported expense rows', ['format'])
+_export_seconds = metrics.histogram('expense_export_seconds', 'Time to write an expense file', ['format'])
+
+
+class _Writer(Protocol):
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class _CsvWriter:
+    def __init__(self, file: IO[bytes]) -> None:
+        self._file = file
+        # the BOM makes spreadsheet apps read the file as UTF-8
+        self._write([EXPORT_COLUMNS], encoding='utf-8-sig')
+
+    def _write(self, rows: Sequence[Sequence[Any]], encoding: str = 'utf-8') -> None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self._file.write(buffer.getvalue().encode(encoding))
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        self._write([(id_, date.isoformat(sep=' '), *rest) for id_, date, *rest in rows])
+
+    def close(self) -> None:
+        pass
+
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_DOC_RELS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        f'<Relationships xmlns="{_RELS_NS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_RELS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        f'<workbook xmlns="{_SHEET_NS}" xmlns:r="{_DOC_RELS}">'
+        '<sheets><sheet name="Expenses" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'<Relationships xmlns="{_RELS_NS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_RELS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_DOC_RELS}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # style 1 is the built-in date & time number format
+    'xl/styles.xml': (
+        f'<styleSheet xmlns="{_SHEET_NS}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return f'<c s="1"><v>{(value.replace(tzinfo=None) - _EXCEL_EPOCH) / datetime.timedelta(days=1)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_INVALID_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+# A single-sheet workbook written with the standard library: the sheet is streamed into the zip entry row by row,
+# strings are inlined so that no shared strings table has to be kept in memory.
+class _XlsxWriter:
+    def __init__(self, file: IO[bytes]) -> None:
+        self._zip = zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED)
+        for name, content in _XLSX_PARTS.items():
+            self._zip.writestr(name, _XML_HEADER + content)
+        self._sheet = self._zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self._sheet.write(f'{_XML_HEADER}<worksheet xmlns="{_SHEET_NS}"><sheetData>'.encode())
+        self.write_rows([EXPORT_COLUMNS])
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        self._sheet.write(''.join(f'<row>{"".join(map(_xlsx_cell, row))}</row>' for row in rows).encode())
+
+    def close(self) -> None:
+        self._sheet.write(b'</sheetData></worksheet>')
+        self._sheet.close()
+        self._zip.close()
+
+
+ExportFormat = Literal['csv', 'xlsx']
+EXPORT_FORMATS: tuple[ExportFormat, ...] = get_args(ExportFormat)
+_WRITERS: dict[str, Callable[[IO[bytes]], _Writer]] = {'csv': _CsvWriter, 'xlsx': _XlsxWriter}
+
+
+class ExpensesExport(NamedTuple):
+    file: IO[bytes]
+    filename: str
+    rows: int
+
+
+async def export_expenses(file_format: str, date_from: datetime.datetime, date_to: datetime.datetime) -> ExpensesExport:
+    # the caller owns the returned file and closes it
+    if file_format not in _WRITERS:
+        raise ValueError(f'Unsupported file format {file_format!r}, must be one of {EXPORT_FORMATS}')
+    settings = get_settings()
+    started = time.perf_counter()
+    file = tempfile.SpooledTemporaryFile(max_size=settings.export_spool_size)
+    rows = 0
+    try:
+        writer = _WRITERS[file_format](file)
+        async for chunk in get_service_manager().expense.stream(
+            date_from, date_to, chunk_size=settings.export_chunk_size
+        ):
+            writer.write_rows(chunk)
+            rows += len(chunk)
+        writer.close()
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    elapsed = time.perf_counter() - started
+    logger.info(f'Exported {rows} expenses to {file_format} in {elapsed:.3f}s')
+    _exports.inc(format=file_format)
+    _exported_rows.inc(rows, format=file_format)
+    _export_seconds.observe(elapsed, format=file_format)
+    filename = f'expenses_{date_from:%Y-%m-%d}_{date_to:%Y-%m-%d}.{file_format}'
+    return ExpensesExport(file=file, filename=filename, rows=rows)
@@ -1,38 +1,130 @@
+import atexit
+import datetime
+import json
 import logging
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
 from logging import config as logging_config
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Any, Iterator
 
-from trackyai.config import settings
+from trackyai.config import get_settings
 
 logger = logging.getLogger(__name__)
 
-_LOGGING_CONFIG = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'general': {'format': '[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s', 'datefmt': '%Y-%m-%dT%H:%M:%S%z'}
-    },
-    'handlers': {
-        'file_handler': {
-            'class': 'logging.handlers.RotatingFileHandler',
-            'formatter': 'general',
-            'level': 'NOTSET',
-            'filename': f'{settings.log_dir}/trackyai.log',
-            'maxBytes': 10 * 1024 * 1024,
-            'backupCount': 10,
-            'mode': 'a',
-            'encoding': 'utf-8',
+# correlation fields (session, user_id, step) of the task that is logging, attached to every record
+_log_context: ContextVar[dict[str, Any]] = ContextVar('log_context', default={})
+
+_listeners: list[QueueListener] = []
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, tz=datetime.UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **getattr(record, 'context', {}),
         }
-    },
-    'root': {'handlers': ['file_handler'], 'level': settings.log_level},
-    'loggers': {
-        'httpx': {'level': 'WARNING'},
-        'httpcore': {'level': 'WARNING'},
-        'telegram.ext.ExtBot': {'level': 'INFO'},
-    },
-}
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Hands records over to the writer thread as they are: messages are formatted there, so that lazy %-style arguments
+# (e.g. whole completions at debug level) cost nothing on the event loop. Such arguments must not be mutated later.
+class _ContextQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _log_context.get()
+        return record
+
+
+def _logging_config() -> dict[str, Any]:
+    settings = get_settings()
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'text': {
+                'format': '[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
+                'datefmt': '%Y-%m-%dT%H:%M:%S%z',
+            },
+            'json': {'()': JsonFormatter},
+            'message': {'format': '%(message)s'},
+        },
+        'handlers': {
+            'file_handler': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'formatter': settings.log_format,
+                'level': 'NOTSET',
+                'filename': f'{settings.log_dir}/trackyai.log',
+                'maxBytes': 10 * 1024 * 1024,
+                'backupCount': 10,
+                'mode': 'a',
+                'encoding': 'utf-8',
+            },
+            'traces_handler': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'formatter': 'message',
+                'level': 'NOTSET',
+                'filename': f'{settings.log_dir}/traces.jsonl',
+                'maxBytes': 10 * 1024 * 1024,
+                'backupCount': 10,
+                'mode': 'a',
+                'encoding': 'utf-8',
+            },
+        },
+        'root': {'handlers': ['file_handler'], 'level': settings.log_level},
+        'loggers': {
+            # spans are rendered by the writer thread as well
+            'trackyai.traces': {
+                'handlers': ['traces_handler'],
+                'level': 'INFO' if settings.tracing else 'WARNING',
+                'propagate': False,
+            },
+            'httpx': {'level': 'WARNING'},
+            'httpcore': {'level': 'WARNING'},
+            'telegram.ext.ExtBot': {'level': 'INFO'},
+        },
+    }
+
+
+def _write_in_background(target: logging.Logger) -> None:
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(records, *target.handlers, respect_handler_level=True)
+    target.handlers = [_ContextQueueHandler(records)]
+    listener.start()
+    _listeners.append(listener)
 
 
 def setup_logging() -> None:
-    logging_config.dictConfig(_LOGGING_CONFIG)
+    # the configured handlers write from background threads, the loop only puts records into queues
+    stop_logging()
+    Path(get_settings().log_dir).mkdir(parents=True, exist_ok=True)
+    logging_config.dictConfig(_logging_config())
     logging.captureWarnings(True)
+
+    _write_in_background(logging.getLogger())
+    _write_in_background(logging.getLogger('trackyai.traces'))
+    atexit.register(stop_logging)
     logger.info('Logging has been initialized')
+
+
+def stop_logging() -> None:
+    # writes out the queued records
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,207 @@
+import bisect
+import math
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+class _Metric:
+    type: str = 'untyped'
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames: tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[labelname]) for labelname in self.labelnames)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, description, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError('Counters can only be increased')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> dict[tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, description, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        # the value is computed only when the gauge is collected
+        self._functions[self._key(labels)] = function
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self) -> dict[tuple[str, ...], float]:
+        with self._lock:
+            values = dict(self._values)
+        values.update({key: function() for key, function in self._functions.items()})
+        return values
+
+
+class HistogramSample(NamedTuple):
+    # cumulative counts of observations less than or equal to each upper bound, the last bound is +Inf
+    buckets: tuple[tuple[float, int], ...]
+    sum: float
+    total: int
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(
+        self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, description, labelnames)
+        self.buckets: tuple[float, ...] = (*sorted(buckets), float('inf'))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def samples(self) -> dict[tuple[str, ...], HistogramSample]:
+        with self._lock:
+            counts = {key: list(values) for key, values in self._counts.items()}
+            sums = dict(self._sums)
+        samples = {}
+        for key, values in counts.items():
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            samples[key] = HistogramSample(buckets=tuple(buckets), sum=sums[key], total=cumulative)
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            registered = self._metrics.setdefault(metric.name, metric)
+        if type(registered) is not type(metric) or registered.labelnames != metric.labelnames:
+            raise ValueError(f'Metric {metric.name} is already registered as {registered.type}{registered.labelnames}')
+        return registered
+
+    def counter(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Counter:
+        counter = self._register(Counter(name, description, labelnames))
+        assert isinstance(counter, Counter)
+        return counter
+
+    def gauge(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Gauge:
+        gauge = self._register(Gauge(name, description, labelnames))
+        assert isinstance(gauge, Gauge)
+        return gauge
+
+    def histogram(
+        self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        histogram = self._register(Histogram(name, description, labelnames, buckets))
+        assert isinstance(histogram, Histogram)
+        return histogram
+
+    def collect(self) -> list[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def expose(self) -> str:
+        # the Prometheus text exposition format
+        lines = []
+        for metric in sorted(self.collect(), key=lambda metric: metric.name):
+            lines.append(f'# HELP {metric.name} {_escape(metric.description, quote=False)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            if isinstance(metric, Histogram):
+                for key, sample in metric.samples().items():
+                    for bound, count in sample.buckets:
+                        labels = _labels(metric.labelnames, key, le=_number(bound))
+                        lines.append(f'{metric.name}_bucket{labels} {count}')
+                    lines.append(f'{metric.name}_sum{_labels(metric.labelnames, key)} {_number(sample.sum)}')
+                    lines.append(f'{metric.name}_count{_labels(metric.labelnames, key)} {sample.total}')
+            elif isinstance(metric, (Counter, Gauge)):
+                for key, value in metric.samples().items():
+                    lines.append(f'{metric.name}{_labels(metric.labelnames, key)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str, quote: bool = True) -> str:
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labelnames: tuple[str, ...], key: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(labelnames, key), *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,49 @@
+import logging
+
+from aiohttp import web
+
+from trackyai.config import get_settings
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_runner: web.AppRunner | None = None
+
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+async def _metrics(request: web.Request) -> web.Response:  # noqa: ARG001
+    return web.Response(text=metrics.expose(), headers={'Content-Type': _CONTENT_TYPE})
+
+
+def make_metrics_app() -> web.Application:
+    web_app = web.Application()
+    web_app.router.add_get('/metrics', _metrics)
+    return web_app
+
+
+async def start_metrics_server() -> None:
+    # a local endpoint for Prometheus to scrape, separate from the public webhook server
+    global _runner
+    settings = get_settings()
+    if settings.metrics_port is None or _runner is not None:
+        return
+    runner = web.AppRunner(make_metrics_app(), access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=settings.metrics_listen, port=settings.metrics_port).start()
+    except OSError as e:
+        # e.g. another worker on the same host serves the port; the bot works without the endpoint
+        logger.warning(f'Could not serve metrics on {settings.metrics_listen}:{settings.metrics_port}', exc_info=e)
+        await runner.cleanup()
+        return
+    _runner = runner
+    logger.info(f'Serving metrics on {settings.metrics_listen}:{settings.metrics_port}/metrics')
+
+
+async def stop_metrics_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,188 @@
+import asyncio
+import datetime
+import logging
+import time
+import warnings
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import RetryAfter
+from telegram.warnings import PTBDeprecationWarning
+
+from trackyai.bounded_store import BoundedStore
+from trackyai.metrics import metrics
+from trackyai.tasks import supervisor
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LENGTH_LIMIT = 4096
+
+_messages = metrics.counter('outbound_messages_total', 'Outbound telegram messages', ['outcome'])
+_delay_seconds = metrics.histogram('outbound_delay_seconds', 'Time from queueing a text until it is sent')
+
+
+def _length(text: str) -> int:
+    # telegram counts the length in UTF-16 code units
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_message(text: str, limit: int = MESSAGE_LENGTH_LIMIT) -> list[str]:
+    # splits at line boundaries, only lines longer than the limit are cut in the middle
+    chunks: list[str] = []
+    chunk: list[str] = []
+    chunk_length = 0
+    for line in text.split('\n'):
+        while _length(line) > limit:
+            if chunk:
+                chunks.append('\n'.join(chunk))
+                chunk, chunk_length = [], 0
+            cut = limit
+            while _length(line[:cut]) > limit:
+                cut -= 1
+            chunks.append(line[:cut])
+            line = line[cut:]
+        line_length = _length(line)
+        if chunk and chunk_length + 1 + line_length > limit:
+            chunks.append('\n'.join(chunk))
+            chunk, chunk_length = [], 0
+        chunk_length += line_length + (1 if chunk else 0)
+        chunk.append(line)
+    if chunk:
+        chunks.append('\n'.join(chunk))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    # PTB warns about the int value of retry_after, which will become a timedelta
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', PTBDeprecationWarning)
+        retry_after = e.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta) else retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self._capacity
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class _Chat:
+    def __init__(self, rate: float) -> None:
+        self.bucket = TokenBucket(rate)
+        self.pending: deque[tuple[str, InlineKeyboardMarkup | None, float, asyncio.Future[None]]] = deque()
+        self.sending = False
+
+    def idle(self) -> bool:
+        return not self.sending and not self.pending and self.bucket.full()
+
+    def take_batch(self) -> list[tuple[str, InlineKeyboardMarkup | None, float, asyncio.Future[None]]]:
+        # a text with a keyboard is sent alone, since its message is edited later on (e.g. by paging)
+        batch = [self.pending.popleft()]
+        if batch[0][1] is not None:
+            return batch
+        while self.pending and self.pending[0][1] is None:
+            batch.append(self.pending.popleft())
+        return batch
+
+
+# Sends messages within the telegram flood limits: a global token bucket for the bot and one per chat. Every chat is
+# drained by its own task, so a slow or flood-limited chat never holds back the others. Texts queued for a chat while
+# it waits for its bucket are sent together as one message, texts over the length limit are split at line boundaries.
+# Texts with a keyboard are never merged with other texts.
+class OutboundQueue:
+    def __init__(
+        self,
+        send: Callable[[int, str, InlineKeyboardMarkup | None], Awaitable[Any]],
+        global_rate: float,
+        chat_rate: float,
+        max_retries: int,
+        max_chats: int = 10000,
+        chat_ttl: float = 60,
+    ) -> None:
+        self._send = send
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_rate = chat_rate
+        self._max_retries = max_retries
+        self._chats: BoundedStore[int, _Chat] = BoundedStore(
+            'outbound_chats', max_size=max_chats, ttl=chat_ttl, can_evict=lambda chat: chat.idle()
+        )
+        metrics.gauge('outbound_pending', 'Texts waiting to be sent').set_function(
+            lambda: sum(len(chat.pending) for chat in self._chats.values())
+        )
+
+    async def send(self, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self._chat_rate)
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        chat.pending.append((text, reply_markup, time.monotonic(), future))
+        if not chat.sending:
+            chat.sending = True
+            supervisor.spawn(self._drain_chat(chat_id, chat), name='outbound_chat')
+        await future
+
+    async def _drain_chat(self, chat_id: int, chat: _Chat) -> None:
+        try:
+            while chat.pending:
+                await chat.bucket.acquire()
+                batch = chat.take_batch()
+                reply_markup = batch[-1][1]
+                if len(batch) > 1:
+                    _messages.inc(len(batch) - 1, outcome='coalesced')
+                try:
+                    chunks = split_message('\n\n'.join(text for text, _, _, _ in batch))
+                    for i, chunk in enumerate(chunks):
+                        if i:
+                            await chat.bucket.acquire()
+                        await self._deliver(chat_id, chunk, reply_markup if i == len(chunks) - 1 else None)
+                except Exception as e:
+                    _messages.inc(outcome='failed')
+                    for _, _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                sent_at = time.monotonic()
+                for _, _, queued_at, future in batch:
+                    _delay_seconds.observe(sent_at - queued_at)
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            chat.sending = False
+
+    async def _deliver(self, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None) -> None:
+        for attempt in range(self._max_retries + 1):
+            await self._global_bucket.acquire()
+            try:
+                await self._send(chat_id, text, reply_markup)
+            except RetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                logger.warning(f'Flood limit for chat {chat_id}, retrying in {delay}s')
+                _messages.inc(outcome='retried')
+                # only this chat waits, the other chats keep sending
+                await asyncio.sleep(delay)
+                continue
+            _messages.inc(outcome='sent')
+            return
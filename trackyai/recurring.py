@@ -0,0 +1,104 @@
+import datetime
+import logging
+import re
+import statistics
+from collections import defaultdict
+from typing import Any, Sequence
+
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'recurring_expenses'
+
+# the shortest period worth reporting, and how far intervals and amounts may deviate from their medians
+MIN_PERIOD_DAYS = 5
+PERIOD_TOLERANCE = 0.2
+AMOUNT_TOLERANCE = 0.1
+
+_NOT_LETTERS = re.compile(r'[\W\d_]+')
+
+GroupKey = tuple[int, str, str]
+
+
+def normalize_comment(comment: str) -> str:
+    # 'Netflix 05/2025' and 'netflix, june' are the same subscription
+    return ' '.join(_NOT_LETTERS.sub(' ', comment.lower()).split())
+
+
+def detect(dates: Sequence[datetime.datetime], amounts: Sequence[float], min_occurrences: int) -> float | None:
+    # the period in days of expenses sorted by date, if they come at regular intervals with about the same amount
+    if len(dates) < min_occurrences:
+        return None
+    intervals = [(later - earlier).total_seconds() / 86400 for earlier, later in zip(dates, dates[1:])]
+    period = statistics.median(intervals)
+    amount = statistics.median(amounts)
+    if period < MIN_PERIOD_DAYS:
+        return None
+    if any(abs(interval - period) > period * PERIOD_TOLERANCE for interval in intervals):
+        return None
+    if any(abs(value - amount) > abs(amount) * AMOUNT_TOLERANCE for value in amounts):
+        return None
+    return period
+
+
+def detect_groups(
+    history: Sequence[Any], keys: set[GroupKey], min_occurrences: int
+) -> tuple[list[dict[str, Any]], list[GroupKey]]:
+    # the recurring expenses among the groups of the history (rows sorted by date), and the groups that are not
+    groups: dict[GroupKey, list[Any]] = defaultdict(list)
+    for row in history:
+        key = (row.category_id, normalize_comment(row.comment), row.currency)
+        if key in keys:
+            groups[key].append(row)
+
+    detected = []
+    for key, rows in groups.items():
+        amounts = [row.amount for row in rows]
+        period = detect([row.date for row in rows], amounts, min_occurrences)
+        if period is None:
+            continue
+        category_id, comment_key, currency = key
+        last_date = rows[-1].date
+        detected.append(
+            {
+                'category_id': category_id,
+                'comment_key': comment_key,
+                'comment': rows[-1].comment,
+                'currency': currency,
+                'amount': statistics.median(amounts),
+                'period_days': round(period, 1),
+                'occurrences': len(rows),
+                'last_date': last_date,
+                'next_date': last_date + datetime.timedelta(days=period),
+            }
+        )
+    found = {(pattern['category_id'], pattern['comment_key'], pattern['currency']) for pattern in detected}
+    return detected, sorted(keys - found)
+
+
+async def update_recurring_expenses() -> int:
+    # Incremental: only the groups of the expenses added or edited since the previous run are detected again, over the
+    # last `recurring_history_days` of their history; the first run detects all groups of that period. Expenses are
+    # never deleted, so those are the only groups that can change; a pattern that has stopped is kept until an expense
+    # of its group is added or edited.
+    # Expenses are shared by all users of the bot, so the results are as well.
+    settings = get_settings()
+    service = get_service_manager().recurring
+    changes = await service.changes()
+    groups = [*changes]
+    if not await service.has_run(JOB_NAME):
+        groups.extend(await service.recent_groups(settings.recurring_history_days))
+    elif not changes:
+        return 0
+    keys = {(row.category_id, normalize_comment(row.comment), row.currency) for row in groups}
+    keys = {key for key in keys if key[1]}
+    detected: list[dict[str, Any]] = []
+    stale: list[GroupKey] = []
+    if keys:
+        history = await service.history(sorted(keys), settings.recurring_history_days)
+        detected, stale = detect_groups(history, keys, settings.recurring_min_occurrences)
+    await service.save(JOB_NAME, detected, stale, [row.id for row in changes])
+    logger.info(f'Detected {len(detected)} recurring expenses in {len(keys)} groups of {len(changes)} changed expenses')
+    return len(detected)
@@ -1,70 +1,251 @@
 import asyncio
 import datetime
 import logging
-from typing import Any, Coroutine
+import sys
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Iterator, Literal, Sequence
 
-from trackyai.agent import Agent, load_system_prompt_template
-from trackyai.agent.chat import Chat
+from pydantic import BaseModel
+
+from trackyai.agent import Agent, ToolSelector, render_system_prompt
+from trackyai.agent.category_index import category_index
+from trackyai.agent.chat import Chat, TextMessage
 from trackyai.agent.completion_services import get_completion_service
-from trackyai.agent.tools import TgAction, ToolCall, ToolResult, tool_registry
+from trackyai.agent.tools import TgAction, Tool, ToolCall, ToolResult, tool_registry
+from trackyai.agent.tools.memo import get_tool_memo
+from trackyai.bounded_store import BoundedStore
 from trackyai.communication import CommunicationProxy
-from trackyai.db import service_manager
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.dispatcher import Dispatcher, UserQueue
+from trackyai.log import log_context
+from trackyai.metrics import metrics
+from trackyai.session_store import SessionLock, SessionState, SessionStore, get_session_store
+from trackyai.tasks import supervisor
+from trackyai.tracing import new_trace_id, span
+from trackyai.usage import get_usage_accounting, usage_owner
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_MESSAGE = (
+    "Sorry, I couldn't finish processing your request. Please try again, maybe with a simpler or more specific message."
+)
+
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Your message is queued, I'll get back to you shortly."
+
+TOO_MANY_MESSAGES = "I'm still working on your previous messages, please wait for my reply before sending more."
+
+BUDGET_EXHAUSTED_MESSAGE = (
+    "Sorry, you've used up your monthly budget for AI requests, so I can't process your messages until next month. "
+    'Send /usage to see your usage.'
+)
 
-_async_tasks = set()
+StepOutcome = Literal['retry', 'terminated', 'asked_user', 'tool_result']
 
+_steps = metrics.counter('session_steps_total', 'Agent steps by outcome', ['outcome'])
+_retries = metrics.counter('session_retries_total', 'Agent decisions thrown away and thought again', ['reason'])
+_tool_seconds = metrics.histogram('tool_call_seconds', 'Duration of tool calls', ['tool'])
+_tool_calls = metrics.counter('tool_calls_total', 'Tool calls by outcome', ['tool', 'outcome'])
+_sessions = metrics.counter('sessions_total', 'Finished sessions by outcome', ['outcome'])
+_session_seconds = metrics.histogram(
+    'session_seconds', 'Time from the first message of a session to its end, waiting for the user included', ['outcome']
+)
 
-def ensure_async_task(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
-    task = asyncio.create_task(coro)
-    _async_tasks.add(task)
-    task.add_done_callback(_async_tasks.remove)
-    return task
+
+class StepRecord(BaseModel, frozen=True):
+    step: int
+    decision: str
+    outcome: StepOutcome
+    think_seconds: float
+    tool_seconds: float
 
 
 class Session:
-    def __init__(self, user_id: int) -> None:
+    def __init__(self, user_id: int, store: SessionStore | None = None) -> None:
         self._user_id: int = user_id
+        # every job of the session is a root span of the same trace; with a store both are restored from the checkpoint
+        self._id = new_trace_id()
+        self._started_at = time.time()
         self._chat: Chat | None = None
         self._agent: Agent | None = None
         self._user_messages: list[str] = []
-        self._need_processing = asyncio.Event()
-        self._process: asyncio.Task | None = None
+        self._inbox: UserQueue | None = None
+        self._steps: list[StepRecord] = []
+        self._time_left: float = get_settings().session_time_budget
+        self._store = store
+        self._lock: SessionLock | None = None
+        self._running = False
+        self._finished = False
 
     def done(self) -> bool:
-        return self._process is not None and self._process.done()
+        return self._finished
+
+    def running(self) -> bool:
+        return self._running
+
+    def close(self) -> None:
+        # an evicted session that still waits for the user ends here, the next message of the user starts a new one
+        if not self._finished:
+            logger.info(f'Closing an idle session of user {self._user_id} after {len(self._steps)} steps')
+            self._end('evicted')
+
+    def retained_bytes(self) -> int:
+        size = sum(sys.getsizeof(message) for message in self._user_messages)
+        if self._agent is not None:
+            size += sys.getsizeof(self._agent.system_prompt)
+        if self._chat is not None:
+            size += self._chat.retained_bytes()
+        return size
 
-    def add_user_message(self, message: str) -> None:
-        if self.done():
-            raise ValueError('Cannot add a user message to a finished session')
-        self._need_processing.set()
-        self._user_messages.append(message)
+    @property
+    def steps(self) -> Sequence[StepRecord]:
+        return tuple(self._steps)
 
-    async def _process_session(self):
-        logger.debug('Starting processing session. Awaiting for session updates...')
-        await self._need_processing.wait()
-        logger.debug('Got an update in the session. Executing processing pipeline.')
+    async def process(self, inbox: UserQueue) -> None:
+        self._running = True
+        try:
+            await self._process(inbox)
+        finally:
+            self._running = False
+
+    @contextmanager
+    def _observed(self) -> Iterator[None]:
+        with (
+            log_context(session=self._id, user_id=self._user_id),
+            span('session', self._id, user_id=self._user_id),
+            usage_owner(self._user_id, self._id),
+        ):
+            yield
+
+    async def _process(self, inbox: UserQueue) -> None:
+        # Runs the session until it finishes or needs the user. Without a session store the session is kept in memory
+        # between jobs; with a store every job locks the user, resumes the checkpoint and releases the lock at the end.
+        self._inbox = inbox
+        if self._store is None:
+            with self._observed():
+                if self._agent is None:
+                    self._user_messages.extend(inbox.take())
+                    await self._init_agent()
+                await self._run()
+            return
+
+        self._lock = await self._store.try_lock(self._user_id)
+        if self._lock is None:
+            logger.info(f'Session of user {self._user_id} is driven by another worker')
+            inbox.take()
+            return
+        try:
+            state = await self._store.load(self._user_id)
+        except BaseException:
+            await self._release()
+            raise
+        if state is not None and state.session_id is not None and state.started_at is not None:
+            # the job continues a session started by an earlier one, possibly on another worker
+            self._id, self._started_at = state.session_id, state.started_at
+        with self._observed():
+            try:
+                self._user_messages.extend(await self._store.take_pending(self._user_id))
+                if state is not None:
+                    # messages taken by a worker that crashed, before or after the first step
+                    self._user_messages[:0] = state.user_messages
+                if state is not None and state.chat:
+                    logger.info(f'Resuming session of user {self._user_id} after {len(state.steps)} steps')
+                    self._restore(state)
+                else:
+                    await self._init_agent()
+                await self._run()
+            finally:
+                await self._release()
 
+    async def _take_user_messages(self) -> None:
+        assert self._chat is not None and self._inbox is not None
+        self._user_messages.extend(self._inbox.take())
+        if self._store is not None:
+            self._user_messages.extend(await self._store.take_pending(self._user_id))
         if self._user_messages:
             self._chat.add_user_message('\n'.join(self._user_messages))
             self._user_messages.clear()
-        self._need_processing.clear()
 
-        decision: ToolCall = await self._agent.think(self._chat)
+    def _awaits_user(self) -> bool:
+        assert self._chat is not None
+        last = self._chat.last()
+        return last is None or (isinstance(last, TextMessage) and last.role == 'assistant')
+
+    async def _run(self) -> None:
+        # The time budget covers thinking and tool calls of a single intent; waiting for the user does not consume it.
+        assert self._chat is not None and self._agent is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._take_user_messages()
+            if self._awaits_user():
+                return
+
+            budget = await get_usage_accounting().budget(self._user_id)
+            if budget == 'exhausted':
+                await self._refuse()
+                return
+            # over the daily budget sessions take the fast path: fewer steps, fewer completions
+            settings = get_settings()
+            max_steps = settings.session_max_steps if budget == 'ok' else settings.usage_fast_path_max_steps
+            if len(self._steps) >= max_steps:
+                await self._give_up(f'the limit of {max_steps} steps is reached')
+                return
+
+            started_at = decided_at = loop.time()
+            try:
+                with log_context(step=len(self._steps) + 1), span('agent_step', step=len(self._steps) + 1) as step:
+                    async with asyncio.timeout(self._time_left):
+                        decision = await self._think()
+                        decided_at = loop.time()
+                        outcome = await self._perform(decision) if decision is not None else 'retry'
+                    step.set(decision=decision.name if decision is not None else 'none', outcome=outcome)
+            except TimeoutError:
+                await self._give_up(f'the time budget of {settings.session_time_budget}s is exhausted')
+                return
+            finished_at = loop.time()
+            self._time_left -= finished_at - started_at
+            self._steps.append(
+                StepRecord(
+                    step=len(self._steps) + 1,
+                    decision=decision.name if decision is not None else 'none',
+                    outcome=outcome,
+                    think_seconds=round(decided_at - started_at, 3),
+                    tool_seconds=round(finished_at - decided_at, 3),
+                )
+            )
+            logger.debug(f'Session step of user {self._user_id}: {self._steps[-1]}')
+            _steps.inc(outcome=outcome)
+
+            if outcome == 'terminated':
+                logger.info(f'Session of user {self._user_id} finished in {len(self._steps)} steps: {self._steps}')
+                await self._finish('completed')
+                return
+            await self._checkpoint()
 
-        while self._need_processing.is_set() or decision not in tool_registry:
+    async def _think(self) -> ToolCall | None:
+        # a failed completion, a call of an unknown tool or invalid arguments are retried like a bad decision
+        assert self._chat is not None and self._agent is not None
+        with span('think'):
+            try:
+                return await self._agent.think(self._chat)
+            except Exception as e:
+                logger.warning(f'Could not get a decision for user {self._user_id}', exc_info=e)
+                _retries.inc(reason='failed_completion')
+                return None
+
+    async def _perform(self, decision: ToolCall) -> StepOutcome:
+        assert self._chat is not None
+        if self._inbox or decision not in tool_registry:
             logger.debug(f'Got a new message, or made a bad decision - retrying thinking for {self._user_id}')
-            if self._user_messages:
-                self._chat.add_user_message('\n'.join(self._user_messages))
-                self._user_messages.clear()
-                self._need_processing.clear()
-            decision = await self._agent.think(self._chat)
+            _retries.inc(reason='new_message' if self._inbox else 'unknown_tool')
+            return 'retry'
 
         if tool_registry[decision].is_terminating():
             logger.info(f'Terminating session for user {self._user_id}; calling {decision.name}')
-            ensure_async_task(self._make_toolcall(decision))
-            return
+            supervisor.spawn(self._make_toolcall(decision), name='terminating_tool_call')
+            return 'terminated'
 
         if tool_registry[decision].is_ask_user():
             logger.info(f'Asking user {self._user_id} for additional info.')
@@ -74,75 +255,218 @@ class Session:
                 )
             )
             await self._make_toolcall(decision)
-            self._process = asyncio.create_task(self._process_session())
-            return
+            return 'asked_user'
 
         logger.info(f'Performing a non-terminating tool call {decision.name} for user {self._user_id}.')
         self._chat.add_tool_call(decision)
         tool_result: ToolResult = await self._make_toolcall(decision)
         self._chat.add_tool_result(tool_result)
-        self._need_processing.set()
-        self._process = asyncio.create_task(self._process_session())
+        return 'tool_result'
+
+    async def _give_up(self, reason: str) -> None:
+        logger.warning(f'Giving up the session of user {self._user_id}: {reason}. Steps: {self._steps}')
+        try:
+            await CommunicationProxy.get_for(self._user_id).send_text(message=FALLBACK_MESSAGE)
+        except Exception as e:
+            logger.error(f'Error while sending a fallback reply to user {self._user_id}', exc_info=e)
+        await self._finish('gave_up')
+
+    async def _refuse(self) -> None:
+        logger.warning(f'Refusing the session of user {self._user_id}: the monthly budget is exhausted')
+        await CommunicationProxy.get_for(self._user_id).send_text(message=BUDGET_EXHAUSTED_MESSAGE)
+        await self._finish('refused')
+
+    async def _checkpoint(self) -> None:
+        if self._store is None:
+            return
+        assert self._chat is not None and self._agent is not None
+        await self._store.save(
+            SessionState(
+                user_id=self._user_id,
+                system_prompt=self._agent.system_prompt,
+                chat=self._chat.dump(),
+                user_messages=list(self._user_messages),
+                steps=[step.model_dump() for step in self._steps],
+                time_left=self._time_left,
+                session_id=self._id,
+                started_at=self._started_at,
+            )
+        )
+
+    async def _finish(self, outcome: str) -> None:
+        self._end(outcome)
+        if self._store is not None:
+            await self._store.finish(self._user_id)
+
+    def _end(self, outcome: str) -> None:
+        self._finished = True
+        _sessions.inc(outcome=outcome)
+        _session_seconds.observe(time.time() - self._started_at, outcome=outcome)
+
+    async def _release(self) -> None:
+        assert self._store is not None and self._lock is not None
+        try:
+            await CommunicationProxy.get_for(self._user_id).save_history()
+        except Exception as e:
+            logger.error(f'Error while saving the dialog of user {self._user_id}', exc_info=e)
+        await self._lock.release()
+        self._lock = None
+        # a message pushed by another worker while the lock was still held has not been seen by anyone
+        if await self._store.has_pending(self._user_id):
+            get_session_manager().dispatcher.submit(self._user_id, None)
 
     async def _make_toolcall(self, tool_call: ToolCall) -> ToolResult:
-        logger.info(f'Calling tool {tool_call.name} with args {tool_call.parameters}...')
         tool = tool_registry[tool_call.name]
+        with span('tool_call', tool=tool.name) as tool_span:
+            memo = get_tool_memo()
+            key = memo.key(tool, tool_call.parameters)
+            if key is not None and (result := memo.get(tool, key)) is not None:
+                logger.info(f'Reusing the result of tool {tool_call.name} with args {tool_call.parameters}')
+                tool_span.set(memoized=True)
+                return ToolResult(tool_call=tool_call, result=result, success=True)
+
+            try:
+                tool_result = await self._call_tool(tool, tool_call)
+            finally:
+                memo.invalidate(tool)
+            if key is not None and tool_result.success:
+                memo.put(key, tool_result.result)
+            tool_span.set(success=tool_result.success)
+            return tool_result
 
+    async def _call_tool(self, tool: Tool, tool_call: ToolCall) -> ToolResult:
+        logger.info(f'Calling tool {tool_call.name} with args {tool_call.parameters}...')
         try:
-            result = await tool.awaitable(**tool_call.parameters)
-        except BaseException as e:
+            with _tool_seconds.time(tool=tool.name):
+                result = await tool.awaitable(**tool_call.parameters)
+        except Exception as e:
             logger.error(f'Error while calling a tool {tool_call}.', exc_info=e)
+            _tool_calls.inc(tool=tool.name, outcome='failed')
             return ToolResult(tool_call=tool_call, result=None, success=False, exc_message=repr(e))
 
         if isinstance(result, TgAction):
             try:
                 await result.perform(user_id=self._user_id)
-                return ToolResult(tool_call=tool_call, result=None, success=True)
-            except BaseException as e:
+            except Exception as e:
                 logger.error(
                     f'Error while executing a telegram action from the tool {tool_call.name}. Tool call: {tool_call}.',
                     exc_info=e,
                 )
+                _tool_calls.inc(tool=tool.name, outcome='action_failed')
                 return ToolResult(tool_call=tool_call, result=None, success=False, exc_message=repr(e))
+            result = None
 
+        _tool_calls.inc(tool=tool.name, outcome='succeeded')
         return ToolResult(tool_call=tool_call, result=result, success=True)
 
-    async def init(self) -> None:
-        logger.info(f'Initializing session for {self._user_id}...')
-        system_prompt_template = load_system_prompt_template('main')
-        ecs = await service_manager.env_config.get_all()
-        categories = await service_manager.category.get_all()
-        latest_expenses = await service_manager.expense.latest(5)
-        memory = await service_manager.memory.get(self._user_id)
+    def _restore(self, state: SessionState) -> None:
+        self._chat = Chat.load(state.chat)
+        self._agent = self._make_agent(state.system_prompt)
+        self._steps = [StepRecord.model_validate(step) for step in state.steps]
+        if state.time_left is not None:
+            self._time_left = state.time_left
+
+    def _make_agent(self, system_prompt: str) -> Agent:
+        settings = get_settings()
+        return Agent(
+            system_prompt=system_prompt,
+            tools=tool_registry.get('main'),
+            completion_service=get_completion_service(settings.completion_service),
+            tool_selector=ToolSelector() if settings.tool_selection else None,
+        )
+
+    async def _init_agent(self) -> None:
+        ecs = await get_service_manager().env_config.get_all()
+        categories = await get_service_manager().category.get_all()
+        latest_expenses = await get_service_manager().expense.latest(5)
+        recurring_expenses = await get_service_manager().recurring.get_all()
+        memory = await get_service_manager().memory.get(self._user_id)
+        communication_proxy = CommunicationProxy.get_for(self._user_id)
+        await communication_proxy.restore_history()
+        await category_index.ensure_loaded()
         now = datetime.datetime.now(tz=datetime.UTC)
         self._chat = Chat()
-        self._agent = Agent(
-            system_prompt=system_prompt_template.render(
+        self._agent = self._make_agent(
+            render_system_prompt(
+                'main',
                 ecs=ecs,
                 categories=categories,
                 latest_expenses=latest_expenses,
-                latest_dialog=CommunicationProxy.get_for(self._user_id).history,
+                recurring_expenses=recurring_expenses,
+                latest_dialog=communication_proxy.history,
                 memory=memory.memory,
+                category_suggestions=category_index.suggest('\n'.join(self._user_messages)),
                 current_dt_full=now.strftime('%A, %B %d, %Y %H:%M'),
-            ),
-            tools=tool_registry.get('main'),
-            completion_service=get_completion_service('openai'),
+            )
         )
-        self._process = asyncio.create_task(self._process_session())
 
 
 class SessionsManager:
     def __init__(self):
-        self.sessions: dict[int, Session] = {}
+        settings = get_settings()
+        self.sessions: BoundedStore[int, Session] = BoundedStore(
+            'sessions',
+            max_size=settings.max_sessions,
+            ttl=settings.session_idle_ttl,
+            # a session waiting for the user is evicted like a finished one, only a running job keeps it
+            can_evict=lambda session: not session.running(),
+            on_evict=lambda _, session: session.close(),
+        )
+        self.dispatcher = Dispatcher(
+            'sessions',
+            job=self._process,
+            workers=settings.dispatcher_workers,
+            busy_threshold=settings.dispatcher_busy_threshold,
+            max_user_messages=settings.dispatcher_max_user_messages,
+            on_busy=self._send_busy,
+        )
+        metrics.gauge('live_sessions', 'Sessions kept in memory').set_function(lambda: len(self.sessions))
+        metrics.gauge('live_sessions_bytes', 'Approximate bytes retained by sessions').set_function(
+            lambda: sum(session.retained_bytes() for session in self.sessions.values())
+        )
+
+    async def deliver(self, user_id: int, message: str) -> None:
+        if not self.dispatcher.can_accept(user_id):
+            logger.warning(f'Too many queued messages of user {user_id}, rejecting a new one')
+            await CommunicationProxy.get_for(user_id).send_text(message=TOO_MANY_MESSAGES)
+            return
+        store = get_session_store()
+        if store is None:
+            self.dispatcher.submit(user_id, message)
+            return
+        # the store keeps the message, so that any worker can take it
+        await store.push_message(user_id, message)
+        self.dispatcher.submit(user_id, None)
+
+    async def drain(self, timeout: float) -> None:
+        await self.dispatcher.close(timeout)
+
+    async def resume(self) -> None:
+        # picks up the sessions of a crashed worker; sessions driven by a live worker stay locked
+        store = get_session_store()
+        if store is None:
+            return
+        user_ids = await store.user_ids()
+        logger.info(f'Resuming {len(user_ids)} stored sessions')
+        for user_id in user_ids:
+            self.dispatcher.submit(user_id, None)
+
+    async def _process(self, inbox: UserQueue) -> None:
+        store = get_session_store()
+        if store is not None:
+            await Session(user_id=inbox.user_id, store=store).process(inbox)
+            return
+        session = self.sessions.get(inbox.user_id)
+        if session is None or session.done():
+            logger.info(f'Creating new session for user {inbox.user_id}')
+            session = Session(user_id=inbox.user_id)
+            self.sessions[inbox.user_id] = session
+        await session.process(inbox)
 
-    def get_or_create_session(self, user_id: int) -> Session:
-        session = self.sessions.get(user_id)
-        if not session or session.done():
-            logger.info(f'Creating new session for user {user_id}')
-            session = Session(user_id=user_id)
-            self.sessions[user_id] = session
-            ensure_async_task(session.init())
-        return session
+    async def _send_busy(self, user_id: int) -> None:
+        await CommunicationProxy.get_for(user_id).send_text(message=BUSY_MESSAGE)
 
 
-session_manager = SessionsManager()
+@cache
+def get_session_manager() -> SessionsManager:
+    return SessionsManager()
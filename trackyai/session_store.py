@@ -0,0 +1,194 @@
+import logging
+from functools import cache
+from typing import Any, Protocol, cast
+
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, Select, delete, select, text
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from trackyai.config import get_settings
+from trackyai.db import SessionCheckpoint, get_service_manager
+from trackyai.db.service import DbService
+
+logger = logging.getLogger(__name__)
+
+# advisory locks share a single key space within a database, the namespace keeps ours apart from other users of it;
+# telegram user ids fit into 52 bits
+_LOCK_NAMESPACE = 0x7A1
+
+
+def _lock_key(user_id: int) -> int:
+    return (_LOCK_NAMESPACE << 52) | user_id
+
+
+class SessionState(BaseModel, frozen=True):
+    user_id: int
+    system_prompt: str
+    chat: list[dict[str, Any]]
+    user_messages: list[str]
+    steps: list[dict[str, Any]]
+    time_left: float | None
+    session_id: str | None = None
+    started_at: float | None = None
+
+
+class SessionLock(Protocol):
+    async def release(self) -> None: ...
+
+
+# Keeps sessions outside of a bot process, so that any worker can pick up a user's session.
+# Messages are pushed to the store first and taken by the worker holding the user's lock. The worker checkpoints the
+# session after each step and holds the lock only while it is processing, never while waiting for the user.
+class SessionStore(Protocol):
+    async def try_lock(self, user_id: int) -> SessionLock | None: ...
+
+    async def load(self, user_id: int) -> SessionState | None: ...
+
+    async def save(self, state: SessionState) -> None: ...
+
+    async def push_message(self, user_id: int, message: str) -> None: ...
+
+    async def take_pending(self, user_id: int) -> list[str]: ...
+
+    async def has_pending(self, user_id: int) -> bool: ...
+
+    async def finish(self, user_id: int) -> None: ...
+
+    async def user_ids(self) -> list[int]: ...
+
+    async def close(self) -> None: ...
+
+
+class _AdvisoryLock(SessionLock):
+    def __init__(self, connection: AsyncConnection, key: int) -> None:
+        self._connection = connection
+        self._key = key
+
+    async def release(self) -> None:
+        try:
+            await self._connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': self._key})
+        finally:
+            await self._connection.close()
+
+
+class PostgresSessionStore(DbService, SessionStore):
+    def __init__(self, engine: AsyncEngine) -> None:
+        super().__init__(engine)
+        # a session-level advisory lock lives as long as its connection, so every lock gets a dedicated connection
+        # that is not shared with the pool of regular queries and is closed on release
+        self._lock_engine = create_async_engine(
+            url=get_settings().db_uri,
+            poolclass=NullPool,
+            isolation_level='AUTOCOMMIT',
+            logging_name='trackyai.db.locks',
+        )
+
+    async def try_lock(self, user_id: int) -> SessionLock | None:
+        key = _lock_key(user_id)
+        connection = await self._lock_engine.connect()
+        try:
+            locked = (await connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': key})).scalar_one()
+        except BaseException:
+            await connection.close()
+            raise
+        if not locked:
+            await connection.close()
+            return None
+        return _AdvisoryLock(connection, key)
+
+    async def load(self, user_id: int) -> SessionState | None:
+        async with self.session_maker() as session:
+            checkpoint = (await session.scalars(self._select(user_id))).one_or_none()
+        if checkpoint is None:
+            return None
+        return SessionState(
+            user_id=checkpoint.user_id,
+            system_prompt=checkpoint.system_prompt,
+            chat=checkpoint.chat,
+            user_messages=checkpoint.user_messages,
+            steps=checkpoint.steps,
+            time_left=checkpoint.time_left,
+            session_id=checkpoint.session_id,
+            started_at=checkpoint.started_at,
+        )
+
+    async def save(self, state: SessionState) -> None:
+        # pending messages belong to other workers and are never overwritten by a checkpoint
+        values = state.model_dump(exclude={'user_id'})
+        stmt = insert(SessionCheckpoint).values(user_id=state.user_id, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[SessionCheckpoint.user_id], set_=values)
+        async with self.session_maker() as session, session.begin():
+            await session.execute(stmt)
+
+    async def push_message(self, user_id: int, message: str) -> None:
+        stmt = insert(SessionCheckpoint).values(user_id=user_id, pending_messages=[message])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SessionCheckpoint.user_id],
+            set_={
+                'pending_messages': SessionCheckpoint.pending_messages.op('||', return_type=JSONB)(
+                    stmt.excluded.pending_messages
+                )
+            },
+        )
+        async with self.session_maker() as session, session.begin():
+            await session.execute(stmt)
+
+    async def take_pending(self, user_id: int) -> list[str]:
+        # pending messages move to the session's own messages in one transaction, so a crash cannot lose them
+        async with self.session_maker() as session, session.begin():
+            checkpoint = (await session.scalars(self._select(user_id).with_for_update())).one_or_none()
+            if checkpoint is None or not checkpoint.pending_messages:
+                return []
+            pending = checkpoint.pending_messages
+            checkpoint.user_messages = [*checkpoint.user_messages, *pending]
+            checkpoint.pending_messages = []
+            return pending
+
+    async def has_pending(self, user_id: int) -> bool:
+        stmt = select(SessionCheckpoint.pending_messages).where(self._where(user_id))
+        async with self.session_maker() as session:
+            return bool((await session.scalars(stmt)).one_or_none())
+
+    async def finish(self, user_id: int) -> None:
+        # messages that arrived while finishing start a new session, so the row is only reset for them
+        async with self.session_maker() as session, session.begin():
+            checkpoint = (await session.scalars(self._select(user_id).with_for_update())).one_or_none()
+            if checkpoint is None:
+                return
+            if not checkpoint.pending_messages:
+                await session.execute(delete(SessionCheckpoint).where(self._where(user_id)))
+                return
+            checkpoint.system_prompt = ''
+            checkpoint.chat = []
+            checkpoint.user_messages = []
+            checkpoint.steps = []
+            checkpoint.time_left = None
+            checkpoint.session_id = None
+            checkpoint.started_at = None
+
+    async def user_ids(self) -> list[int]:
+        async with self.session_maker() as session:
+            return list((await session.scalars(select(SessionCheckpoint.user_id))).all())
+
+    async def close(self) -> None:
+        await self._lock_engine.dispose()
+
+    @staticmethod
+    def _where(user_id: int) -> ColumnElement[bool]:
+        return cast(ColumnElement[bool], SessionCheckpoint.user_id == user_id)
+
+    @classmethod
+    def _select(cls, user_id: int) -> Select[SessionCheckpoint]:
+        return select(SessionCheckpoint).where(cls._where(user_id))
+
+
+@cache
+def get_session_store() -> SessionStore | None:
+    session_store = get_settings().session_store
+    if session_store == 'memory':
+        return None
+    if session_store == 'postgres':
+        return PostgresSessionStore(get_service_manager().engine)
+    raise NotImplementedError(f'{session_store} session store is not implemented.')
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+from typing import Any, Coroutine
+
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_tasks_total = metrics.counter('background_tasks_total', 'Finished background tasks', ['name', 'outcome'])
+_task_seconds = metrics.histogram('background_task_seconds', 'Duration of background tasks', ['name'])
+
+
+# Tracks background tasks until they finish: logs their failures, which nobody awaits otherwise, and lets the shutdown
+# wait for the tasks that are still running. Task names are metric labels, so they name the kind of the work.
+class TaskSupervisor:
+    def __init__(self) -> None:
+        self._tasks: dict[asyncio.Task, float] = {}
+        metrics.gauge('background_tasks', 'Running background tasks').set_function(lambda: len(self._tasks))
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], name: str) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks[task] = time.monotonic()
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        started_at = self._tasks.pop(task)
+        name = task.get_name()
+        _task_seconds.observe(time.monotonic() - started_at, name=name)
+        if task.cancelled():
+            logger.warning(f'Background task {name} was cancelled')
+            _tasks_total.inc(name=name, outcome='cancelled')
+        elif (exc := task.exception()) is not None:
+            logger.error(f'Background task {name} failed', exc_info=exc)
+            _tasks_total.inc(name=name, outcome='error')
+        else:
+            _tasks_total.inc(name=name, outcome='ok')
+
+    async def drain(self, timeout: float) -> None:
+        # tasks spawned while draining, e.g. by the tasks themselves, are awaited within the same deadline
+        if not self._tasks:
+            return
+        logger.info(f'Waiting up to {timeout}s for {len(self._tasks)} background tasks...')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                pending = list(self._tasks)
+                logger.warning(
+                    f'Cancelling {len(pending)} unfinished background tasks: {[t.get_name() for t in pending]}'
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+                return
+            await asyncio.wait(list(self._tasks), timeout=remaining)
+
+
+supervisor = TaskSupervisor()
@@ -0,0 +1,149 @@
+import json
+import logging
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import ExceptionContext, ExecutionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# finished spans are logged here; `setup_logging` writes them to traces.jsonl from a background thread
+_exporter = logging.getLogger('trackyai.traces')
+_exporter.propagate = False
+
+_slow_queries = logging.getLogger('trackyai.db.slow_queries')
+
+_current_span: ContextVar['Span | None'] = ContextVar('current_span', default=None)
+
+_MAX_STATEMENT_LENGTH = 2000
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def _attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+# A span of work within a trace. A finished span is rendered as a line of OTLP/JSON (an ExportTraceServiceRequest with
+# the single span), so that the file can be replayed into any OpenTelemetry collector.
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_span_id', 'name', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str | None, attributes: dict[str, Any]) -> None:
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException | None = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = repr(error)
+        _exporter.info(self)
+
+    def __str__(self) -> str:
+        span: dict[str, Any] = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error is not None else {'code': 1},
+        }
+        if self.parent_span_id is not None:
+            span['parentSpanId'] = self.parent_span_id
+        resource = {'attributes': [_attribute('service.name', 'trackyai')]}
+        request = {
+            'resourceSpans': [{'resource': resource, 'scopeSpans': [{'scope': {'name': 'trackyai'}, 'spans': [span]}]}]
+        }
+        return json.dumps(request, ensure_ascii=False)
+
+
+class _NoSpan(Span):
+    # handed out while tracing is disabled, so that callers never check
+    def __init__(self) -> None:
+        pass
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def end(self, error: BaseException | None = None) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def start_span(name: str, trace_id: str | None = None, **attributes: Any) -> Span:
+    # a child of the current span, or the root of a new trace; it does not become the current span
+    if not _exporter.isEnabledFor(logging.INFO):
+        return _NO_SPAN
+    parent = _current_span.get()
+    if parent is not None and trace_id in (None, parent.trace_id):
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    return Span(name, trace_id or new_trace_id(), None, attributes)
+
+
+@contextmanager
+def span(name: str, trace_id: str | None = None, **attributes: Any) -> Iterator[Span]:
+    current = start_span(name, trace_id, **attributes)
+    if current is _NO_SPAN:
+        yield current
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current_span.reset(token)
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_seconds: float) -> None:
+    # a span per DB statement, and a warning with the statement and its parameters for slow ones
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute', named=True)
+    def before_cursor_execute(statement: str, context: ExecutionContext, **_: Any) -> None:
+        context._trackyai_started = time.perf_counter()  # type: ignore[attr-defined]
+        context._trackyai_span = start_span(  # type: ignore[attr-defined]
+            'db.statement', **{'db.system': 'postgresql', 'db.statement': statement[:_MAX_STATEMENT_LENGTH]}
+        )
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute', named=True)
+    def after_cursor_execute(cursor: Any, statement: str, parameters: Any, context: ExecutionContext, **_: Any) -> None:
+        elapsed = time.perf_counter() - context._trackyai_started  # type: ignore[attr-defined]
+        context._trackyai_span.set(**{'db.rows': cursor.rowcount})  # type: ignore[attr-defined]
+        context._trackyai_span.end()  # type: ignore[attr-defined]
+        if elapsed >= slow_query_seconds:
+            _slow_queries.warning(
+                f'Slow query ({elapsed:.3f}s): {statement[:_MAX_STATEMENT_LENGTH]} '
+                f'parameters={repr(parameters)[:_MAX_STATEMENT_LENGTH]}'
+            )
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def handle_error(exception_context: ExceptionContext) -> None:
+        statement_span = getattr(exception_context.execution_context, '_trackyai_span', None)
+        if statement_span is not None:
+            statement_span.end(error=exception_context.original_exception)
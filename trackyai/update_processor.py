@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Processes updates of different users concurrently, while updates of a single user are processed one by one in the
+# order they were received. The application creates a task per update in order, both the concurrency semaphore and
+# the per-user locks wake their waiters in FIFO order.
+# An update takes the lock of its user before a slot of the semaphore, so that the queued updates of a chatty user
+# wait without holding slots that the updates of other users could use.
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        # a lock with the number of updates holding or awaiting it, dropped when no update needs it
+        self._locks: dict[int, tuple[asyncio.Lock, int]] = {}
+        metrics.gauge('concurrent_updates', 'Updates being processed').set_function(
+            lambda: self.current_concurrent_updates
+        )
+
+    # the base class takes the slot before calling do_process_update, which is too early for a per-user order
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:  # type: ignore[misc]
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+
+        lock, users = self._locks.get(user.id, (asyncio.Lock(), 0))
+        self._locks[user.id] = (lock, users + 1)
+        try:
+            async with lock, self._semaphore:
+                await self.do_process_update(update, coroutine)
+        finally:
+            lock, users = self._locks[user.id]
+            if users == 1:
+                del self._locks[user.id]
+            else:
+                self._locks[user.id] = (lock, users - 1)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:  # noqa: ARG002
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,195 @@
+import asyncio
+import datetime
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache
+from typing import Any, Iterator, Literal, NamedTuple
+
+from trackyai.bounded_store import BoundedStore
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.metrics import metrics
+from trackyai.tasks import supervisor
+
+logger = logging.getLogger(__name__)
+
+BudgetState = Literal['ok', 'fast_path', 'exhausted']
+
+_records = metrics.counter('llm_usage_records_total', 'Completion usage records by outcome', ['outcome'])
+_budget_checks = metrics.counter('usage_budget_checks_total', 'Budget checks of agent steps by state', ['state'])
+
+# the user and the session that completions are made for
+_usage_owner: ContextVar[tuple[int, str] | None] = ContextVar('usage_owner', default=None)
+
+
+@contextmanager
+def usage_owner(user_id: int, session: str) -> Iterator[None]:
+    token = _usage_owner.set((user_id, session))
+    try:
+        yield
+    finally:
+        _usage_owner.reset(token)
+
+
+class UsageTotals(NamedTuple):
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0
+
+    def add(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int, cost: float) -> 'UsageTotals':
+        return UsageTotals(
+            self.calls + 1,
+            self.prompt_tokens + prompt_tokens,
+            self.cached_tokens + cached_tokens,
+            self.completion_tokens + completion_tokens,
+            self.cost + cost,
+        )
+
+
+class UserUsage(NamedTuple):
+    day: datetime.date
+    today: UsageTotals
+    month: UsageTotals
+
+
+def _utcnow() -> datetime.datetime:
+    # the accounting table keeps naive UTC times, days and months are UTC ones
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+# Records the usage of every completion and keeps the budgets of users.
+# Records are buffered and written in batches by a background task, at least every `flush_interval` seconds. The totals
+# of a user are read from the DB once, after writing the buffer, and then kept up to date in memory; they are re-read
+# after `totals_ttl` seconds, so that the usage recorded by other workers is seen as well.
+class UsageAccounting:
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        daily_budget: float | None,
+        monthly_budget: float | None,
+        max_users: int,
+        totals_ttl: float,
+    ) -> None:
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._daily_budget = daily_budget
+        self._monthly_budget = monthly_budget
+        self._pending: list[dict[str, Any]] = []
+        self._flush_task: asyncio.Task | None = None
+        self._flush_now = asyncio.Event()
+        self._writing = asyncio.Lock()
+        self._totals: BoundedStore[int, UserUsage] = BoundedStore('usage_totals', max_size=max_users, ttl=totals_ttl)
+        metrics.gauge('llm_usage_pending', 'Usage records waiting to be written').set_function(
+            lambda: len(self._pending)
+        )
+
+    @property
+    def daily_budget(self) -> float | None:
+        return self._daily_budget
+
+    @property
+    def monthly_budget(self) -> float | None:
+        return self._monthly_budget
+
+    def record(
+        self, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int, cost: float, latency: float
+    ) -> None:
+        owner = _usage_owner.get()
+        if owner is None:
+            logger.debug(f'Completion usage of {model} outside of a session is not recorded')
+            return
+        user_id, session = owner
+        created_at = _utcnow()
+        self._pending.append(
+            {
+                'user_id': user_id,
+                'session': session,
+                'model': model,
+                'prompt_tokens': prompt_tokens,
+                'cached_tokens': cached_tokens,
+                'completion_tokens': completion_tokens,
+                'cost': cost,
+                'latency': latency,
+                'created_at': created_at,
+            }
+        )
+        usage = self._totals.get(user_id)
+        if usage is not None and usage.day == created_at.date():
+            self._totals[user_id] = UserUsage(
+                usage.day,
+                usage.today.add(prompt_tokens, cached_tokens, completion_tokens, cost),
+                usage.month.add(prompt_tokens, cached_tokens, completion_tokens, cost),
+            )
+
+        if self._flush_task is None:
+            self._flush_task = supervisor.spawn(self._flush_soon(), name='usage_flush')
+        if len(self._pending) >= self._batch_size:
+            self._flush_now.set()
+
+    async def flush(self) -> None:
+        # returns once all the records made so far are written, including the ones another flush is writing
+        async with self._writing:
+            records, self._pending = self._pending, []
+            if not records:
+                return
+            try:
+                await get_service_manager().usage.add_many(records)
+            except Exception as e:
+                logger.error(f'Error while writing {len(records)} usage records', exc_info=e)
+                _records.inc(len(records), outcome='dropped')
+                return
+            _records.inc(len(records), outcome='written')
+
+    async def close(self) -> None:
+        # the background task writes the buffer right away, the shutdown waits for it with the other tasks
+        self._flush_now.set()
+        await self.flush()
+
+    async def usage(self, user_id: int) -> UserUsage:
+        today = _utcnow().date()
+        usage = self._totals.get(user_id)
+        if usage is not None and usage.day == today:
+            return usage
+        await self.flush()
+        day_start = datetime.datetime.combine(today, datetime.time())
+        totals = await get_service_manager().usage.totals(user_id, day_start, day_start.replace(day=1))
+        usage = self._totals[user_id] = UserUsage(today, *totals)
+        return usage
+
+    async def budget(self, user_id: int) -> BudgetState:
+        if self._daily_budget is None and self._monthly_budget is None:
+            return 'ok'
+        usage = await self.usage(user_id)
+        state: BudgetState = 'ok'
+        if self._monthly_budget is not None and usage.month.cost >= self._monthly_budget:
+            state = 'exhausted'
+        elif self._daily_budget is not None and usage.today.cost >= self._daily_budget:
+            state = 'fast_path'
+        _budget_checks.inc(state=state)
+        return state
+
+    async def _flush_soon(self) -> None:
+        try:
+            await asyncio.wait_for(self._flush_now.wait(), timeout=self._flush_interval)
+        except TimeoutError:
+            pass
+        self._flush_now.clear()
+        self._flush_task = None
+        await self.flush()
+
+
+@cache
+def get_usage_accounting() -> UsageAccounting:
+    settings = get_settings()
+    return UsageAccounting(
+        batch_size=settings.usage_batch_size,
+        flush_interval=settings.usage_flush_interval,
+        daily_budget=settings.usage_daily_budget,
+        monthly_budget=settings.usage_monthly_budget,
+        max_users=settings.max_communication_proxies,
+        totals_ttl=settings.usage_totals_ttl,
+    )
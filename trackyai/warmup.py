@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from trackyai.agent import ToolSelector, get_completion_service, precompile_system_prompt_templates, tool_registry
+from trackyai.agent.tools.crud import precompile_message_templates
+from trackyai.config import get_settings
+from trackyai.db import get_service_manager
+from trackyai.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_stage_seconds = metrics.gauge('startup_stage_seconds', 'Duration of startup stages', ['stage'])
+
+# an unreachable provider must not hold the startup for the timeouts and retries of its client
+COMPLETION_SERVICE_TIMEOUT = 10
+
+
+# Stages of the startup with their offsets from the start of the timeline, reported once the bot is ready.
+class StartupTimeline:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self._clock = clock
+        self._started = clock()
+        self.stages: list[tuple[str, float, float]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = self._clock()
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - started
+            self.stages.append((name, started - self._started, elapsed))
+            _stage_seconds.set(elapsed, stage=name)
+
+    def report(self) -> str:
+        total = self._clock() - self._started
+        lines = [f'  +{offset:7.3f}s {name:<20} {elapsed:7.3f}s' for name, offset, elapsed in self.stages]
+        report = '\n'.join([f'Ready in {total:.3f}s:', *lines])
+        logger.info(report)
+        _stage_seconds.set(total, stage='total')
+        return report
+
+
+startup = StartupTimeline()
+
+
+async def warm_up() -> None:
+    # everything the first session would otherwise pay for; only the templates are required to start
+    with startup.stage('templates'):
+        count = precompile_system_prompt_templates() + precompile_message_templates()
+        logger.info(f'Precompiled {count} templates')
+
+    tools = list(tool_registry.get())
+    with startup.stage('tool_selection'):
+        ToolSelector.warm_up(tools)
+
+    with startup.stage('db_connections'):
+        try:
+            logger.info(f'Opened {await get_service_manager().warm_up()} DB connections')
+        except Exception as e:
+            logger.warning('Could not open DB connections, they are opened on demand', exc_info=e)
+
+    # builds the tool payloads of the provider and opens its connection
+    with startup.stage('completion_service'):
+        try:
+            async with asyncio.timeout(COMPLETION_SERVICE_TIMEOUT):
+                await get_completion_service(get_settings().completion_service).warm_up(tools)
+        except Exception as e:
+            logger.warning('Could not warm up the completion service', exc_info=e)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import signal
+from hmac import compare_digest
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from trackyai.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+_application_key = web.AppKey('application', Application)
+
+
+async def _receive_update(request: web.Request) -> web.Response:
+    secret_token = get_settings().webhook_secret_token
+    if secret_token and not compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ''), secret_token):
+        logger.warning(f'Rejected an update with a wrong secret token from {request.remote}')
+        return web.Response(status=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    application = request.app[_application_key]
+    update = Update.de_json(data, application.bot)
+    # telegram waits for the response before sending the next update, so updates are only queued here
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+async def _health(request: web.Request) -> web.Response:  # noqa: ARG001
+    return web.Response(text='ok')
+
+
+def make_web_app(application: Application) -> web.Application:
+    web_app = web.Application()
+    web_app[_application_key] = application
+    web_app.router.add_post(get_settings().webhook_path, _receive_update)
+    web_app.router.add_get('/healthz', _health)
+    return web_app
+
+
+async def serve_webhook(application: Application) -> None:
+    settings = get_settings()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(make_web_app(application))
+    async with application:
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, host=settings.webhook_listen, port=settings.webhook_port).start()
+        logger.info(f'Listening for updates on {settings.webhook_listen}:{settings.webhook_port}')
+        if settings.webhook_url:
+            await application.bot.set_webhook(
+                url=settings.webhook_url,
+                secret_token=settings.webhook_secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=settings.webhook_max_connections,
+            )
+        try:
+            await stop.wait()
+        finally:
+            logger.info('Stopping the webhook server...')
+            await runner.cleanup()
+            await application.stop()
+            if application.post_stop is not None:
+                await application.post_stop(application)
+    if application.post_shutdown is not None:
+        await application.post_shutdown(application)